@@ -1,7 +1,12 @@
 from django.contrib import admin
 
-from django.contrib import admin
-from .models import FitnessClass, Booking
+from django.contrib import admin, messages
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from datetime import timedelta
+from . import inventory
+from .models import ClassSeries, FitnessClass, Booking, WaitlistEntry
 
 @admin.register(FitnessClass)
 class FitnessClassAdmin(admin.ModelAdmin):
@@ -9,9 +14,45 @@ class FitnessClassAdmin(admin.ModelAdmin):
         'name', 'class_type', 'instructor_name', 
         'scheduled_datetime', 'available_slots', 'total_slots', 'is_active'
     ]
-    list_filter = ['class_type', 'is_active', 'scheduled_datetime']
+    list_filter = ['class_type', 'is_active', 'scheduled_datetime', 'series']
     search_fields = ['name', 'instructor_name']
     ordering = ['scheduled_datetime']
+    actions = ['open_for_sale', 'close_sale']
+
+    # Run in the server process, so they also work with an allowed locmem store
+    @admin.action(description="Put on sale (inventory engine)")
+    def open_for_sale(self, request, queryset):
+        try:
+            inventory.check_store()
+        except ImproperlyConfigured as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        opened = sum(inventory.open_class(fitness_class) for fitness_class in queryset)
+        self.message_user(request, f"{opened} classes on sale (inactive and started ones skipped)")
+
+    @admin.action(description="Take off sale (inventory engine)")
+    def close_sale(self, request, queryset):
+        for fitness_class in queryset:
+            inventory.close_class(fitness_class.id)
+        inventory.reconcile([fitness_class.id for fitness_class in queryset])
+        self.message_user(request, f"{queryset.count()} classes off sale")
+
+@admin.register(ClassSeries)
+class ClassSeriesAdmin(admin.ModelAdmin):
+    list_display = [
+        'name', 'class_type', 'instructor_name', 'weekdays', 'interval',
+        'start_time', 'starts_on', 'ends_on', 'materialized_until', 'is_active'
+    ]
+    list_filter = ['class_type', 'is_active']
+    search_fields = ['name', 'instructor_name']
+    readonly_fields = ['materialized_until']
+    actions = ['materialize']
+
+    @admin.action(description="Materialize the rolling window")
+    def materialize(self, request, queryset):
+        until = timezone.now() + timedelta(days=settings.SERIES_MATERIALIZE_DAYS)
+        created = sum(series.materialize(until) for series in queryset)
+        self.message_user(request, f"{created} occurrences materialized")
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -21,4 +62,10 @@ class BookingAdmin(admin.ModelAdmin):
     ]
     list_filter = ['is_cancelled', 'booking_datetime']
     search_fields = ['client_name', 'client_email', 'booking_reference']
-    readonly_fields = ['booking_reference', 'booking_datetime']
\ No newline at end of file
+    readonly_fields = ['booking_reference', 'booking_datetime']
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ['client_name', 'client_email', 'fitness_class', 'created_at']
+    search_fields = ['client_name', 'client_email']
+    readonly_fields = ['created_at']
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+Class occupancy analytics.
+
+Reports are read from ClassDailyStats, a daily rollup per studio-local day,
+class type, instructor and start hour, so a dashboard query aggregates a few
+rows per day however many bookings there are. refresh_rollups() keeps it
+current incrementally: every booking path stamps FitnessClass.updated_at,
+so only the days of classes changed since the last refresh are recomputed,
+each with two grouped queries. Days a class left (rescheduled or deleted)
+are recorded as RollupDirtyDay rows and recomputed as well.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from .models import Booking, ClassDailyStats, FitnessClass, RollupDirtyDay, RollupState
+from .timezones import DEFAULT_TIMEZONE, resolve_timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = 'class_daily_stats'
+
+# group_by value -> ClassDailyStats column
+DIMENSIONS = {
+    'date': 'date',
+    'class_type': 'class_type',
+    'instructor': 'instructor_name',
+    'weekday': 'weekday',
+    'hour': 'hour',
+}
+MEASURES = [
+    'classes', 'total_slots', 'booked_slots', 'bookings', 'cancellations',
+    'lead_time_seconds', 'lead_time_bookings',
+]
+ROLLUP_KEY = ['date', 'class_type', 'instructor_name', 'hour']
+
+# updated_at is stamped before its transaction commits, so a change committed
+# after a refresh read the classes may carry an older stamp than the
+# watermark. Changes are looked for this far before it; longer transactions
+# can still be missed until the next --full refresh.
+WATERMARK_MARGIN = timedelta(minutes=5)
+
+
+def studio_timezone():
+    return resolve_timezone(DEFAULT_TIMEZONE)
+
+
+def class_dimensions(prefix=''):
+    """Rollup key expressions for FitnessClass (or, with a prefix, a related model)"""
+    scheduled = f"{prefix}scheduled_datetime"
+    tz = studio_timezone()
+    return {
+        'date': TruncDate(scheduled, tzinfo=tz),
+        'class_type': F(f"{prefix}class_type"),
+        'instructor_name': F(f"{prefix}instructor_name"),
+        'weekday': ExtractIsoWeekDay(scheduled, tzinfo=tz),
+        'hour': ExtractHour(scheduled, tzinfo=tz),
+    }
+
+
+def dirty_days(since):
+    """Studio-local days with classes changed after `since` (all days if None)"""
+    classes = FitnessClass.objects.all()
+    if since is not None:
+        classes = classes.filter(updated_at__gt=since)
+    return set(
+        classes.annotate(day=class_dimensions()['date']).values_list('day', flat=True).distinct()
+    )
+
+
+def compute_days(days):
+    """Build (unsaved) ClassDailyStats rows for the given days"""
+    # Prefixed, annotations may not shadow model fields
+    dimensions = {f"stat_{name}": value for name, value in class_dimensions().items()}
+    class_groups = FitnessClass.objects.filter(is_active=True).annotate(
+        **dimensions
+    ).filter(stat_date__in=days).values(*dimensions).annotate(
+        classes=Count('id'),
+        total_slots_sum=Sum('total_slots'),
+        booked_slots=Sum(F('total_slots') - F('available_slots'))
+    ).order_by()
+
+    booking_dimensions = {
+        f"stat_{name}": value for name, value in class_dimensions('fitness_class__').items()
+    }
+    lead_time = ExpressionWrapper(
+        F('fitness_class__scheduled_datetime') - F('booking_datetime'),
+        output_field=DurationField()
+    )
+    booking_groups = Booking.objects.filter(fitness_class__is_active=True).annotate(
+        **booking_dimensions
+    ).filter(stat_date__in=days).values(*booking_dimensions).annotate(
+        bookings=Count('id'),
+        cancellations=Count('id', filter=Q(is_cancelled=True)),
+        lead_time=Sum(lead_time, filter=Q(is_cancelled=False)),
+        lead_time_bookings=Count('id', filter=Q(is_cancelled=False))
+    ).order_by()
+
+    rows = {}
+    for group in class_groups:
+        key = tuple(group[f"stat_{name}"] for name in ROLLUP_KEY)
+        rows[key] = ClassDailyStats(
+            date=group['stat_date'],
+            class_type=group['stat_class_type'],
+            instructor_name=group['stat_instructor_name'],
+            weekday=group['stat_weekday'],
+            hour=group['stat_hour'],
+            classes=group['classes'],
+            total_slots=group['total_slots_sum'],
+            booked_slots=group['booked_slots']
+        )
+    for group in booking_groups:
+        row = rows.get(tuple(group[f"stat_{name}"] for name in ROLLUP_KEY))
+        if row is None:
+            continue
+        row.bookings = group['bookings']
+        row.cancellations = group['cancellations']
+        row.lead_time_bookings = group['lead_time_bookings']
+        if group['lead_time'] is not None:
+            row.lead_time_seconds = group['lead_time'].total_seconds()
+    return list(rows.values())
+
+
+def refresh_rollups(full=False):
+    """
+    Recompute the rollup for the days that changed since the last refresh
+    (every day with full=True). Returns the number of days recomputed.
+    """
+    # Taken before reading, so changes made during the refresh are picked up next time
+    started = timezone.now()
+    state = RollupState.objects.filter(name=ROLLUP_NAME).first()
+    since = None if full or state is None else state.refreshed_at - WATERMARK_MARGIN
+
+    marked = dict(RollupDirtyDay.objects.values_list('id', 'date'))
+    days = dirty_days(since) | set(marked.values())
+    with transaction.atomic():
+        if full:
+            ClassDailyStats.objects.all().delete()
+        else:
+            ClassDailyStats.objects.filter(date__in=days).delete()
+        ClassDailyStats.objects.bulk_create(compute_days(days), batch_size=1000)
+        # Only the marks read above, later ones wait for the next refresh
+        RollupDirtyDay.objects.filter(id__in=marked).delete()
+        RollupState.objects.update_or_create(
+            name=ROLLUP_NAME, defaults={'refreshed_at': started}
+        )
+
+    logger.info("Analytics rollup refreshed %d days", len(days))
+    return len(days)
+
+
+def last_refreshed():
+    state = RollupState.objects.filter(name=ROLLUP_NAME).first()
+    return state.refreshed_at if state else None
+
+
+def parse_day(value, param):
+    day = parse_date(value)
+    if day is None:
+        raise ValidationError({param: 'Use an ISO 8601 date'})
+    return day
+
+
+def occupancy_report(params):
+    """
+    Aggregate the rollup. params: group_by (comma separated DIMENSIONS,
+    default class_type), date_from and date_to (studio-local days, inclusive).
+    """
+    group_by = [name.strip() for name in (params.get('group_by') or 'class_type').split(',')]
+    unknown = [name for name in group_by if name not in DIMENSIONS]
+    if unknown:
+        raise ValidationError({
+            'group_by': f"Unknown {', '.join(unknown)}; use {', '.join(DIMENSIONS)}"
+        })
+
+    stats = ClassDailyStats.objects.all()
+    if params.get('date_from'):
+        stats = stats.filter(date__gte=parse_day(params['date_from'], 'date_from'))
+    if params.get('date_to'):
+        stats = stats.filter(date__lte=parse_day(params['date_to'], 'date_to'))
+
+    columns = [DIMENSIONS[name] for name in group_by]
+    groups = stats.values(*columns).annotate(
+        **{f"{measure}_sum": Sum(measure) for measure in MEASURES}
+    ).order_by(*columns)
+
+    report = []
+    for group in groups:
+        totals = {measure: group[f"{measure}_sum"] for measure in MEASURES}
+        row = {name: group[DIMENSIONS[name]] for name in group_by}
+        row.update({
+            'classes': totals['classes'],
+            'total_slots': totals['total_slots'],
+            'booked_slots': totals['booked_slots'],
+            'fill_rate': ratio(totals['booked_slots'], totals['total_slots']),
+            'bookings': totals['bookings'],
+            'cancellations': totals['cancellations'],
+            'cancellation_rate': ratio(totals['cancellations'], totals['bookings']),
+            'avg_lead_time_hours': (
+                round(totals['lead_time_seconds'] / totals['lead_time_bookings'] / 3600, 2)
+                if totals['lead_time_bookings'] else None
+            ),
+        })
+        if 'date' in row:
+            row['date'] = row['date'].isoformat()
+        report.append(row)
+    return report
+
+
+def ratio(part, whole):
+    return round(part / whole, 4) if whole else None
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from .instrumentation import install_query_recorder
+        from .inventory import class_deleted, class_saved
+        from .models import FitnessClass, mark_deleted_class_day
+        connection_created.connect(install_query_recorder)
+        post_delete.connect(mark_deleted_class_day, sender=FitnessClass)
+        post_save.connect(class_saved, sender=FitnessClass)
+        post_delete.connect(class_deleted, sender=FitnessClass)
@@ -0,0 +1,208 @@
+"""
+Native async versions of the read endpoints, for serving under ASGI
+(enable with API_ASYNC_VIEWS). They keep the exact response contract of
+their counterparts in views.py and use the fastpath builders, which need
+no database access once the rows are fetched.
+"""
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from .cache import acache_listing, aget_cached_listing, alisting_cache_key
+from .events import aread_slots, format_event, get_broker, is_stale
+from .fastpath import (
+    CLASS_FIELDS, USER_BOOKING_FIELDS, FastJSONResponse, class_rows, user_booking_rows
+)
+from .filters import filter_classes
+from .instrumentation import timed_serialization
+from .models import FitnessClass, UserBooking
+from .pagination import KeysetPagination, UserBookingPagination
+from .series import apaginate_classes
+from .timezones import get_request_timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+@require_GET
+async def get_classes(request):
+    """
+    GET /api/classes (async)
+    Same query params and response as views.get_classes
+    """
+    try:
+        cache_key = await alisting_cache_key(request)
+        entry = await aget_cached_listing(cache_key)
+
+        if entry is None:
+            classes = FitnessClass.objects.filter(
+                scheduled_datetime__gt=timezone.now(),
+                is_active=True
+            )
+            classes = filter_classes(classes, request.GET)
+
+            paginator = KeysetPagination()
+            page = await apaginate_classes(
+                paginator, classes.values(*CLASS_FIELDS), request, fields=CLASS_FIELDS
+            )
+            with timed_serialization():
+                data = class_rows(page, get_request_timezone({'request': request}))
+
+            entry = await acache_listing(cache_key, {
+                'success': True,
+                'data': data,
+                'count': len(data),
+                'next_cursor': paginator.next_cursor
+            })
+
+        response = FastJSONResponse(entry['body'], headers={
+            'ETag': entry['etag'],
+            'Last-Modified': http_date(entry['last_modified']),
+        })
+        patch_vary_headers(response, ['X-Timezone'])
+        return get_conditional_response(
+            request,
+            etag=entry['etag'],
+            last_modified=entry['last_modified'],
+            response=response
+        )
+
+    except ValidationError as e:
+        return FastJSONResponse({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        logger.exception("Error fetching classes: %s", e)
+        return FastJSONResponse({
+            'success': False,
+            'error': 'Something went wrong while fetching classes'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@require_GET
+async def get_user_bookings(request):
+    """
+    GET /api/bookings?email=user@example.com (async)
+    Same response as views.get_user_bookings
+    """
+    try:
+        email = request.GET.get('email')
+
+        if not email:
+            return FastJSONResponse({
+                'success': False,
+                'error': 'Email parameter is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = UserBookingPagination()
+        rows = await paginator.apaginate_queryset(
+            UserBooking.objects.filter(client_email=email.lower()).values(*USER_BOOKING_FIELDS),
+            request
+        )
+
+        if not rows and not request.GET.get('cursor'):
+            return FastJSONResponse({
+                'success': True,
+                'message': 'No bookings found for this email',
+                'data': []
+            })
+
+        with timed_serialization():
+            data = user_booking_rows(rows)
+        return FastJSONResponse({
+            'success': True,
+            'data': data,
+            'count': len(data),
+            'next_cursor': paginator.next_cursor
+        })
+
+    except ValidationError as e:
+        return FastJSONResponse({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        logger.exception("Error fetching user bookings: %s", e)
+        return FastJSONResponse({
+            'success': False,
+            'error': 'Failed to fetch bookings'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def parse_class_ids(value):
+    try:
+        class_ids = {int(class_id) for class_id in value.split(',') if class_id.strip()}
+    except ValueError:
+        raise ValidationError({'ids': 'Use comma separated class ids'})
+    if not class_ids:
+        raise ValidationError({'ids': 'This parameter is required'})
+    if len(class_ids) > settings.EVENTS_MAX_CLASSES:
+        raise ValidationError({'ids': f"At most {settings.EVENTS_MAX_CLASSES} classes per stream"})
+    return class_ids
+
+
+async def slots_snapshot(class_ids, versions):
+    """A snapshot event per class with its current available_slots and version"""
+    events = await aread_slots(class_ids)
+    versions.clear()
+    for event in events:
+        is_stale(event, versions)
+    return ''.join(format_event('snapshot', event) for event in events)
+
+
+async def slot_events(class_ids):
+    # Subscribed before the snapshot is read so no change is missed. A change
+    # committed in between is also queued: its version is not newer than the
+    # snapshot's, so it is dropped instead of sent twice.
+    subscription = get_broker().subscribe(class_ids)
+    versions = {}
+    try:
+        yield await slots_snapshot(class_ids, versions)
+        while True:
+            event = await subscription.get(settings.EVENTS_KEEPALIVE)
+            if subscription.overflowed:
+                # Too slow to keep up: drop the backlog and start over from a snapshot
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.overflowed = False
+                yield await slots_snapshot(class_ids, versions)
+            elif event is None:
+                yield ': keepalive\n\n'
+            elif not is_stale(event, versions):
+                yield format_event('slots', event)
+    finally:
+        subscription.close()
+
+@require_GET
+async def stream_slots(request):
+    """
+    GET /api/classes/stream?ids=1,2,3 (server-sent events, ASGI only)
+    Sends a snapshot event with each class's available_slots, then a slots
+    event {class_id, available_slots, version} whenever a booking or
+    cancellation changes them
+    """
+    if not isinstance(request, ASGIRequest):
+        return FastJSONResponse({
+            'success': False,
+            'error': 'Live updates need the ASGI server'
+        }, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    try:
+        class_ids = parse_class_ids(request.GET.get('ids', ''))
+    except ValidationError as e:
+        return FastJSONResponse({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return StreamingHttpResponse(
+        slot_events(class_ids),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,122 @@
+"""
+Read-through cache for the class schedule listing.
+Pages are keyed by a schedule version, so one bump invalidates all of them.
+The a-prefixed functions are the async views' versions, so a shared backend
+(file, Redis) is never read on the event loop.
+"""
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+SCHEDULE_VERSION_KEY = 'schedule:version'
+SCHEDULE_MODIFIED_KEY = 'schedule:modified'
+
+
+def get_schedule_cache():
+    return caches[settings.SCHEDULE_CACHE_ALIAS]
+
+
+def get_schedule_version():
+    """Return the current schedule version, initialising it if missing"""
+    cache = get_schedule_cache()
+    version = cache.get(SCHEDULE_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a version lost to eviction is never reused
+        cache.add(SCHEDULE_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        cache.add(SCHEDULE_MODIFIED_KEY, int(time.time()), timeout=None)
+        version = cache.get(SCHEDULE_VERSION_KEY)
+    return version
+
+
+async def aget_schedule_version():
+    cache = get_schedule_cache()
+    version = await cache.aget(SCHEDULE_VERSION_KEY)
+    if version is None:
+        await cache.aadd(SCHEDULE_VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        await cache.aadd(SCHEDULE_MODIFIED_KEY, int(time.time()), timeout=None)
+        version = await cache.aget(SCHEDULE_VERSION_KEY)
+    return version
+
+
+def _bump():
+    cache = get_schedule_cache()
+    try:
+        cache.incr(SCHEDULE_VERSION_KEY)
+    except ValueError:
+        get_schedule_version()
+    cache.set(SCHEDULE_MODIFIED_KEY, int(time.time()), timeout=None)
+
+
+def bump_schedule_version():
+    """
+    Invalidate every cached schedule page.
+
+    Inside a transaction the version is bumped again on commit, so a reader
+    that cached the pre-commit state in between is invalidated as well.
+    """
+    _bump()
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        transaction.on_commit(_bump)
+
+
+def get_schedule_modified():
+    get_schedule_version()
+    return get_schedule_cache().get(SCHEDULE_MODIFIED_KEY) or int(time.time())
+
+
+async def aget_schedule_modified():
+    await aget_schedule_version()
+    return await get_schedule_cache().aget(SCHEDULE_MODIFIED_KEY) or int(time.time())
+
+
+def listing_digest(request):
+    params = sorted(getattr(request, 'query_params', request.GET).lists())
+    user_timezone = request.META.get('HTTP_X_TIMEZONE', '')
+    return hashlib.md5(
+        json.dumps([params, user_timezone]).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+def listing_cache_key(request):
+    """Cache key for a listing request: version + query params + timezone"""
+    return f"schedule:list:{get_schedule_version()}:{listing_digest(request)}"
+
+
+async def alisting_cache_key(request):
+    return f"schedule:list:{await aget_schedule_version()}:{listing_digest(request)}"
+
+
+def get_cached_listing(key):
+    return get_schedule_cache().get(key)
+
+
+async def aget_cached_listing(key):
+    return await get_schedule_cache().aget(key)
+
+
+def listing_entry(body, last_modified):
+    """A rendered listing body with its validators"""
+    payload = json.dumps(body, cls=DjangoJSONEncoder, sort_keys=True)
+    return {
+        'body': body,
+        'etag': '"%s"' % hashlib.md5(payload.encode(), usedforsecurity=False).hexdigest(),
+        'last_modified': last_modified,
+    }
+
+
+def cache_listing(key, body):
+    """Store a rendered listing body with its validators and return the entry"""
+    entry = listing_entry(body, get_schedule_modified())
+    get_schedule_cache().set(key, entry, timeout=settings.SCHEDULE_CACHE_TIMEOUT)
+    return entry
+
+
+async def acache_listing(key, body):
+    entry = listing_entry(body, await aget_schedule_modified())
+    await get_schedule_cache().aset(key, entry, timeout=settings.SCHEDULE_CACHE_TIMEOUT)
+    return entry
@@ -0,0 +1,234 @@
+"""
+Live slot availability for GET /api/classes/stream/ (server-sent events).
+
+Write paths publish a class's slot count once their transaction commits;
+the broker fans it out to the subscribers of that class. Events carry the
+absolute count read after the commit and the class's slots_version, so a
+stream drops what its snapshot already covers and a client never drifts. Each subscriber is
+an asyncio queue on the event loop serving its stream, so an idle one costs
+a queue and a suspended coroutine, not a thread.
+
+LocalBroker delivers within the process. With several server processes use
+RedisBroker (EVENTS_BROKER), which publishes through Redis pub/sub and
+delivers to each process's local subscribers. Any class with publish() and
+subscribe() can be plugged in, and set_broker() swaps it out in tests; an
+optional has_subscribers(class_id) lets publishers skip reading the count
+when nobody listens.
+"""
+import asyncio
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+from .models import FitnessClass
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One stream's queue of events for a set of classes"""
+
+    def __init__(self, broker, class_ids):
+        self.broker = broker
+        self.class_ids = set(class_ids)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        # Set when events were dropped for a slow client, which then needs a fresh snapshot
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Runs on the subscriber's event loop"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """The next event, or None after `timeout` seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process fan-out; publish() may be called from any thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, class_ids):
+        """Must be called on the event loop that will read the subscription"""
+        subscription = Subscription(self, class_ids)
+        with self.lock:
+            for class_id in subscription.class_ids:
+                self.subscribers.setdefault(class_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for class_id in subscription.class_ids:
+                subscribers = self.subscribers.get(class_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[class_id]
+
+    def publish(self, event):
+        self.dispatch(event)
+
+    def dispatch(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(event['class_id'], ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Its event loop is gone
+                self.unsubscribe(subscription)
+
+    def has_subscribers(self, class_id):
+        with self.lock:
+            return class_id in self.subscribers
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(set().union(*self.subscribers.values()))
+
+
+class RedisBroker(LocalBroker):
+    """Publishes through Redis pub/sub (EVENTS_REDIS_URL), so every process sees every event"""
+    channel = 'booking:slots'
+
+    def __init__(self):
+        # Imported here, so processes on LocalBroker never load the client
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisBroker needs the redis package")
+        super().__init__()
+        self.client = redis.Redis.from_url(settings.EVENTS_REDIS_URL)
+        self.start_lock = threading.Lock()
+        self.listener = None
+
+    def publish(self, event):
+        self.client.publish(self.channel, json.dumps(event))
+
+    def subscribe(self, class_ids):
+        self.start()
+        return super().subscribe(class_ids)
+
+    def has_subscribers(self, class_id):
+        # Streams may be served by any process: any listener on the channel counts
+        return self.client.pubsub_numsub(self.channel)[0][1] > 0
+
+    def start(self):
+        with self.start_lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name='events-listener', daemon=True)
+                self.listener.start()
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self.dispatch(json.loads(message['data']))
+            except Exception as e:
+                logger.exception("Event listener error: %s", e)
+                time.sleep(1)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.EVENTS_BROKER)()
+    return _broker
+
+
+def set_broker(broker):
+    """Replace the broker (e.g. with a stub), returns the previous one"""
+    global _broker
+    previous, _broker = _broker, broker
+    return previous
+
+
+SLOT_FIELDS = ('id', 'available_slots', 'slots_version')
+
+
+def slot_event(row, on_sale):
+    """Event data for a class; classes on sale are ahead of the database in the store, and unversioned"""
+    if on_sale is not None:
+        return {'class_id': row['id'], 'available_slots': max(on_sale, 0), 'version': None}
+    return {'class_id': row['id'], 'available_slots': row['available_slots'], 'version': row['slots_version']}
+
+
+def get_slot_store():
+    # Imported here, inventory publishes through this module
+    from .inventory import get_store
+    return get_store() if settings.INVENTORY_ENGINE else None
+
+
+def read_slots(class_ids):
+    """The current slot event of each class"""
+    store = get_slot_store()
+    return [
+        slot_event(row, store.available(row['id']) if store is not None else None)
+        for row in FitnessClass.objects.filter(id__in=class_ids).values(*SLOT_FIELDS)
+    ]
+
+
+async def aread_slots(class_ids):
+    store = get_slot_store()
+    return [
+        slot_event(row, await store.aavailable(row['id']) if store is not None else None)
+        async for row in FitnessClass.objects.filter(id__in=class_ids).values(*SLOT_FIELDS)
+    ]
+
+
+def is_stale(event, versions):
+    """
+    True if a stream already sent this class's state at this version or a
+    later one; otherwise records the version in `versions`
+    """
+    version, sent = event['version'], versions.get(event['class_id'])
+    if version is not None and sent is not None and version <= sent:
+        return True
+    versions[event['class_id']] = version
+    return False
+
+
+def publish_slots(class_id):
+    """Announce a change of a class's available slots once the transaction commits"""
+
+    def publish():
+        try:
+            broker = get_broker()
+            # Nobody streams this class: skip the read
+            has_subscribers = getattr(broker, 'has_subscribers', None)
+            if has_subscribers is not None and not has_subscribers(class_id):
+                return
+            # Read after the commit, so the event includes this change
+            for event in read_slots([class_id]):
+                broker.publish(event)
+        except Exception as e:
+            # Streams are best effort, the booking itself went through
+            logger.exception("Could not publish slot event: %s", e)
+
+    transaction.on_commit(publish)
+
+
+def format_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
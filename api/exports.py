@@ -0,0 +1,102 @@
+import csv
+import json
+from rest_framework.exceptions import ValidationError
+from .filters import FALSE_VALUES, TRUE_VALUES, parse_boundary
+from .models import FitnessClass, Booking
+
+EXPORT_FORMATS = ['ndjson', 'csv']
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+DEFAULT_CHUNK_SIZE = 2000
+
+EXPORTS = {
+    'bookings': {
+        'queryset': lambda: Booking.objects.all(),
+        'date_field': 'booking_datetime',
+        # column name -> ORM lookup
+        'fields': {
+            'booking_reference': 'booking_reference',
+            'client_name': 'client_name',
+            'client_email': 'client_email',
+            'class_id': 'fitness_class_id',
+            'class_name': 'fitness_class__name',
+            'class_datetime': 'fitness_class__scheduled_datetime',
+            'booking_datetime': 'booking_datetime',
+            'is_cancelled': 'is_cancelled',
+        },
+    },
+    'classes': {
+        'queryset': lambda: FitnessClass.objects.all(),
+        'date_field': 'scheduled_datetime',
+        'fields': {
+            field: field for field in [
+                'id', 'name', 'class_type', 'instructor_name', 'scheduled_datetime',
+                'duration_minutes', 'total_slots', 'available_slots', 'is_active'
+            ]
+        },
+    },
+}
+
+
+def export_queryset(kind, params):
+    """
+    Build the values_list queryset for an export.
+    params: date_from, date_to and (bookings only) is_cancelled
+    """
+    export = EXPORTS[kind]
+    queryset = export['queryset']()
+    date_field = export['date_field']
+
+    if params.get('date_from'):
+        queryset = queryset.filter(**{
+            f"{date_field}__gte": parse_boundary(params['date_from'], 'date_from')
+        })
+    if params.get('date_to'):
+        queryset = queryset.filter(**{
+            f"{date_field}__lte": parse_boundary(params['date_to'], 'date_to', end_of_day=True)
+        })
+
+    is_cancelled = params.get('is_cancelled')
+    if kind == 'bookings' and is_cancelled:
+        if is_cancelled.lower() in TRUE_VALUES:
+            queryset = queryset.filter(is_cancelled=True)
+        elif is_cancelled.lower() in FALSE_VALUES:
+            queryset = queryset.filter(is_cancelled=False)
+        else:
+            raise ValidationError({'is_cancelled': 'Use true or false'})
+
+    # Primary key order walks the table once, in index order
+    return queryset.order_by('pk').values_list(*export['fields'].values())
+
+
+def _format_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each row instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def iter_export(kind, queryset, output_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the export line by line. The queryset is read with iterator() so
+    memory stays constant whatever the number of rows.
+    """
+    fields = list(EXPORTS[kind]['fields'])
+    rows = queryset.iterator(chunk_size=chunk_size)
+
+    if output_format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([_format_value(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(
+                dict(zip(fields, (_format_value(value) for value in row)))
+            ) + '\n'
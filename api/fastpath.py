@@ -0,0 +1,112 @@
+"""
+Opt-in serialization fast path for the list endpoints (API_FAST_SERIALIZATION).
+
+Rows are pulled with .values() for exactly the serializer fields and turned
+into dicts by hand, skipping DRF's per-field machinery. The output must stay
+byte-for-byte identical to FitnessClassSerializer / BookingSerializer rendered
+by JSONRenderer; ListingContractTest in api/tests.py diffs both paths.
+"""
+import json
+from django.http import HttpResponse
+from django.utils import timezone
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib encoder gives the same bytes
+    orjson = None
+
+CLASS_FIELDS = [
+    'id', 'name', 'class_type', 'instructor_name', 'scheduled_datetime',
+    'duration_minutes', 'total_slots', 'available_slots', 'series_id'
+]
+BOOKING_FIELDS = [
+    'booking_reference', 'fitness_class__name', 'fitness_class__scheduled_datetime',
+    'fitness_class__instructor_name', 'client_name', 'booking_datetime'
+]
+
+# UserBooking read model columns, in UserBookingPagination key order first
+USER_BOOKING_FIELDS = [
+    'booking_id', 'booking_datetime', 'booking_reference', 'class_name',
+    'class_datetime', 'instructor', 'client_name'
+]
+
+
+def format_datetime(value):
+    """Same output as DRF's DateTimeField with the default ISO 8601 format"""
+    if value is None:
+        return None
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def class_rows(rows, tz):
+    """Build FitnessClassSerializer-shaped dicts from .values(*CLASS_FIELDS) rows"""
+    data = []
+    for row in rows:
+        scheduled = row['scheduled_datetime']
+        local = scheduled.astimezone(tz) if tz is not None else scheduled
+        data.append({
+            'id': row['id'],
+            'name': row['name'],
+            'class_type': row['class_type'],
+            'instructor_name': row['instructor_name'],
+            'scheduled_datetime': format_datetime(scheduled),
+            'scheduled_datetime_local': local.isoformat(),
+            'duration_minutes': row['duration_minutes'],
+            'total_slots': row['total_slots'],
+            'available_slots': row['available_slots'],
+            'series_id': row['series_id'],
+        })
+    return data
+
+
+def booking_rows(rows):
+    """Build BookingSerializer-shaped dicts from .values(*BOOKING_FIELDS) rows"""
+    return [
+        {
+            'booking_reference': row['booking_reference'],
+            'class_name': row['fitness_class__name'],
+            'class_datetime': format_datetime(row['fitness_class__scheduled_datetime']),
+            'instructor': row['fitness_class__instructor_name'],
+            'client_name': row['client_name'],
+            'booking_datetime': format_datetime(row['booking_datetime']),
+        }
+        for row in rows
+    ]
+
+
+def user_booking_rows(rows):
+    """BookingSerializer-shaped dicts from .values(*USER_BOOKING_FIELDS) rows"""
+    return [
+        {
+            'booking_reference': row['booking_reference'],
+            'class_name': row['class_name'],
+            'class_datetime': format_datetime(row['class_datetime']),
+            'instructor': row['instructor'],
+            'client_name': row['client_name'],
+            'booking_datetime': format_datetime(row['booking_datetime']),
+        }
+        for row in rows
+    ]
+
+
+def render_json(data):
+    """Encode like rest_framework.renderers.JSONRenderer with default settings"""
+    if orjson is not None:
+        content = orjson.dumps(data)
+    else:
+        content = json.dumps(
+            data, ensure_ascii=False, allow_nan=False, separators=(',', ':')
+        ).encode()
+    # JSONRenderer escapes these for compatibility with JavaScript
+    return content.replace(
+        '\u2028'.encode(), b'\\u2028'
+    ).replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(render_json(data), **kwargs)
@@ -0,0 +1,64 @@
+from datetime import datetime, time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from .models import FitnessClass
+
+TRUE_VALUES = {'1', 'true', 'yes'}
+FALSE_VALUES = {'0', 'false', 'no'}
+
+
+def parse_boundary(value, param, end_of_day=False):
+    """Parse an ISO date or datetime query param into an aware datetime"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({param: 'Use an ISO 8601 date or datetime'})
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_classes(queryset, params):
+    """
+    Apply the listing filters from query params:
+    date_from, date_to, class_type, instructor and has_slots
+    """
+    date_from = params.get('date_from')
+    if date_from:
+        queryset = queryset.filter(
+            scheduled_datetime__gte=parse_boundary(date_from, 'date_from')
+        )
+
+    date_to = params.get('date_to')
+    if date_to:
+        queryset = queryset.filter(
+            scheduled_datetime__lte=parse_boundary(date_to, 'date_to', end_of_day=True)
+        )
+
+    class_type = params.get('class_type')
+    if class_type:
+        valid_types = dict(FitnessClass.CLASS_TYPES)
+        if class_type not in valid_types:
+            raise ValidationError({
+                'class_type': f"Choose one of: {', '.join(valid_types)}"
+            })
+        queryset = queryset.filter(class_type=class_type)
+
+    instructor = params.get('instructor')
+    if instructor:
+        queryset = queryset.filter(instructor_name__iexact=instructor)
+
+    has_slots = params.get('has_slots')
+    if has_slots:
+        has_slots = has_slots.lower()
+        if has_slots in TRUE_VALUES:
+            queryset = queryset.filter(available_slots__gt=0)
+        elif has_slots in FALSE_VALUES:
+            queryset = queryset.filter(available_slots=0)
+        else:
+            raise ValidationError({'has_slots': 'Use true or false'})
+
+    return queryset
@@ -0,0 +1,71 @@
+"""
+Idempotency-Key support for POST /api/book/.
+
+The first request with a key claims it in the cache; when it finishes its
+response is stored under the key and any retry with the same key gets that
+response back without touching the database. A retry that arrives while the
+first request is still running gets 409, reusing a key for a different
+body gets 422.
+"""
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+MAX_KEY_LENGTH = 255
+# Outcomes worth replaying; anything else (5xx) releases the key for a retry
+STORED_STATUSES = {status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST}
+
+
+class RequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed'
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used with a different request'
+
+
+class IdempotentRequest:
+    def __init__(self, scope, key, data):
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({'Idempotency-Key': f"At most {MAX_KEY_LENGTH} characters"})
+        self.cache = caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+        self.cache_key = f"idempotency:{scope}:{hashlib.sha256(key.encode()).hexdigest()}"
+        self.fingerprint = hashlib.sha256(
+            json.dumps(data, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def begin(self):
+        """
+        Claim the key. Returns the stored (status, body) to replay, or None
+        when this request should be processed.
+        """
+        pending = {'fingerprint': self.fingerprint, 'status': None}
+        if self.cache.add(self.cache_key, pending, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return None
+
+        record = self.cache.get(self.cache_key)
+        if record is None:
+            # Expired in between, try once more
+            return None if self.cache.add(
+                self.cache_key, pending, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT
+            ) else self.begin()
+        if record['fingerprint'] != self.fingerprint:
+            raise KeyReused()
+        if record['status'] is None:
+            raise RequestInProgress()
+        return record['status'], record['body']
+
+    def finish(self, status_code, body):
+        if status_code in STORED_STATUSES:
+            self.cache.set(self.cache_key, {
+                'fingerprint': self.fingerprint,
+                'status': status_code,
+                'body': body,
+            }, timeout=settings.IDEMPOTENCY_TTL)
+        else:
+            self.cache.delete(self.cache_key)
@@ -0,0 +1,208 @@
+"""
+Per-request performance instrumentation.
+
+PerformanceMiddleware records wall time, DB query count and time, serializer
+time and response size for a sample of requests (PERF_SAMPLE_RATE). Each
+sampled response gets a Server-Timing header, and the numbers go into
+in-process histograms served in Prometheus text format by the metrics view.
+Unsampled requests only pay for one random() call.
+"""
+import contextvars
+import random
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+METRICS = {
+    'booking_request_duration_seconds': ('Wall time per request', DURATION_BUCKETS),
+    'booking_db_queries': ('Database queries per request', QUERY_BUCKETS),
+    'booking_db_duration_seconds': ('Time spent in the database per request', DURATION_BUCKETS),
+    'booking_serialize_duration_seconds': ('Time spent serializing per request', DURATION_BUCKETS),
+    'booking_response_bytes': ('Response body size', SIZE_BUCKETS),
+}
+
+_current = contextvars.ContextVar('booking_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serialize_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; counts only while a request is sampled"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver, see ApiConfig.ready()"""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+@contextmanager
+def timed_serialization():
+    """Add the time spent in the block to the current request's serializer time"""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_time += perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Histograms per (metric, view), shared by all threads of the process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.requests = {}
+
+    def observe(self, view, status_code, values):
+        with self.lock:
+            key = (view, str(status_code))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for metric, value in values.items():
+                histogram = self.histograms.get((metric, view))
+                if histogram is None:
+                    histogram = self.histograms[(metric, view)] = Histogram(METRICS[metric][1])
+                histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.requests.clear()
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self.lock:
+            lines = [
+                '# HELP booking_requests_total Sampled requests by view and status',
+                '# TYPE booking_requests_total counter',
+            ]
+            for (view, code), count in sorted(self.requests.items()):
+                lines.append(f'booking_requests_total{{view="{view}",status="{code}"}} {count}')
+
+            for metric, (help_text, buckets) in METRICS.items():
+                lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+                for (name, view), histogram in sorted(self.histograms.items()):
+                    if name != metric:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{view="{view}"}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class PerformanceMiddleware:
+    """Works for both sync and async stacks, so it never forces a thread hop"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, perf_counter() - started)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, perf_counter() - started)
+
+    def sampled(self):
+        rate = settings.PERF_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def finish(self, request, response, stats, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name or match.view_name if match else 'unmatched'
+        values = {
+            'booking_request_duration_seconds': elapsed,
+            'booking_db_queries': stats.queries,
+            'booking_db_duration_seconds': stats.db_time,
+            'booking_serialize_duration_seconds': stats.serialize_time,
+        }
+        if not response.streaming:
+            values['booking_response_bytes'] = len(response.content)
+        registry.observe(view, response.status_code, values)
+
+        response['Server-Timing'] = ', '.join([
+            f'app;dur={elapsed * 1000:.2f}',
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+            f'ser;dur={stats.serialize_time * 1000:.2f}',
+        ])
+        return response
+
+
+def metrics(request):
+    """
+    GET /api/metrics
+    Histograms of this process in Prometheus text format, for local scrapers only
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,601 @@
+"""
+Optional in-memory slot inventory for flash sales (INVENTORY_ENGINE).
+
+Hot classes are put on sale explicitly (``manage.py inventory open``). From
+then on POST /api/book/ reserves seats against an atomic counter in the
+inventory cache and answers without touching the database; sold-out classes
+and duplicate clients are rejected from the store alone. Granted
+reservations are queued and persisted by a background writer with one bulk
+insert and one slot UPDATE per class per batch, instead of one contended
+row update per booking.
+
+Reservations get the same checks as database bookings: the class must be
+active and not started (saving a class updates or closes its sale), and
+must not overlap the client's other classes. Those live in the database or,
+while a reservation is unwritten, as holder markers of the classes on sale.
+client_lock() serializes a client's bookings across both paths.
+
+The store counter holds the seats not yet promised to anyone, the
+FitnessClass.available_slots column the seats not yet persisted. Every other
+write path (bulk bookings, cancellations, waitlist promotions) moves both,
+and reconcile() brings the column back in line with the confirmed bookings.
+
+The store needs atomic incr/decr/add and must outlive the workers: classes
+only go on sale with Redis (eviction disabled, AOF persistence on), unless
+INVENTORY_ALLOW_LOCAL_STORE allows the process-local locmem stand-in.
+Every granted reservation is also kept in the store until it is written, so
+reservations of a worker that died before its writer flushed are persisted
+by replay(): when a writer starts, or with `manage.py inventory replay`.
+"""
+import atexit
+import queue
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from .cache import bump_schedule_version
+from .events import publish_slots
+from .models import (
+    REFERENCE_ATTEMPTS, FitnessClass, Booking, UserBooking,
+    is_duplicate_booking, is_reference_collision
+)
+from .references import generate_booking_reference
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Store keys outlive the class a little, then clean themselves up
+KEY_GRACE = timedelta(hours=1)
+
+# Classes on sale: {class_id: (name, start, end)}
+ON_SALE_KEY = 'inventory:on_sale'
+
+# A lock outlives the longest booking transaction; waiters give up after LOCK_WAIT
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 1
+
+
+class InventoryStore:
+    """Seat counters, class snapshots and holder markers in a cache"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def key(self, class_id, part):
+        return f"inventory:{class_id}:{part}"
+
+    def open(self, fitness_class, emails):
+        timeout = self.timeout(fitness_class.scheduled_datetime)
+        # Kept across close and reopen, so pending reservations stay numbered
+        self.cache.add(self.key(fitness_class.id, 'seq'), 0, timeout=timeout)
+        self.cache.set_many({
+            self.key(fitness_class.id, 'slots'): fitness_class.available_slots,
+            **{self.key(fitness_class.id, f"holder:{email}"): 1 for email in emails},
+        }, timeout=timeout)
+        self.describe(fitness_class)
+
+    def describe(self, fitness_class):
+        """Store the class details reservations are checked against"""
+        self.cache.set(self.key(fitness_class.id, 'class'), {
+            'name': fitness_class.name,
+            'instructor_name': fitness_class.instructor_name,
+            'scheduled_datetime': fitness_class.scheduled_datetime,
+            'duration_minutes': fitness_class.duration_minutes,
+        }, timeout=self.timeout(fitness_class.scheduled_datetime))
+        self.set_on_sale(fitness_class.id, (
+            fitness_class.name, fitness_class.scheduled_datetime, fitness_class.end_datetime
+        ))
+
+    def close(self, class_id):
+        self.cache.delete_many([self.key(class_id, 'slots'), self.key(class_id, 'class')])
+        self.set_on_sale(class_id, None)
+
+    def on_sale(self):
+        return self.cache.get(ON_SALE_KEY) or {}
+
+    def set_on_sale(self, class_id, span):
+        """Add or update (span) or remove (None) a class of the on-sale registry"""
+        with self.lock('on_sale'):
+            cutoff = timezone.now() - KEY_GRACE
+            spans = {
+                other: other_span for other, other_span in self.on_sale().items()
+                if other != class_id and other_span[2] > cutoff
+            }
+            if span is not None:
+                spans[class_id] = span
+            self.cache.set(ON_SALE_KEY, spans, timeout=None)
+
+    @contextmanager
+    def lock(self, name):
+        """A short-lived mutex in the store; TimeoutError if held for LOCK_WAIT"""
+        key = f"inventory:lock:{name}"
+        deadline = time.monotonic() + LOCK_WAIT
+        while not self.cache.add(key, 1, timeout=LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Inventory lock {name} is busy")
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            self.cache.delete(key)
+
+    def timeout(self, scheduled_datetime):
+        return max(1, int((scheduled_datetime + KEY_GRACE - timezone.now()).total_seconds()))
+
+    def snapshot(self, class_id):
+        return self.cache.get(self.key(class_id, 'class'))
+
+    def available(self, class_id):
+        return self.cache.get(self.key(class_id, 'slots'))
+
+    async def aavailable(self, class_id):
+        return await self.cache.aget(self.key(class_id, 'slots'))
+
+    def take(self, class_id, count=1):
+        """True if the seats were taken, False if sold out, None if not on sale"""
+        try:
+            left = self.cache.decr(self.key(class_id, 'slots'), count)
+        except ValueError:
+            return None
+        if left < 0:
+            self.give_back(class_id, count)
+            return False
+        return True
+
+    def give_back(self, class_id, count=1):
+        try:
+            self.cache.incr(self.key(class_id, 'slots'), count)
+        except ValueError:
+            pass
+
+    def add_pending(self, booking, scheduled_datetime):
+        """Keep a granted reservation until it is written; returns its key"""
+        seq = self.cache.incr(self.key(booking['class_id'], 'seq'))
+        key = self.key(booking['class_id'], f"pending:{seq}")
+        self.cache.set(key, booking, timeout=self.timeout(scheduled_datetime))
+        return key
+
+    def pending(self, class_id):
+        """The reservations of a class not written yet"""
+        seq = self.cache.get(self.key(class_id, 'seq')) or 0
+        keys = [self.key(class_id, f"pending:{n}") for n in range(1, seq + 1)]
+        found = {}
+        for start in range(0, len(keys), 1000):
+            found.update(self.cache.get_many(keys[start:start + 1000]))
+        return [{**booking, 'pending_key': key} for key, booking in found.items()]
+
+    def remove_pending(self, bookings):
+        self.cache.delete_many([booking['pending_key'] for booking in bookings])
+
+    def add_holder(self, class_id, email, scheduled_datetime):
+        return self.cache.add(
+            self.key(class_id, f"holder:{email}"), 1, timeout=self.timeout(scheduled_datetime)
+        )
+
+    def remove_holder(self, class_id, email):
+        self.cache.delete(self.key(class_id, f"holder:{email}"))
+
+
+def get_store():
+    return InventoryStore(caches[settings.INVENTORY_CACHE_ALIAS])
+
+
+def check_store():
+    """Refuse a store that dies with the process: acknowledged reservations would be lost"""
+    backend = settings.CACHES[settings.INVENTORY_CACHE_ALIAS]['BACKEND']
+    if not backend.endswith('.RedisCache') and not settings.INVENTORY_ALLOW_LOCAL_STORE:
+        raise ImproperlyConfigured(
+            "Classes go on sale only with a shared, persistent inventory store: use "
+            "CACHE_BACKEND=redis (or INVENTORY_ALLOW_LOCAL_STORE for a single process)"
+        )
+
+
+class WriteBehindWriter:
+    """Queue of granted reservations, persisted in batches"""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, booking):
+        self.queue.put(booking)
+        if self.thread is None and settings.INVENTORY_FLUSH_INTERVAL:
+            self.start()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='inventory-writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def run(self):
+        # Pick up what a previous worker left unwritten
+        try:
+            replay()
+        except Exception as e:
+            logger.exception("Inventory replay error: %s", e)
+        while True:
+            time.sleep(settings.INVENTORY_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception("Inventory writer error: %s", e)
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Persist everything queued so far, returns the number of bookings written"""
+        with self.lock:
+            batch = []
+            while len(batch) < settings.INVENTORY_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            by_class = {}
+            for booking in batch:
+                by_class.setdefault(booking['class_id'], []).append(booking)
+
+            written = 0
+            # Same lock order as the bulk booking path
+            for class_id in sorted(by_class):
+                try:
+                    written += self.persist(class_id, by_class[class_id])
+                except DatabaseError as e:
+                    # Database unavailable: keep the reservations for the next round
+                    logger.error("Could not persist bookings for class %s: %s", class_id, e)
+                    for booking in by_class[class_id]:
+                        self.queue.put(booking)
+
+            if written:
+                bump_schedule_version()
+            return written
+
+    def persist(self, class_id, bookings):
+        store = get_store()
+        # Reservations written already, by a replay in another process
+        written = set(Booking.objects.filter(
+            booking_reference__in=[booking['booking_reference'] for booking in bookings]
+        ).values_list('booking_reference', flat=True))
+        rows = [
+            Booking(
+                fitness_class_id=class_id,
+                client_name=booking['client_name'],
+                client_email=booking['client_email'],
+                booking_reference=booking['booking_reference']
+            )
+            for booking in bookings if booking['booking_reference'] not in written
+        ]
+        rejected = []
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    created = Booking.objects.bulk_create(rows)
+                    UserBooking.add_bookings(created)
+            except IntegrityError:
+                # Insert one by one to find the rows at fault
+                created = []
+                for row in rows:
+                    outcome = self.insert(row)
+                    if outcome == 'created':
+                        created.append(row)
+                    elif outcome == 'duplicate':
+                        rejected.append(row)
+
+            if created:
+                updated = FitnessClass.objects.filter(
+                    id=class_id,
+                    available_slots__gte=len(created)
+                ).update(
+                    available_slots=F('available_slots') - len(created),
+                    slots_version=F('slots_version') + 1,
+                    updated_at=timezone.now()
+                )
+                if not updated:
+                    logger.error("Class %s had fewer slots than persisted reservations", class_id)
+
+        store.remove_pending([booking for booking in bookings if 'pending_key' in booking])
+        for row in rejected:
+            # Holder markers rule this out; the client's existing booking keeps its marker
+            store.give_back(class_id)
+            logger.error("Dropped reservation %s: client already booked", row.booking_reference)
+        if created and not updated:
+            reconcile([class_id], flush=False)
+        return len(created)
+
+    def insert(self, row):
+        """Insert one reservation: returns 'created', 'written' (already) or 'duplicate'"""
+        for attempt in range(REFERENCE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    row.save(force_insert=True)
+                return 'created'
+            except IntegrityError as e:
+                if Booking.objects.filter(
+                    booking_reference=row.booking_reference,
+                    client_email=row.client_email
+                ).exists():
+                    return 'written'
+                if is_duplicate_booking(e, [(row.fitness_class_id, row.client_email)]):
+                    return 'duplicate'
+                if not is_reference_collision(e, [row.booking_reference]) or attempt == REFERENCE_ATTEMPTS - 1:
+                    raise
+                # The client was given this reference; keep the booking under a new one
+                reference, row.booking_reference = row.booking_reference, generate_booking_reference()
+                logger.error("Reservation %s collided with an existing reference, written as %s",
+                             reference, row.booking_reference)
+
+
+_writer = WriteBehindWriter()
+
+
+def get_writer():
+    return _writer
+
+
+@contextmanager
+def client_lock(*client_emails):
+    """
+    Hold off the clients' other bookings, in the store or the database: taken
+    by reserve() around its checks and by database bookings around their
+    transaction, so their overlap checks see each other's seats.
+    """
+    if not settings.INVENTORY_ENGINE:
+        yield
+        return
+    store = get_store()
+    with ExitStack() as locks:
+        try:
+            for email in sorted(set(client_emails)):
+                locks.enter_context(store.lock(f"client:{email}"))
+        except TimeoutError:
+            raise ValidationError(["Another booking for this client is in progress, please try again."])
+        yield
+
+
+def held_overlaps(client_email, start, end, exclude=None):
+    """
+    The client's seats in other classes on sale running at some point in
+    [start, end), shaped like UserBooking rows; the writer may not have
+    persisted them yet.
+    """
+    store = get_store()
+    spans = {
+        class_id: span for class_id, span in store.on_sale().items()
+        if class_id != exclude and span[1] < end and span[2] > start
+    }
+    if not spans:
+        return []
+    keys = {store.key(class_id, f"holder:{client_email}"): class_id for class_id in spans}
+    held = store.cache.get_many(list(keys))
+    return [
+        {
+            'fitness_class_id': class_id,
+            'booking_reference': None,
+            'class_name': spans[class_id][0],
+            'class_datetime': spans[class_id][1],
+            'class_end': spans[class_id][2],
+        }
+        for key, class_id in keys.items() if key in held
+    ]
+
+
+def open_class(fitness_class):
+    """
+    Put a class on sale: load its free seats and current holders into the
+    store. Inactive and past classes are refused; returns whether it opened.
+    """
+    check_store()
+    get_writer().flush()
+    replay([fitness_class.id])
+    fitness_class.refresh_from_db()
+    if not fitness_class.is_active or not fitness_class.is_upcoming:
+        logger.warning("Class %s not put on sale: inactive or started", fitness_class.id)
+        return False
+    emails = Booking.objects.filter(
+        fitness_class=fitness_class,
+        is_cancelled=False
+    ).values_list('client_email', flat=True)
+    get_store().open(fitness_class, list(emails))
+    logger.info("Class %s on sale with %d slots", fitness_class.id, fitness_class.available_slots)
+    return True
+
+
+def close_class(class_id):
+    """Take a class off sale; bookings go back to the database path"""
+    get_store().close(class_id)
+    get_writer().flush()
+    replay([class_id])
+
+
+def class_saved(sender, instance, created, **kwargs):
+    """Keep a class on sale in step with edits: deactivated ones go off sale"""
+    if created or not settings.INVENTORY_ENGINE:
+        return
+    store = get_store()
+    if store.snapshot(instance.id) is None:
+        return
+    if instance.is_active:
+        store.describe(instance)
+    else:
+        close_class(instance.id)
+
+
+def class_deleted(sender, instance, **kwargs):
+    if settings.INVENTORY_ENGINE:
+        get_store().close(instance.id)
+
+
+def replay(class_ids=None):
+    """
+    Write the reservations still pending in the store for the given classes,
+    or all upcoming ones: those of a worker that died before its writer
+    flushed them. Returns the number of bookings written.
+    """
+    if class_ids is None:
+        class_ids = FitnessClass.objects.filter(
+            scheduled_datetime__gt=timezone.now() - KEY_GRACE
+        ).values_list('id', flat=True)
+
+    store, writer = get_store(), get_writer()
+    written = 0
+    for class_id in sorted(class_ids):
+        pending = store.pending(class_id)
+        if pending:
+            with writer.lock:
+                written += writer.persist(class_id, pending)
+    if written:
+        bump_schedule_version()
+        logger.warning("Replayed %d pending reservations", written)
+    return written
+
+
+def reserve(class_id, client_name, client_email):
+    """
+    Reserve a seat for a class on sale and queue the booking. Sold-out and
+    duplicate requests are answered from the store; granted seats cost one
+    indexed query for the overlap check. Returns the booking data, or None
+    if the class is not on sale.
+    """
+    store = get_store()
+    snapshot = store.snapshot(class_id)
+    if snapshot is None:
+        return None
+    if snapshot['scheduled_datetime'] <= timezone.now():
+        raise ValidationError({'class_id': ["Cannot book past classes"]})
+
+    with client_lock(client_email):
+        if not store.add_holder(class_id, client_email, snapshot['scheduled_datetime']):
+            raise ValidationError(["You've already booked this class. Multiple bookings not allowed."])
+
+        taken = store.take(class_id)
+        if not taken:
+            store.remove_holder(class_id, client_email)
+            if taken is None:
+                return None
+            raise ValidationError({
+                'class_id': ["Sorry, this class is fully booked. You can join the waitlist."]
+            })
+
+        # serializers imports this module
+        from .serializers import OVERLAP_MESSAGE, find_conflicts
+        fitness_class = FitnessClass(
+            id=class_id,
+            scheduled_datetime=snapshot['scheduled_datetime'],
+            duration_minutes=snapshot['duration_minutes']
+        )
+        conflicts = find_conflicts(client_email, fitness_class)
+        if conflicts:
+            store.give_back(class_id)
+            store.remove_holder(class_id, client_email)
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [OVERLAP_MESSAGE],
+                'conflicts': conflicts
+            })
+
+        # Shaped like a .values(*BOOKING_FIELDS) row, so fastpath.booking_rows renders it
+        booking = {
+            'booking_reference': generate_booking_reference(),
+            'class_id': class_id,
+            'fitness_class__name': snapshot['name'],
+            'fitness_class__scheduled_datetime': snapshot['scheduled_datetime'],
+            'fitness_class__instructor_name': snapshot['instructor_name'],
+            'client_name': client_name,
+            'client_email': client_email,
+            'booking_datetime': timezone.now(),
+        }
+        # In the store before the client hears of it, so a dying worker loses nothing
+        pending_key = store.add_pending(booking, snapshot['scheduled_datetime'])
+        get_writer().submit({**booking, 'pending_key': pending_key})
+        publish_slots(class_id)
+        return booking
+
+
+def hold(fitness_class, client_email):
+    """
+    Mark a client booked through the database as holder of a class on sale
+    before the insert commits, so a concurrent reserve() cannot sell them a
+    second seat. True if marked, False if the client already holds one,
+    None if the class is not on sale.
+    """
+    store = get_store()
+    if store.available(fitness_class.id) is None:
+        return None
+    return store.add_holder(fitness_class.id, client_email, fitness_class.scheduled_datetime)
+
+
+def unhold(class_id, client_email):
+    """Undo hold() for a booking that was rolled back"""
+    get_store().remove_holder(class_id, client_email)
+
+
+def release(class_id, client_email):
+    """A booking of a class on sale was cancelled and its seat is free again"""
+    store = get_store()
+    if store.available(class_id) is None:
+        return
+    store.remove_holder(class_id, client_email)
+    store.give_back(class_id)
+    # The cancellation's event went out before the seat was back in the store
+    publish_slots(class_id)
+
+
+def transfer(fitness_class, from_email, to_email):
+    """A cancelled seat went to a waitlisted client"""
+    store = get_store()
+    if store.available(fitness_class.id) is None:
+        return
+    store.remove_holder(fitness_class.id, from_email)
+    store.add_holder(fitness_class.id, to_email, fitness_class.scheduled_datetime)
+
+
+def reconcile(class_ids=None, flush=True):
+    """
+    Set available_slots to total_slots minus the active bookings for the
+    given classes, or all upcoming ones. Pending writes of this process are
+    flushed first. Returns {class_id: (old, new)} for the classes corrected.
+    """
+    if flush:
+        get_writer().flush()
+
+    classes = FitnessClass.objects.annotate(
+        booked=Count('bookings', filter=Q(bookings__is_cancelled=False))
+    )
+    if class_ids is None:
+        classes = classes.filter(scheduled_datetime__gt=timezone.now())
+    else:
+        classes = classes.filter(id__in=class_ids)
+
+    corrected = {}
+    for fitness_class in classes:
+        expected = max(0, fitness_class.total_slots - fitness_class.booked)
+        if fitness_class.available_slots == expected:
+            continue
+        # Only if nobody changed the row since it was read
+        if FitnessClass.objects.filter(
+            pk=fitness_class.pk,
+            available_slots=fitness_class.available_slots
+        ).update(
+            available_slots=expected,
+            slots_version=F('slots_version') + 1,
+            updated_at=timezone.now()
+        ):
+            corrected[fitness_class.pk] = (fitness_class.available_slots, expected)
+            publish_slots(fitness_class.pk)
+            logger.warning("Reconciled class %s: available_slots %d -> %d",
+                           fitness_class.pk, fitness_class.available_slots, expected)
+
+    if corrected:
+        bump_schedule_version()
+    return corrected
@@ -0,0 +1,186 @@
+"""
+Structured, non-blocking logging.
+
+QueuedJSONHandler is the only handler on the request path: it stamps the
+record with the current request ID, merges the message arguments and puts
+the record on a bounded in-memory queue. A QueueListener thread formats it
+as one JSON line and writes it to a size-rotated file (and optionally
+stderr), so a slow or stalled disk never holds up a request. When the queue
+is full, records are dropped and counted rather than waited on. The
+listener starts on the first record of each process, so workers forked from
+a preloaded parent get their own.
+
+RequestIDMiddleware assigns the request ID: the client's X-Request-ID when it
+is sane, a fresh one otherwise, echoed back in the response header.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_request_id = contextvars.ContextVar('booking_request_id', default=None)
+
+# LogRecord attributes that are not user supplied `extra` fields
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'taskName',
+}
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, `extra` fields included"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class QueuedJSONHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a background listener writing JSON lines.
+
+    filename: log file, rotated at max_bytes keeping backup_count files
+    console: also write to stderr
+    queue_size: records buffered before new ones are dropped
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 console=False, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+
+        formatter = JSONFormatter()
+        handlers = [logging.handlers.RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, delay=True, encoding='utf-8'
+        )]
+        if console:
+            handlers.append(logging.StreamHandler(sys.stderr))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        self.targets = handlers
+
+        self.listener = None
+        self.stopped = False
+        self.start_lock = threading.Lock()
+        # A forked child inherits the queue, maybe mid-operation, but not the thread
+        os.register_at_fork(after_in_child=self.forked)
+        atexit.register(self.stop)
+
+    def forked(self):
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.listener = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        with self.start_lock:
+            if self.listener is None and not self.stopped:
+                listener = logging.handlers.QueueListener(
+                    self.queue, *self.targets, respect_handler_level=True
+                )
+                listener.start()
+                self.listener = listener
+
+    def prepare(self, record):
+        """
+        Runs in the thread that logs: merge the arguments and render the
+        traceback while they are current, JSON encoding is left to the listener
+        """
+        record = logging.makeLogRecord(vars(record))
+        # django.request logs responses after the middleware has returned
+        record.request_id = _request_id.get() or getattr(
+            getattr(record, 'request', None), 'request_id', None
+        )
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.listener is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Write out what is queued and stop the listener"""
+        with self.start_lock:
+            listener, self.listener = self.listener, None
+            self.stopped = True
+        if listener is not None:
+            listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+class RequestIDMiddleware:
+    """Tags every log record of a request with its ID; sync and async"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_id = self.request_id(request)
+        token = _request_id.set(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id = self.request_id(request)
+        token = _request_id.set(request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
+
+    def request_id(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        return request_id
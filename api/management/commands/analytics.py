@@ -0,0 +1,30 @@
+import json
+from django.core.management.base import BaseCommand
+from time import perf_counter
+from api.analytics import DIMENSIONS, occupancy_report, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = "Refresh the daily occupancy rollup and print an analytics report as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every day, not only changed ones')
+        parser.add_argument('--refresh-only', action='store_true', help='Refresh without printing a report')
+        parser.add_argument('--group-by', default='class_type',
+                            help=f"Comma separated: {', '.join(DIMENSIONS)}")
+        parser.add_argument('--date-from', help='First studio-local date (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='Last studio-local date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        days = refresh_rollups(full=options['full'])
+        self.stderr.write(f"Refreshed {days} days in {perf_counter() - started:.2f}s")
+        if options['refresh_only']:
+            return
+
+        report = occupancy_report({
+            'group_by': options['group_by'],
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+        })
+        self.stdout.write(json.dumps(report, indent=2))
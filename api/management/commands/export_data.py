@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from api.exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, EXPORTS, export_queryset, iter_export
+
+
+class Command(BaseCommand):
+    help = "Export bookings or classes as NDJSON or CSV in constant memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS), help='What to export')
+        parser.add_argument('--output-format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--output', help='File to write to (default: stdout)')
+        parser.add_argument('--date-from', help='ISO date or datetime lower bound')
+        parser.add_argument('--date-to', help='ISO date or datetime upper bound')
+        parser.add_argument('--is-cancelled', choices=['true', 'false'], help='Bookings only')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        params = {
+            'date_from': options['date_from'],
+            'date_to': options['date_to'],
+            'is_cancelled': options['is_cancelled'],
+        }
+        try:
+            queryset = export_queryset(options['kind'], params)
+        except ValidationError as e:
+            raise CommandError(e.detail)
+
+        lines = iter_export(
+            options['kind'], queryset, options['output_format'], options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
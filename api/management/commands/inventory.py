@@ -0,0 +1,63 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api import inventory
+from api.models import FitnessClass
+
+
+class Command(BaseCommand):
+    help = (
+        "Put classes on sale in the inventory engine, take them off, write reservations "
+        "left pending by a stopped worker (replay), or reconcile slots"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['open', 'close', 'status', 'replay', 'reconcile'])
+        parser.add_argument('class_ids', nargs='*', type=int, help='Classes to act on')
+        parser.add_argument('--instructor', help="All upcoming classes of this instructor")
+
+    def handle(self, *args, **options):
+        classes = FitnessClass.objects.filter(scheduled_datetime__gt=timezone.now())
+        if options['class_ids']:
+            classes = classes.filter(id__in=options['class_ids'])
+        if options['instructor']:
+            classes = classes.filter(instructor_name__iexact=options['instructor'])
+        selected = bool(options['class_ids'] or options['instructor'])
+
+        if options['action'] == 'replay':
+            written = inventory.replay(
+                list(classes.values_list('id', flat=True)) if selected else None
+            )
+            self.stdout.write(self.style.SUCCESS(f"Replayed, {written} pending reservations written"))
+            return
+
+        if options['action'] == 'reconcile':
+            corrected = inventory.reconcile(
+                list(classes.values_list('id', flat=True)) if selected else None
+            )
+            for class_id, (old, new) in corrected.items():
+                self.stdout.write(f"  class {class_id}: available_slots {old} -> {new}")
+            self.stdout.write(self.style.SUCCESS(f"Reconciled, {len(corrected)} classes corrected"))
+            return
+
+        if not selected:
+            raise CommandError("Give class ids or --instructor")
+        if options['action'] == 'open':
+            try:
+                inventory.check_store()
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+
+        store = inventory.get_store()
+        for fitness_class in classes:
+            if options['action'] == 'open':
+                if not inventory.open_class(fitness_class):
+                    self.stdout.write(f"  {fitness_class.id} {fitness_class.name}: inactive, not opened")
+                    continue
+            elif options['action'] == 'close':
+                inventory.close_class(fitness_class.id)
+                inventory.reconcile([fitness_class.id])
+            self.stdout.write(
+                f"  {fitness_class.id} {fitness_class.name}: "
+                f"store={store.available(fitness_class.id)} db={fitness_class.available_slots}"
+            )
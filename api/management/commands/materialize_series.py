@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.series import materialize_window
+
+
+class Command(BaseCommand):
+    help = "Store the upcoming occurrences of every class series as classes (rolling window job)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SERIES_MATERIALIZE_DAYS,
+                            help='How far ahead to materialize')
+
+    def handle(self, *args, **options):
+        counts = materialize_window(options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Materialized {sum(counts.values())} occurrences of {len(counts)} series "
+            f"for the next {options['days']} days"
+        ))
@@ -1,111 +1,196 @@
-from django.core.management.base import BaseCommand 
-from django.utils import timezone 
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
 from datetime import timedelta
-from api.models import FitnessClass, Booking
+from time import perf_counter
+from api.cache import bump_schedule_version
+from api.models import FitnessClass, Booking, UserBooking
+from api.references import generate_booking_reference
 import random
 
+CLASS_NAMES = {
+    'yoga': ['Morning Yoga Flow', 'Sunset Yoga', 'Power Yoga', 'Beginner Yoga'],
+    'zumba': ['High Energy Zumba', 'Latin Zumba Party', 'Zumba Fitness'],
+    'hiit': ['HIIT Bootcamp', 'Cardio HIIT', 'Strength HIIT'],
+    'pilates': ['Core Pilates', 'Reformer Pilates'],
+    'cardio': ['Cardio Blast', 'Dance Cardio']
+}
+
+INSTRUCTORS = [
+    'Sarah Johnson', 'Mike Chen', 'Priya Sharma', 'David Wilson',
+    'Lisa Kumar', 'Alex Rodriguez', 'Maya Patel', 'John Smith'
+]
+
+CLIENT_NAMES = [
+    'John Doe', 'Jane Smith', 'Bob Johnson', 'Alice Brown',
+    'Charlie Wilson', 'Diana Davis', 'Eva Martinez', 'Frank Miller',
+]
+
 class Command(BaseCommand):
     help = "populate Database with sample data of fitness classes and bookng"
 
     def add_arguments(self, parser):
         parser.add_argument('--classes', type=int , default=20 , help='Number of fitness classes to add')
-    
+
         parser.add_argument('--bookings', type=int , default=15 , help='Number of sample bookings to create')
-    
+
+        parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible data')
+
+        parser.add_argument('--days', type=int, default=30, help='Schedule classes over the next N days')
+
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+
+        parser.add_argument(
+            '--popular-ratio', type=float, default=0.2,
+            help='Fraction of classes that are popular and get booked to capacity first'
+        )
+        parser.add_argument(
+            '--cancel-rate', type=float, default=0.05,
+            help='Fraction of bookings created as cancelled (they do not hold a slot)'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write('Starting DB population')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        with transaction.atomic():
+            #clear existing data
+            Booking.objects.all().delete()
+            FitnessClass.objects.all().delete()
+
+            # Plan bookings up front so classes are inserted with their final slots
+            classes = self.build_fitness_classes(options['classes'], options['days'])
+            active = round(options['bookings'] * (1 - options['cancel_rate']))
+            booked = self.allocate(classes, active, options['popular_ratio'])
+            cancelled = self.spread(len(classes), options['bookings'] - active)
+            for fitness_class, count in zip(classes, booked):
+                fitness_class.available_slots = fitness_class.total_slots - count
+
+            # Create fitness classes
+            started = perf_counter()
+            classes = FitnessClass.objects.bulk_create(classes, batch_size=self.batch_size)
+            self.report('classes', len(classes), perf_counter() - started)
+
+            # Create sample bookings
+            started = perf_counter()
+            bookings = self.create_sample_bookings(classes, booked, cancelled)
+            self.report('bookings', bookings, perf_counter() - started)
+
+        # Rows were bulk inserted, so FitnessClass.save() never bumped the version
+        bump_schedule_version()
 
-        #clear existing data 
-        FitnessClass.objects.all().delete()
-        Booking.objects.all().delete()
-        # Create fitness classes
-        self.create_fitness_classes(options['classes'])
-        
-        # Create sample bookings
-        self.create_sample_bookings(options['bookings'])
-        
         self.stdout.write(
             self.style.SUCCESS(
-                f"Successfully created {options['classes']} classes and {options['bookings']} bookings"
+                f"Successfully created {len(classes)} classes and {bookings} bookings"
             )
         )
-        
-    def create_fitness_classes(self, count):
-        """Create sample fitness classes"""
-        
-        class_names = {
-            'yoga': ['Morning Yoga Flow', 'Sunset Yoga', 'Power Yoga', 'Beginner Yoga'],
-            'zumba': ['High Energy Zumba', 'Latin Zumba Party', 'Zumba Fitness'],
-            'hiit': ['HIIT Bootcamp', 'Cardio HIIT', 'Strength HIIT'],
-            'pilates': ['Core Pilates', 'Reformer Pilates'],
-            'cardio': ['Cardio Blast', 'Dance Cardio']
-        }
-        
-        instructors = [
-            'Sarah Johnson', 'Mike Chen', 'Priya Sharma', 'David Wilson',
-            'Lisa Kumar', 'Alex Rodriguez', 'Maya Patel', 'John Smith'
-        ]
-        
+
+    def report(self, label, rows, seconds):
+        rate = rows / seconds if seconds else 0
+        self.stdout.write(f"  {label}: {rows} rows in {seconds:.2f}s ({rate:,.0f} rows/s)")
+
+    def build_fitness_classes(self, count, days):
+        """Build (unsaved) sample fitness classes"""
+        today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        used_names = set()
+        classes = []
+
         for i in range(count):
-            class_type = random.choice(list(class_names.keys()))
-            name = random.choice(class_names[class_type])
-            
-            # Create classes for next 30 days
-            days_ahead = random.randint(1, 30)
-            hour = random.choice([6, 7, 8, 9, 17, 18, 19, 20])  # Morning or evening
-            
-            scheduled_time = timezone.now() + timedelta(
-                days=days_ahead,
-                hours=hour - timezone.now().hour,
-                minutes=random.choice([0, 30]) - timezone.now().minute,
-                seconds=-timezone.now().second,
-                microseconds=-timezone.now().microsecond
+            class_type = self.rng.choice(list(CLASS_NAMES))
+            name = self.rng.choice(CLASS_NAMES[class_type])
+            if name in used_names:
+                name = f"{name} #{i+1}"
+            used_names.add(name)
+
+            # Morning or evening, on one of the next `days` days
+            scheduled_time = today + timedelta(
+                days=self.rng.randint(1, days),
+                hours=self.rng.choice([6, 7, 8, 9, 17, 18, 19, 20]),
+                minutes=self.rng.choice([0, 30])
             )
-            
-            total_slots = random.randint(8, 25)
-            
-            FitnessClass.objects.create(
-                name=f"{name} #{i+1}" if name in [c.name for c in FitnessClass.objects.all()] else name,
+
+            total_slots = self.rng.randint(8, 25)
+
+            classes.append(FitnessClass(
+                name=name,
                 class_type=class_type,
-                instructor_name=random.choice(instructors),
+                instructor_name=self.rng.choice(INSTRUCTORS),
                 scheduled_datetime=scheduled_time,
-                duration_minutes=random.choice([45, 60, 90]),
+                duration_minutes=self.rng.choice([45, 60, 90]),
                 total_slots=total_slots,
-                available_slots=random.randint(0, total_slots),
+                available_slots=total_slots,
                 is_active=True
-            )
-    
-    def create_sample_bookings(self, count):
-        """Create sample bookings"""
-        
-        sample_clients = [
-            ('John Doe', 'john.doe@email.com'),
-            ('Jane Smith', 'jane.smith@email.com'),
-            ('Bob Johnson', 'bob.johnson@email.com'),
-            ('Alice Brown', 'alice.brown@email.com'),
-            ('Charlie Wilson', 'charlie.wilson@email.com'),
-            ('Diana Davis', 'diana.davis@email.com'),
-            ('Eva Martinez', 'eva.martinez@email.com'),
-            ('Frank Miller', 'frank.miller@email.com'),
-        ]
-        
-        classes_with_slots = FitnessClass.objects.filter(available_slots__gt=0)
-        
-        for i in range(min(count, len(classes_with_slots))):
-            fitness_class = random.choice(classes_with_slots)
-            client_name, client_email = random.choice(sample_clients)
-            
-            # Make sure we don't create duplicate bookings
-            if not Booking.objects.filter(
-                fitness_class=fitness_class,
-                client_email=client_email
-            ).exists():
-                Booking.objects.create(
+            ))
+
+        return classes
+
+    def allocate(self, classes, count, popular_ratio):
+        """
+        Decide how many active bookings each class gets: popular classes are
+        filled to capacity first, the rest is spread at random over classes
+        that still have room. Returns a list of counts parallel to classes.
+        """
+        counts = [0] * len(classes)
+        order = list(range(len(classes)))
+        self.rng.shuffle(order)
+        popular = round(len(classes) * popular_ratio)
+
+        remaining = count
+        for index in order[:popular]:
+            counts[index] = min(classes[index].total_slots, remaining)
+            remaining -= counts[index]
+
+        open_classes = order[popular:]
+        while remaining and open_classes:
+            position = self.rng.randrange(len(open_classes))
+            index = open_classes[position]
+            counts[index] += 1
+            remaining -= 1
+            if counts[index] == classes[index].total_slots:
+                # swap-remove keeps the pick O(1)
+                open_classes[position] = open_classes[-1]
+                open_classes.pop()
+        return counts
+
+    def spread(self, buckets, count):
+        """Spread count items uniformly at random over buckets"""
+        counts = [0] * buckets
+        if buckets:
+            for _ in range(count):
+                counts[self.rng.randrange(buckets)] += 1
+        return counts
+
+    def create_sample_bookings(self, classes, booked, cancelled):
+        """
+        Create sample bookings in batches, returns the number created.
+        Cancelled bookings don't hold a slot, so they come on top of booked.
+        """
+        per_class = [active + extra for active, extra in zip(booked, cancelled)]
+        # About four bookings per client, but enough clients for the fullest class
+        client_pool = max(sum(per_class) // 4, max(per_class, default=0), 1)
+        created = 0
+        batch = []
+
+        for fitness_class, active, total in zip(classes, booked, per_class):
+            for position, client in enumerate(self.rng.sample(range(client_pool), total)):
+                batch.append(Booking(
                     fitness_class=fitness_class,
-                    client_name=client_name,
-                    client_email=client_email
-                )
-                
-                # Update available slots
-                fitness_class.available_slots -= 1
-                fitness_class.save()
+                    client_name=self.rng.choice(CLIENT_NAMES),
+                    client_email=f"client{client}@example.com",
+                    booking_reference=generate_booking_reference(),
+                    is_cancelled=position >= active
+                ))
+                if len(batch) >= self.batch_size:
+                    created += self.insert_bookings(batch)
+                    batch = []
+
+        if batch:
+            created += self.insert_bookings(batch)
+        return created
+
+    def insert_bookings(self, batch):
+        bookings = Booking.objects.bulk_create(batch)
+        # bulk_create skips Booking.save(), so fill the listing read model here
+        UserBooking.add_bookings(bookings)
+        return len(bookings)
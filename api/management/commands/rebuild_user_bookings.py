@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from time import perf_counter
+from api.models import UserBooking
+
+
+class Command(BaseCommand):
+    help = "Recreate the per-client bookings read model from the bookings table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        with transaction.atomic():
+            rows = UserBooking.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} booking listing rows in {perf_counter() - started:.2f}s"
+        ))
@@ -1,11 +1,21 @@
-from django.db import models
-from django.core.validators import MinValueValidator, EmailValidator
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import models, transaction
+from django.core.validators import MaxValueValidator, MinValueValidator, EmailValidator, RegexValidator
 from django.utils import timezone 
-import pytz
 import logging 
+from .cache import bump_schedule_version
+from .references import generate_booking_reference
+from .timezones import DEFAULT_TIMEZONE, resolve_timezone, validate_timezone
 
 logger = logging.getLogger(__name__)
 
+# FitnessClass fields copied into UserBooking rows
+LISTED_CLASS_FIELDS = {'name', 'scheduled_datetime', 'instructor_name', 'duration_minutes'}
+# Longest class; bounds the overlap range query in UserBooking.overlapping()
+MAX_CLASS_MINUTES = 24 * 60
+# ClassSeries.weekdays: ISO weekdays, comma separated
+WEEKDAYS_PATTERN = r'^[1-7](,[1-7])*$'
+
 class FitnessClass(models.Model):
 
     """
@@ -23,7 +33,10 @@ class FitnessClass(models.Model):
     class_type = models.CharField(max_length=20, choices=CLASS_TYPES)
     instructor_name = models.CharField(max_length=100)
     scheduled_datetime = models.DateTimeField(help_text="Class start time in IST")
-    duration_minutes = models.PositiveIntegerField(default=60)
+    duration_minutes = models.PositiveIntegerField(
+        default=60,
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_CLASS_MINUTES)]
+    )
     total_slots = models.PositiveIntegerField(
         validators=[MinValueValidator(1)], 
         help_text="Maximum number of participants"
@@ -32,33 +45,92 @@ class FitnessClass(models.Model):
         validators=[MinValueValidator(0)],
         help_text="Current available slots"
     )
+    # Bumped by every UPDATE of available_slots, orders the live slot events
+    slots_version = models.PositiveBigIntegerField(default=0, editable=False)
     is_active = models.BooleanField(default=True)
+    # Set for occurrences materialized from a recurring series
+    series = models.ForeignKey(
+        'ClassSeries',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='classes'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['scheduled_datetime']
         indexes = [
-            models.Index(fields=['scheduled_datetime', 'is_active']),
+            # The listing: active classes after now, in (scheduled_datetime, id)
+            # keyset order. Partial, so inactive classes don't bloat it
+            models.Index(
+                fields=['scheduled_datetime', 'id'],
+                condition=models.Q(is_active=True),
+                name='class_active_schedule_idx'
+            ),
+        ]
+        constraints = [
+            # Enforced by the database so no write path can overbook
+            models.CheckConstraint(
+                condition=models.Q(available_slots__gte=0) &
+                          models.Q(available_slots__lte=models.F('total_slots')),
+                name='available_slots_within_total'
+            ),
+            models.CheckConstraint(
+                condition=models.Q(duration_minutes__gte=1) &
+                          models.Q(duration_minutes__lte=MAX_CLASS_MINUTES),
+                name='duration_within_a_day'
+            ),
+            # An occurrence is materialized once, however many bookings race for it
+            models.UniqueConstraint(
+                fields=['series', 'scheduled_datetime'],
+                name='unique_series_occurrence'
+            ),
         ]
     
     def __str__(self):
         return f"{self.name} - {self.instructor_name} ({self.scheduled_datetime})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored start time, so a reschedule can tell which day it left
+        instance._stored_schedule = instance.__dict__.get('scheduled_datetime')
+        return instance
+
     def save(self, *args , **kwargs):
         # available slots shouldn't exceed total slots
         if self.available_slots > self.total_slots:
             self.available_slots = self.total_slots 
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        bump_schedule_version()
+
+        # Renames and reschedules show up in the clients' booking listings
+        update_fields = kwargs.get('update_fields')
+        if not adding and (update_fields is None or set(update_fields) & LISTED_CLASS_FIELDS):
+            UserBooking.copy_class_fields(self)
+
+        # The analytics rollup must also recompute the day the class moved away from
+        stored = getattr(self, '_stored_schedule', None)
+        if stored is not None and stored != self.scheduled_datetime and (
+            update_fields is None or 'scheduled_datetime' in update_fields
+        ):
+            RollupDirtyDay.mark(stored)
+        self._stored_schedule = self.scheduled_datetime
     
     def get_datetime_in_timezone(self,target_timezone):
         ''' convert class datetime to specific timezone'''
-        try:
-            tz = pytz.timezone(target_timezone)
-            return self.scheduled_datetime.astimezone(tz)
-        except pytz.exceptions.UnknownTimeZoneError:
-            logger.warning(f"Unknown timezone: {target_timezone}, returning IST")
+        tz = resolve_timezone(target_timezone)
+        if tz is None:
             return self.scheduled_datetime
+        return self.scheduled_datetime.astimezone(tz)
+
+    @property
+    def end_datetime(self):
+        return self.scheduled_datetime + timedelta(minutes=self.duration_minutes)
+
     @property
     def is_fully_booked(self):
         return self.available_slots == 0
@@ -67,6 +139,121 @@ class FitnessClass(models.Model):
     def is_upcoming(self):
         return self.scheduled_datetime > timezone.now()
 
+class ClassSeries(models.Model):
+    """
+    A recurring class: weekly on the given weekdays at a studio-local time,
+    every `interval` weeks (RRULE FREQ=WEEKLY;INTERVAL;BYDAY).
+
+    Occurrences only become FitnessClass rows when they are booked or enter
+    the rolling window of `manage.py materialize_series`; everything before
+    materialized_until has been materialized, later ones are listed virtually.
+    Edits apply to occurrences not materialized yet.
+    """
+    name = models.CharField(max_length=100)
+    class_type = models.CharField(max_length=20, choices=FitnessClass.CLASS_TYPES)
+    instructor_name = models.CharField(max_length=100)
+    duration_minutes = models.PositiveIntegerField(
+        default=60,
+        validators=[MinValueValidator(1), MaxValueValidator(MAX_CLASS_MINUTES)]
+    )
+    total_slots = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    weekdays = models.CharField(
+        max_length=13,
+        validators=[RegexValidator(WEEKDAYS_PATTERN, "Use ISO weekdays 1-7, comma separated, e.g. 1,3,5")],
+        help_text="ISO weekdays, comma separated (1 = Monday), e.g. 1,3,5"
+    )
+    interval = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1)], help_text="Every n weeks"
+    )
+    start_time = models.TimeField(help_text="Local start time")
+    timezone = models.CharField(max_length=50, default=DEFAULT_TIMEZONE, validators=[validate_timezone])
+    starts_on = models.DateField()
+    ends_on = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    materialized_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'class series'
+        constraints = [
+            # The listing expands every active series, one bad row would break it
+            models.CheckConstraint(
+                condition=models.Q(weekdays__regex=WEEKDAYS_PATTERN),
+                name='series_weekdays_iso'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} - {self.instructor_name} (weekdays {self.weekdays} at {self.start_time})"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        bump_schedule_version()
+
+    @property
+    def weekday_set(self):
+        return {int(day) for day in self.weekdays.split(',') if day.strip()}
+
+    def occurs_on(self, day):
+        if day < self.starts_on or (self.ends_on is not None and day > self.ends_on):
+            return False
+        if day.isoweekday() not in self.weekday_set:
+            return False
+        first_monday = self.starts_on - timedelta(days=self.starts_on.weekday())
+        return (day - first_monday).days // 7 % self.interval == 0
+
+    def occurrence_on(self, day):
+        local = datetime.combine(day, self.start_time, tzinfo=resolve_timezone(self.timezone))
+        # UTC like the rows read back from the database
+        return local.astimezone(dt_timezone.utc)
+
+    def occurs_at(self, moment):
+        local = moment.astimezone(resolve_timezone(self.timezone))
+        return local.time() == self.start_time and self.occurs_on(local.date())
+
+    def occurrences(self, start, end):
+        """Start times in [start, end), in order"""
+        day = max(self.starts_on, start.astimezone(resolve_timezone(self.timezone)).date())
+        last = end.astimezone(resolve_timezone(self.timezone)).date()
+        if self.ends_on is not None:
+            last = min(last, self.ends_on)
+        while day <= last:
+            if self.occurs_on(day):
+                moment = self.occurrence_on(day)
+                if start <= moment < end:
+                    yield moment
+            day += timedelta(days=1)
+
+    def as_class(self, scheduled_datetime):
+        """The (unsaved) FitnessClass of one occurrence"""
+        return FitnessClass(
+            series=self,
+            name=self.name,
+            class_type=self.class_type,
+            instructor_name=self.instructor_name,
+            scheduled_datetime=scheduled_datetime,
+            duration_minutes=self.duration_minutes,
+            total_slots=self.total_slots,
+            available_slots=self.total_slots
+        )
+
+    def materialize(self, until):
+        """
+        Create the rows of all upcoming occurrences before `until` and move
+        the watermark. Returns the number of occurrences in the range.
+        """
+        start = max(self.materialized_until or timezone.now(), timezone.now())
+        if until <= start:
+            return 0
+        created = FitnessClass.objects.bulk_create(
+            [self.as_class(moment) for moment in self.occurrences(start, until)],
+            ignore_conflicts=True
+        )
+        ClassSeries.objects.filter(pk=self.pk).update(materialized_until=until)
+        self.materialized_until = until
+        bump_schedule_version()
+        return len(created)
+
+
 class Booking(models.Model):
     """ represents the booking done by a client for fitness class  """
 
@@ -82,11 +269,17 @@ class Booking(models.Model):
     is_cancelled = models.BooleanField(default=False)
     
     class Meta:
-        # Prevent duplicate bookings for same email and class
-        unique_together = ['fitness_class', 'client_email']
-        indexes = [
-            models.Index(fields=['client_email']),
-            models.Index(fields=['booking_reference']),
+        # booking_reference is unique, which already gives it an index; a
+        # client's bookings are listed from UserBooking, and the lookups by
+        # class and email use unique_active_booking
+        constraints = [
+            # Prevent duplicate bookings for same email and class; cancelled
+            # bookings don't count, so clients can book again after cancelling
+            models.UniqueConstraint(
+                fields=['fitness_class', 'client_email'],
+                condition=models.Q(is_cancelled=False),
+                name='unique_active_booking'
+            ),
         ]
     
     def __str__(self):
@@ -96,14 +289,262 @@ class Booking(models.Model):
         # Generate booking reference if not exists
         if not self.booking_reference:
             self.booking_reference = self.generate_booking_ref()
+        adding = self._state.adding
         super().save(*args, **kwargs)
+
+        # Keep the client's listing row in step
+        if self.is_cancelled:
+            if not adding:
+                UserBooking.objects.filter(booking_id=self.pk).delete()
+        elif adding:
+            UserBooking.from_booking(self).save(force_insert=True)
+        else:
+            UserBooking.from_booking(self).save()
     
     def generate_booking_ref(self):
-        """Generate unique booking reference"""
-        import random
-        import string
-        chars = string.ascii_uppercase + string.digits
-        return ''.join(random.choices(chars, k=8))
+        """Generate unique, time-ordered booking reference"""
+        return generate_booking_reference()
+
 
+# Inserts of a booking whose generated reference collided are retried this often
+REFERENCE_ATTEMPTS = 3
 
 
+def violated_constraint(error):
+    """The name of the constraint an IntegrityError violated, where the driver reports it (PostgreSQL)"""
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None)
+
+
+def is_duplicate_booking(error, keys):
+    """
+    An IntegrityError from unique_active_booking: one of the (class id,
+    email) pairs in `keys` already holds an active booking
+    """
+    name = violated_constraint(error)
+    if name is not None:
+        return name == 'unique_active_booking'
+    # SQLite does not name the constraint: look for the booking it protects
+    query = models.Q()
+    for class_id, client_email in keys:
+        query |= models.Q(fitness_class_id=class_id, client_email=client_email)
+    return Booking.objects.filter(query, is_cancelled=False).exists()
+
+
+def is_reference_collision(error, references):
+    """An IntegrityError because one of `references` was already issued"""
+    if violated_constraint(error) == 'unique_active_booking':
+        return False
+    return Booking.objects.filter(booking_reference__in=references).exists()
+
+
+class UserBooking(models.Model):
+    """
+    Read model behind GET /api/bookings/: one row per active booking with
+    the class fields copied in, so a client's bookings are a single index
+    range scan without a join.
+
+    Booking.save() and FitnessClass.save() keep it in step; paths that
+    bypass save() (bulk inserts, cancellation by UPDATE) call add_bookings()
+    or delete the rows themselves. rebuild() recreates it from the bookings.
+    """
+    booking = models.OneToOneField(
+        Booking,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='listing_row'
+    )
+    client_email = models.EmailField()
+    fitness_class = models.ForeignKey(
+        FitnessClass,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    booking_reference = models.CharField(max_length=20)
+    class_name = models.CharField(max_length=100)
+    class_datetime = models.DateTimeField()
+    class_end = models.DateTimeField()
+    instructor = models.CharField(max_length=100)
+    client_name = models.CharField(max_length=100)
+    booking_datetime = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The listing in UserBookingPagination order
+            models.Index(
+                fields=['client_email', '-booking_datetime', '-booking'],
+                name='user_booking_listing_idx'
+            ),
+            # The client's schedule, for overlap checks
+            models.Index(
+                fields=['client_email', 'class_datetime'],
+                name='user_booking_schedule_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.client_email} - {self.class_name} ({self.booking_reference})"
+
+    @classmethod
+    def from_booking(cls, booking):
+        fitness_class = booking.fitness_class
+        return cls(
+            booking_id=booking.pk,
+            client_email=booking.client_email,
+            fitness_class_id=fitness_class.pk,
+            booking_reference=booking.booking_reference,
+            class_name=fitness_class.name,
+            class_datetime=fitness_class.scheduled_datetime,
+            class_end=fitness_class.end_datetime,
+            instructor=fitness_class.instructor_name,
+            client_name=booking.client_name,
+            booking_datetime=booking.booking_datetime
+        )
+
+    @classmethod
+    def add_bookings(cls, bookings):
+        """Insert rows for bookings created with bulk_create"""
+        cls.objects.bulk_create([
+            cls.from_booking(booking) for booking in bookings if not booking.is_cancelled
+        ])
+
+    @classmethod
+    def copy_class_fields(cls, fitness_class):
+        """Apply a class rename/reschedule to its rows"""
+        cls.objects.filter(fitness_class_id=fitness_class.pk).update(
+            class_name=fitness_class.name,
+            class_datetime=fitness_class.scheduled_datetime,
+            class_end=fitness_class.end_datetime,
+            instructor=fitness_class.instructor_name
+        )
+
+    @classmethod
+    def overlapping(cls, client_emails, start, end):
+        """
+        The clients' bookings of classes running at some point in [start, end).
+        One range scan of user_booking_schedule_idx per client: no class is
+        longer than MAX_CLASS_MINUTES, so only those starting in that window
+        can overlap.
+        """
+        return cls.objects.filter(
+            client_email__in=client_emails,
+            class_datetime__gt=start - timedelta(minutes=MAX_CLASS_MINUTES),
+            class_datetime__lt=end,
+            class_end__gt=start
+        )
+
+    @classmethod
+    def lock_client(cls, client_email):
+        """
+        Hold off the client's other bookings until the transaction ends, so an
+        overlap check and the insert after it see the same schedule. SQLite
+        transactions are IMMEDIATE and already serialize writers; PostgreSQL
+        takes a transaction-level advisory lock on the email.
+        """
+        connection = transaction.get_connection()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [client_email])
+
+    @classmethod
+    def rebuild(cls, batch_size=5000):
+        """Recreate every row from the bookings table, returns the row count"""
+        cls.objects.all().delete()
+        bookings = Booking.objects.filter(is_cancelled=False).select_related('fitness_class')
+        batch, created = [], 0
+        for booking in bookings.iterator(chunk_size=batch_size):
+            batch.append(cls.from_booking(booking))
+            if len(batch) >= batch_size:
+                cls.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        cls.objects.bulk_create(batch)
+        return created + len(batch)
+
+
+class WaitlistEntry(models.Model):
+    """ a client waiting for a slot in a fully booked class, served first in first out """
+
+    fitness_class = models.ForeignKey(
+        FitnessClass,
+        on_delete=models.CASCADE,
+        related_name='waitlist'
+    )
+    client_name = models.CharField(max_length=100)
+    client_email = models.EmailField(validators=[EmailValidator()])
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # The auto-increment id is the queue position, so the head of a
+        # class's queue is a single (fitness_class, id) index lookup
+        ordering = ['id']
+        unique_together = ['fitness_class', 'client_email']
+        indexes = [
+            models.Index(fields=['fitness_class', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.client_name} waiting for {self.fitness_class.name}"
+
+
+class ClassDailyStats(models.Model):
+    """
+    Daily occupancy rollup behind /api/analytics/: one row per studio-local
+    day, class type, instructor and start hour. Maintained by
+    api/analytics.py, which recomputes only the days that changed.
+    """
+    date = models.DateField()
+    class_type = models.CharField(max_length=20)
+    instructor_name = models.CharField(max_length=100)
+    weekday = models.PositiveSmallIntegerField(help_text="ISO weekday, 1 = Monday")
+    hour = models.PositiveSmallIntegerField()
+    classes = models.PositiveIntegerField(default=0)
+    total_slots = models.PositiveIntegerField(default=0)
+    booked_slots = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    cancellations = models.PositiveIntegerField(default=0)
+    # Sum and count over active bookings, for the average lead time
+    lead_time_seconds = models.FloatField(default=0)
+    lead_time_bookings = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'class_type', 'instructor_name', 'hour'],
+                name='class_daily_stats_unique'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.class_type} {self.instructor_name} {self.hour}h"
+
+
+class RollupDirtyDay(models.Model):
+    """
+    A day the rollup must recompute though no class on it changed: a class
+    was rescheduled away from it or deleted. Consumed by refresh_rollups().
+    """
+    date = models.DateField(help_text="Studio-local day")
+    marked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.date} (marked {self.marked_at})"
+
+    @classmethod
+    def mark(cls, scheduled_datetime):
+        studio = resolve_timezone(DEFAULT_TIMEZONE)
+        cls.objects.create(date=scheduled_datetime.astimezone(studio).date())
+
+
+def mark_deleted_class_day(sender, instance, **kwargs):
+    """post_delete receiver: a deleted class leaves its day in the rollup"""
+    RollupDirtyDay.mark(instance.scheduled_datetime)
+
+
+class RollupState(models.Model):
+    """Watermark of the last rollup refresh: classes changed after it are recomputed"""
+    name = models.CharField(max_length=50, unique=True)
+    refreshed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} refreshed at {self.refreshed_at}"
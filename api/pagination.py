@@ -0,0 +1,109 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.settings import api_settings
+
+
+def query_params(request):
+    """Query params of a DRF request or a plain Django (async view) request"""
+    return getattr(request, 'query_params', request.GET)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on (scheduled_datetime, id).
+
+    The cursor is the position of the last row of the previous page, so every
+    page is a bounded index range scan no matter how deep the client scrolls.
+    Subclasses can key on another (datetime, id) pair, ascending or
+    descending ('-' prefix on both).
+    """
+    ordering = ('scheduled_datetime', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE or 20
+        self.next_cursor = None
+        self.datetime_field, self.id_field = (field.lstrip('-') for field in self.ordering)
+        self.descending = self.ordering[0].startswith('-')
+
+    def get_page_size(self, request):
+        value = query_params(request).get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'Must be an integer'})
+        if page_size < 1:
+            raise ValidationError({self.page_size_query_param: 'Must be at least 1'})
+        return min(page_size, self.max_page_size)
+
+    def row_key(self, row):
+        """The (datetime, id) position of a row"""
+        # Rows are model instances, or dicts when paginating a .values() queryset
+        if isinstance(row, dict):
+            moment, pk = row[self.datetime_field], row[self.id_field]
+        else:
+            moment, pk = getattr(row, self.datetime_field), getattr(row, self.id_field)
+        if pk is None:
+            # A series occurrence not materialized yet (api/series.py)
+            series_id = row['series_id'] if isinstance(row, dict) else row.series_id
+            pk = -series_id
+        return moment, pk
+
+    def encode_cursor(self, row):
+        moment, pk = self.row_key(row)
+        position = f"{moment.isoformat()}|{pk}"
+        return urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        """Return (datetime, id) from the request cursor or None"""
+        cursor = query_params(request).get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            timestamp, pk = urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+            moment = parse_datetime(timestamp)
+            if moment is None:
+                raise ValueError(timestamp)
+            return moment, int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({self.cursor_query_param: 'Invalid cursor'})
+
+    def page_queryset(self, queryset, request):
+        """The queryset for one page, plus one extra row to detect a next page"""
+        self.requested_page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        if position is not None:
+            moment, pk = position
+            after = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f"{self.datetime_field}__{after}": moment}) |
+                Q(**{self.datetime_field: moment, f"{self.id_field}__{after}": pk})
+            )
+        return queryset.order_by(*self.ordering)[:self.requested_page_size + 1]
+
+    def finish_page(self, rows):
+        if len(rows) > self.requested_page_size:
+            rows = rows[:self.requested_page_size]
+            self.next_cursor = self.encode_cursor(rows[-1])
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        rows = [row async for row in self.page_queryset(queryset, request).aiterator()]
+        return self.finish_page(rows)
+
+
+class UserBookingPagination(KeysetPagination):
+    """A client's bookings, newest first"""
+    ordering = ('-booking_datetime', '-booking_id')
@@ -0,0 +1,179 @@
+"""
+Time-ordered booking references.
+
+A reference is 15 Crockford base32 characters:
+
+    TTTTTTTTT NN SSS C
+    |         |  |   +- check character (Luhn mod 32)
+    |         |  +----- per-process sequence, 15 bits
+    |         +-------- node id, 10 bits
+    +------------------ milliseconds since REFERENCE_EPOCH_MS, 45 bits
+
+Within one node the (millisecond, sequence) pair never repeats, so references
+are unique by construction as long as concurrent processes use distinct node
+ids. Each process leases its node id in a cache (BOOKING_REF_CACHE_ALIAS):
+with a shared backend (Redis) no two live processes hold the same one. The
+first id tried is derived from the process id, which already keeps forked
+workers of one host apart when the cache is per process. References sort by
+creation time, which keeps inserts into the unique index append-mostly
+instead of random.
+
+The booking_reference unique index stays the last line of defence: the
+booking paths retry with a fresh reference on the rare collision.
+"""
+import logging
+import os
+import secrets
+import socket
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+DECODE = {char: index for index, char in enumerate(ALPHABET)}
+
+# 2024-01-01T00:00:00Z
+REFERENCE_EPOCH_MS = 1704067200000
+TIMESTAMP_CHARS = 9
+NODE_BITS = 10
+SEQUENCE_BITS = 15
+REFERENCE_LENGTH = TIMESTAMP_CHARS + 2 + 3 + 1
+
+
+def encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def check_character(body):
+    """Luhn mod 32 check character: catches any single typo or adjacent swap"""
+    total = 0
+    factor = 2
+    for char in reversed(body):
+        addend = factor * DECODE[char]
+        factor = 1 if factor == 2 else 2
+        total += addend // 32 + addend % 32
+    return ALPHABET[(32 - total % 32) % 32]
+
+
+def is_valid_reference(reference):
+    reference = reference.upper()
+    if len(reference) != REFERENCE_LENGTH or any(c not in DECODE for c in reference):
+        return False
+    return check_character(reference[:-1]) == reference[-1]
+
+
+class ReferenceGenerator:
+    """Snowflake-style generator; thread safe within a process"""
+
+    def __init__(self, node_id=None, lease=None):
+        """Issues from a fixed node_id, or from the node id held by `lease`"""
+        if lease is None:
+            if not 0 <= node_id < 2 ** NODE_BITS:
+                raise ValueError(f"node_id must be in [0, {2 ** NODE_BITS})")
+            self.node = encode(node_id, 2)
+        self.lease = lease
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.sequence = 0
+
+    def _now_ms(self):
+        return time.time_ns() // 1_000_000 - REFERENCE_EPOCH_MS
+
+    def generate(self):
+        with self.lock:
+            if self.lease is not None:
+                self.node = encode(self.lease.node_id(), 2)
+            now = self._now_ms()
+            if now < self.last_ms:
+                # Clock went backwards: keep issuing from the last timestamp
+                now = self.last_ms
+            if now == self.last_ms:
+                self.sequence = (self.sequence + 1) % 2 ** SEQUENCE_BITS
+                if self.sequence == 0:
+                    # Sequence exhausted for this millisecond, wait for the next
+                    while now <= self.last_ms:
+                        now = self._now_ms()
+            else:
+                self.sequence = 0
+            self.last_ms = now
+            body = encode(now, TIMESTAMP_CHARS) + self.node + encode(self.sequence, 3)
+        return body + check_character(body)
+
+
+class NodeLease:
+    """
+    A node id held in a cache for as long as the process issues from it.
+
+    The lease is claimed with cache.add (only one holder per key) and renewed
+    once half of its timeout has passed; a lease found lost or taken over is
+    replaced by a fresh claim before the next reference.
+    """
+
+    def __init__(self, cache, start, timeout):
+        self.cache = cache
+        self.start = start
+        self.timeout = timeout
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.current = None
+        self.renew_at = 0
+
+    def key(self, node_id):
+        return f"booking-ref-node:{node_id}"
+
+    def node_id(self):
+        now = time.monotonic()
+        if self.current is not None and now < self.renew_at:
+            return self.current
+
+        if self.current is not None and self.cache.get(self.key(self.current)) == self.token:
+            self.cache.touch(self.key(self.current), self.timeout)
+        else:
+            self.current = self.claim()
+        self.renew_at = now + self.timeout / 2
+        return self.current
+
+    def claim(self):
+        start = self.start if self.current is None else self.current
+        for offset in range(2 ** NODE_BITS):
+            node_id = (start + offset) % 2 ** NODE_BITS
+            if self.cache.add(self.key(node_id), self.token, self.timeout):
+                return node_id
+        # More live processes than node ids: references stay valid, the
+        # unique index and the booking retries catch the rare collision
+        logger.warning("All booking reference node ids are leased, sharing %d", start)
+        return start
+
+
+_generator = None
+_generator_pid = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    """The process's generator; forked children build their own"""
+    global _generator, _generator_pid
+    if _generator_pid != os.getpid():
+        with _generator_lock:
+            if _generator_pid != os.getpid():
+                base = settings.BOOKING_REF_NODE_ID
+                if base is None:
+                    base = secrets.randbelow(2 ** NODE_BITS)
+                lease = NodeLease(
+                    caches[settings.BOOKING_REF_CACHE_ALIAS],
+                    (base + os.getpid()) % 2 ** NODE_BITS,
+                    settings.BOOKING_REF_LEASE_TIMEOUT
+                )
+                _generator = ReferenceGenerator(lease=lease)
+                _generator_pid = os.getpid()
+    return _generator
+
+
+def generate_booking_reference():
+    return get_generator().generate()
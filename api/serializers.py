@@ -1,48 +1,89 @@
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.utils import timezone
-from .models import FitnessClass, Booking
-import pytz
+from . import inventory
+from .models import (
+    REFERENCE_ATTEMPTS, FitnessClass, Booking, UserBooking, WaitlistEntry,
+    is_duplicate_booking, is_reference_collision
+)
+from .cache import bump_schedule_version
+from .events import publish_slots
+from .fastpath import format_datetime
+from .references import generate_booking_reference
+from .series import find_occurrence, materialize_occurrence
+from .timezones import get_request_timezone
 import logging
 
 logger = logging.getLogger(__name__)
 
+OVERLAP_MESSAGE = "This class overlaps another class you've booked"
+
+
+def conflict_data(row):
+    """A conflicting booking as reported in error payloads"""
+    return {
+        'booking_reference': row['booking_reference'],
+        'class_name': row['class_name'],
+        'class_datetime': format_datetime(row['class_datetime']),
+        'class_end': format_datetime(row['class_end']),
+    }
+
+
+def find_conflicts(client_email, fitness_class):
+    """
+    The client's other bookings running at the same time as fitness_class,
+    including seats in classes on sale the writer hasn't persisted yet
+    """
+    start, end = fitness_class.scheduled_datetime, fitness_class.end_datetime
+    rows = list(UserBooking.overlapping([client_email], start, end).exclude(
+        fitness_class_id=fitness_class.id
+    ).order_by('class_datetime').values('booking_reference', 'class_name', 'class_datetime', 'class_end'))
+    if not rows and settings.INVENTORY_ENGINE:
+        rows = inventory.held_overlaps(client_email, start, end, exclude=fitness_class.id)
+    return [conflict_data(row) for row in rows]
+
+
 class FitnessClassSerializer(serializers.ModelSerializer):
     """
     Serializer for fitness class data with timezone conversion
     """
     scheduled_datetime_local = serializers.SerializerMethodField()
+    # Unmaterialized series occurrences are listed with id null
+    series_id = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = FitnessClass
         fields = [
             'id', 'name', 'class_type', 'instructor_name', 
             'scheduled_datetime', 'scheduled_datetime_local', 
-            'duration_minutes', 'total_slots', 'available_slots'
+            'duration_minutes', 'total_slots', 'available_slots', 'series_id'
         ]
     
     def get_scheduled_datetime_local(self, obj):
         """
         Return datetime in user's timezone if provided in context
         """
-        request = self.context.get('request')
-        if request and hasattr(request, 'META'):
-            user_timezone = request.META.get('HTTP_X_TIMEZONE', 'Asia/Kolkata')
-            try:
-                return obj.get_datetime_in_timezone(user_timezone).isoformat()
-            except Exception as e:
-                logger.error(f"Timezone conversion error: {e}")
-                return obj.scheduled_datetime.isoformat()
-        return obj.scheduled_datetime.isoformat()
+        tz = get_request_timezone(self.context)
+        if tz is None:
+            return obj.scheduled_datetime.isoformat()
+        return obj.scheduled_datetime.astimezone(tz).isoformat()
 
 class BookingCreateSerializer(serializers.ModelSerializer):
     """
-    Serializer for creating new bookings
+    Serializer for creating new bookings. Occurrences of a class series
+    that are not materialized yet are booked by series_id and
+    scheduled_datetime instead of class_id.
     """
-    class_id = serializers.IntegerField(write_only=True)
+    class_id = serializers.IntegerField(write_only=True, required=False)
+    series_id = serializers.IntegerField(write_only=True, required=False)
+    scheduled_datetime = serializers.DateTimeField(write_only=True, required=False)
     
     class Meta:
         model = Booking
-        fields = ['class_id', 'client_name', 'client_email']
+        fields = ['class_id', 'series_id', 'scheduled_datetime', 'client_name', 'client_email']
     
     def validate_class_id(self, value):
         """Check if class exists and has available slots"""
@@ -55,8 +96,12 @@ class BookingCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Cannot book past classes")
         
         if fitness_class.is_fully_booked:
-            raise serializers.ValidationError("Sorry, this class is fully booked")
-        
+            raise serializers.ValidationError(
+                "Sorry, this class is fully booked. You can join the waitlist."
+            )
+
+        # Reused by create() and the response so the row is fetched only once
+        self.fitness_class = fitness_class
         return value
     
     def validate_client_email(self, value):
@@ -64,45 +109,148 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         if not value or '@' not in value:
             raise serializers.ValidationError("Please provide a valid email address")
         return value.lower()
-    
+
     def validate(self, attrs):
-        """Check for duplicate bookings"""
-        class_id = attrs['class_id']
-        client_email = attrs['client_email']
-        
-        if Booking.objects.filter(
-            fitness_class_id=class_id, 
-            client_email=client_email,
-            is_cancelled=False
-        ).exists():
-            raise serializers.ValidationError(
-                "You've already booked this class. Multiple bookings not allowed."
-            )
-        
+        series_id = attrs.pop('series_id', None)
+        scheduled_datetime = attrs.pop('scheduled_datetime', None)
+        if 'class_id' not in attrs:
+            if series_id is None or scheduled_datetime is None:
+                raise serializers.ValidationError({'class_id': ["This field is required."]})
+            fitness_class = find_occurrence(series_id, scheduled_datetime)
+            if fitness_class.pk is None:
+                # Not materialized yet: create() stores it with the booking
+                self.fitness_class = fitness_class
+                attrs['class_id'] = None
+                return attrs
+            try:
+                attrs['class_id'] = self.validate_class_id(fitness_class.id)
+            except serializers.ValidationError as e:
+                raise serializers.ValidationError({'series_id': e.detail})
         return attrs
     
     def create(self, validated_data):
-        """Create booking and update available slots"""
-        class_id = validated_data.pop('class_id')
-        fitness_class = FitnessClass.objects.select_for_update().get(id=class_id)
-        
-        # Double-check availability (race condition protection)
-        if fitness_class.available_slots <= 0:
-            raise serializers.ValidationError("Class just got fully booked")
-        
-        # Create booking
-        booking = Booking.objects.create(
-            fitness_class=fitness_class,
-            **validated_data
-        )
-        
-        # Update available slots
+        """
+        Create booking and update available slots.
+        Duplicate bookings are caught by the unique_active_booking
+        constraint rather than a separate lookup.
+        """
+        validated_data.pop('class_id')
+        fitness_class = self.fitness_class
+
+        # Database bookings and store reservations of the client take turns
+        with inventory.client_lock(validated_data['client_email']):
+            for attempt in range(REFERENCE_ATTEMPTS):
+                booking = Booking(**validated_data)
+                try:
+                    with transaction.atomic():
+                        # A series occurrence booked for the first time is stored here,
+                        # so a rejected booking leaves no class behind
+                        fitness_class = materialize_occurrence(self.fitness_class)
+                        booking.fitness_class = fitness_class
+
+                        # Conditional decrement: a single UPDATE that only succeeds while
+                        # a slot is left, so concurrent bookings can never overbook
+                        updated = FitnessClass.objects.filter(
+                            id=fitness_class.id,
+                            available_slots__gt=0
+                        ).update(
+                            available_slots=F('available_slots') - 1,
+                            slots_version=F('slots_version') + 1,
+                            updated_at=timezone.now()
+                        )
+                        if not updated:
+                            raise serializers.ValidationError("Class just got fully booked")
+
+                        # Checked in the transaction, after the slot UPDATE, so a
+                        # concurrent booking of the same client cannot slip past it
+                        UserBooking.lock_client(validated_data['client_email'])
+                        conflicts = find_conflicts(validated_data['client_email'], fitness_class)
+                        if conflicts:
+                            raise serializers.ValidationError({
+                                api_settings.NON_FIELD_ERRORS_KEY: [OVERLAP_MESSAGE],
+                                'conflicts': conflicts
+                            })
+
+                        # Create booking
+                        booking.save(force_insert=True)
+                    break
+                except IntegrityError as e:
+                    if is_duplicate_booking(e, [(fitness_class.id, validated_data['client_email'])]):
+                        raise serializers.ValidationError(
+                            "You've already booked this class. Multiple bookings not allowed."
+                        )
+                    # Another process issued the same reference: try again with a new one
+                    if (not is_reference_collision(e, [booking.booking_reference])
+                            or attempt == REFERENCE_ATTEMPTS - 1):
+                        raise
+                    logger.warning("Booking reference collision, retrying: %s", e)
+
         fitness_class.available_slots -= 1
-        fitness_class.save()
+        bump_schedule_version()
+        publish_slots(fitness_class.id)
         
-        logger.info(f"New booking created: {booking.booking_reference}")
+        logger.info("New booking created: %s", booking.booking_reference, extra={
+            'booking_reference': booking.booking_reference, 'class_id': fitness_class.id
+        })
         return booking
 
+class WaitlistJoinSerializer(serializers.ModelSerializer):
+    """
+    Serializer for joining the waitlist of a fully booked class
+    """
+    class_id = serializers.IntegerField(write_only=True)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ['class_id', 'client_name', 'client_email']
+
+    def validate_class_id(self, value):
+        """Only upcoming, fully booked classes have a waitlist"""
+        try:
+            fitness_class = FitnessClass.objects.get(id=value, is_active=True)
+        except FitnessClass.DoesNotExist:
+            raise serializers.ValidationError("Invalid class ID or class not available")
+
+        if not fitness_class.is_upcoming:
+            raise serializers.ValidationError("Cannot join the waitlist of past classes")
+
+        fully_booked = fitness_class.is_fully_booked
+        if settings.INVENTORY_ENGINE:
+            # A class on sale fills up in the store before the database catches up
+            available = inventory.get_store().available(fitness_class.id)
+            if available is not None:
+                fully_booked = available <= 0
+        if not fully_booked:
+            raise serializers.ValidationError("This class still has slots, please book it directly")
+
+        self.fitness_class = fitness_class
+        return value
+
+    def validate_client_email(self, value):
+        return value.lower()
+
+    def validate(self, attrs):
+        """A client who already holds a booking doesn't need to wait"""
+        if Booking.objects.filter(
+            fitness_class_id=attrs['class_id'],
+            client_email=attrs['client_email'],
+            is_cancelled=False
+        ).exists():
+            raise serializers.ValidationError("You've already booked this class.")
+        return attrs
+
+    def create(self, validated_data):
+        validated_data.pop('class_id')
+        try:
+            with transaction.atomic():
+                return WaitlistEntry.objects.create(
+                    fitness_class=self.fitness_class,
+                    **validated_data
+                )
+        except IntegrityError:
+            raise serializers.ValidationError("You're already on the waitlist for this class.")
+
+
 class BookingSerializer(serializers.ModelSerializer):
     """
     Serializer for displaying booking information
@@ -116,4 +264,331 @@ class BookingSerializer(serializers.ModelSerializer):
         fields = [
             'booking_reference', 'class_name', 'class_datetime', 
             'instructor', 'client_name', 'booking_datetime'
-        ]
\ No newline at end of file
+        ]
+
+class BulkBookingItemSerializer(serializers.Serializer):
+    """
+    Serializer for one entry of a bulk booking request
+    """
+    class_id = serializers.IntegerField()
+    client_name = serializers.CharField(max_length=100)
+    client_email = serializers.EmailField()
+
+    def validate_client_email(self, value):
+        return value.lower()
+
+
+class BatchRejected(Exception):
+    """Raised inside the bulk booking transaction to roll back an atomic batch"""
+
+    def __init__(self, class_id, reason="Sorry, this class doesn't have enough slots left"):
+        super().__init__(class_id)
+        self.class_id = class_id
+        self.reason = reason
+
+
+class BulkBookingSerializer(serializers.Serializer):
+    """
+    Serializer for group bookings.
+
+    Items are validated in bulk (one query for the classes, one for existing
+    bookings), inserted with bulk_create and every class has its slots taken
+    by a single conditional UPDATE for the whole group.
+
+    In 'atomic' mode any failing item rejects the whole batch; in
+    'best_effort' mode the valid items are booked while slots last.
+    """
+    MODES = ['atomic', 'best_effort']
+    MAX_ITEMS = 100
+
+    mode = serializers.ChoiceField(choices=MODES, default='atomic')
+    bookings = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=MAX_ITEMS
+    )
+
+    def create(self, validated_data):
+        """Returns a (booking, errors) pair per item, in request order"""
+        items = validated_data['bookings']
+        atomic = validated_data['mode'] == 'atomic'
+        results = [None] * len(items)
+        pending = self.validate_items(items, results)
+
+        if atomic and any(result is not None for result in results):
+            for index in pending:
+                results[index] = (None, ["Not booked: another item in the batch failed"])
+            return results
+
+        # (class_id, seats) taken from the inventory store for classes on sale,
+        # and the (class_id, email) holder markers added there
+        self.taken = []
+        self.holders = []
+        committed = False
+        try:
+            emails = [item['client_email'] for item in pending.values()]
+            with inventory.client_lock(*emails), transaction.atomic():
+                self.book(pending, results, atomic)
+            committed = True
+        except BatchRejected as e:
+            for index, item in pending.items():
+                if results[index] is not None:
+                    # Rejected on its own, e.g. for an overlap
+                    continue
+                if item['class_id'] == e.class_id:
+                    results[index] = (None, [e.reason])
+                else:
+                    results[index] = (None, ["Not booked: another item in the batch failed"])
+        except serializers.ValidationError as e:
+            # A client's lock stayed busy
+            for index in pending:
+                results[index] = (None, e.detail)
+        except IntegrityError as e:
+            keys = [(item['class_id'], item['client_email']) for item in pending.values()]
+            if not is_duplicate_booking(e, keys):
+                raise
+            # A concurrent request booked one of the same clients in between
+            for index in pending:
+                results[index] = (None, ["A booking for this client was created concurrently"])
+        finally:
+            if not committed:
+                store = inventory.get_store()
+                for class_id, count in self.taken:
+                    store.give_back(class_id, count)
+                for class_id, email in self.holders:
+                    store.remove_holder(class_id, email)
+        return results
+
+    def validate_items(self, items, results):
+        """Record errors for invalid items and return {index: data} for the rest"""
+        valid = {}
+        for index, data in enumerate(items):
+            item = BulkBookingItemSerializer(data=data)
+            if item.is_valid():
+                valid[index] = item.validated_data
+            else:
+                results[index] = (None, item.errors)
+
+        classes = FitnessClass.objects.filter(
+            id__in={item['class_id'] for item in valid.values()},
+            is_active=True
+        ).in_bulk()
+        existing = set(Booking.objects.filter(
+            fitness_class_id__in=classes,
+            client_email__in={item['client_email'] for item in valid.values()},
+            is_cancelled=False
+        ).values_list('fitness_class_id', 'client_email'))
+
+        pending = {}
+        for index, item in valid.items():
+            key = (item['class_id'], item['client_email'])
+            fitness_class = classes.get(item['class_id'])
+            if fitness_class is None:
+                results[index] = (None, ["Invalid class ID or class not available"])
+            elif not fitness_class.is_upcoming:
+                results[index] = (None, ["Cannot book past classes"])
+            elif key in existing:
+                results[index] = (None, ["You've already booked this class. Multiple bookings not allowed."])
+            else:
+                # Also rejects the same client twice within the batch
+                existing.add(key)
+                item['fitness_class'] = fitness_class
+                pending[index] = item
+        return pending
+
+    def reject_overlaps(self, pending, results):
+        """
+        Reject items overlapping the client's bookings or an earlier item of
+        the batch, with one range query for the whole batch
+        """
+        if not pending:
+            return pending
+        classes = [item['fitness_class'] for item in pending.values()]
+        rows = UserBooking.overlapping(
+            {item['client_email'] for item in pending.values()},
+            min(fitness_class.scheduled_datetime for fitness_class in classes),
+            max(fitness_class.end_datetime for fitness_class in classes)
+        ).values(
+            'client_email', 'fitness_class_id', 'booking_reference',
+            'class_name', 'class_datetime', 'class_end'
+        )
+        schedules = {}
+        for row in rows:
+            schedules.setdefault(row['client_email'], []).append(row)
+
+        accepted = {}
+        for index, item in pending.items():
+            fitness_class = item['fitness_class']
+            start, end = fitness_class.scheduled_datetime, fitness_class.end_datetime
+            schedule = schedules.setdefault(item['client_email'], [])
+            conflicts = [
+                row for row in schedule
+                if row['class_datetime'] < end and row['class_end'] > start
+                and row['fitness_class_id'] != fitness_class.id
+            ]
+            if not conflicts and settings.INVENTORY_ENGINE:
+                conflicts = inventory.held_overlaps(
+                    item['client_email'], start, end, exclude=fitness_class.id
+                )
+            if conflicts:
+                results[index] = (None, {
+                    api_settings.NON_FIELD_ERRORS_KEY: [OVERLAP_MESSAGE],
+                    'conflicts': [conflict_data(row) for row in conflicts]
+                })
+                continue
+            # Later items of the same client must not overlap this one
+            schedule.append({
+                'fitness_class_id': fitness_class.id,
+                'booking_reference': None,
+                'class_name': fitness_class.name,
+                'class_datetime': start,
+                'class_end': end,
+            })
+            accepted[index] = item
+        return accepted
+
+    def book(self, pending, results, atomic):
+        """Take slots once per class and insert the granted bookings"""
+        # Checked in the transaction with the clients locked (in a fixed
+        # order), so a concurrent booking of one of them cannot slip past it
+        for email in sorted({item['client_email'] for item in pending.values()}):
+            UserBooking.lock_client(email)
+        accepted = self.reject_overlaps(pending, results)
+        if atomic and len(accepted) < len(pending):
+            raise BatchRejected(None)
+        pending = accepted
+
+        by_class = {}
+        for index, item in pending.items():
+            by_class.setdefault(item['class_id'], []).append(index)
+
+        granted = []
+        # Update classes in id order so concurrent batches cannot deadlock
+        for class_id in sorted(by_class):
+            indexes = by_class[class_id]
+            count = len(indexes)
+            if not atomic:
+                # Locked until commit, so the UPDATE below cannot miss by a
+                # concurrent booking and reject the whole class (SQLite's
+                # IMMEDIATE transactions already serialize writers)
+                available = FitnessClass.objects.select_for_update().filter(
+                    id=class_id
+                ).values_list('available_slots', flat=True).first() or 0
+                count = min(count, available)
+
+            if count and settings.INVENTORY_ENGINE:
+                count = self.take_inventory(class_id, count, atomic)
+                if count and self.taken and self.taken[-1][0] == class_id:
+                    indexes, count = self.hold_inventory(class_id, indexes, count, pending, results, atomic)
+
+            if count:
+                updated = FitnessClass.objects.filter(
+                    id=class_id,
+                    available_slots__gte=count
+                ).update(
+                    available_slots=F('available_slots') - count,
+                    slots_version=F('slots_version') + 1,
+                    updated_at=timezone.now()
+                )
+                if not updated:
+                    self.return_inventory(class_id)
+                    count = 0
+            if atomic and count < len(indexes):
+                raise BatchRejected(class_id)
+
+            pending[indexes[0]]['fitness_class'].available_slots -= count
+            if count:
+                publish_slots(class_id)
+            granted.extend(indexes[:count])
+            for index in indexes[count:]:
+                results[index] = (None, ["Sorry, this class is fully booked"])
+
+        rows = [
+            Booking(
+                fitness_class=pending[index]['fitness_class'],
+                client_name=pending[index]['client_name'],
+                client_email=pending[index]['client_email'],
+                booking_reference=generate_booking_reference()
+            )
+            for index in granted
+        ]
+        for attempt in range(REFERENCE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    bookings = Booking.objects.bulk_create(rows)
+                break
+            except IntegrityError as e:
+                # Another process issued one of the references: issue new ones
+                references = [row.booking_reference for row in rows]
+                if not is_reference_collision(e, references) or attempt == REFERENCE_ATTEMPTS - 1:
+                    raise
+                logger.warning("Booking reference collision, retrying: %s", e)
+                for row in rows:
+                    row.booking_reference = generate_booking_reference()
+        UserBooking.add_bookings(bookings)
+        for index, booking in zip(granted, bookings):
+            results[index] = (booking, None)
+
+        if bookings:
+            bump_schedule_version()
+            logger.info("Bulk booking created %d bookings", len(bookings))
+
+    def take_inventory(self, class_id, count, atomic):
+        """
+        Classes on sale give their seats from the inventory store before the
+        database counter, which lags behind by the unpersisted reservations.
+        Returns how many of count were granted.
+        """
+        store = inventory.get_store()
+        if not atomic:
+            available = store.available(class_id)
+            if available is None:
+                return count
+            count = min(count, max(available, 0))
+            if not count:
+                return 0
+
+        taken = store.take(class_id, count)
+        if taken is None:
+            return count
+        if not taken:
+            return 0
+        self.taken.append((class_id, count))
+        return count
+
+    def hold_inventory(self, class_id, indexes, count, pending, results, atomic):
+        """
+        Mark the clients granted seats of a class on sale as holders before
+        the insert, so a concurrent reservation cannot book them again.
+        Clients already holding a seat are rejected and their seats given
+        back; returns the remaining (indexes, count).
+        """
+        held = []
+        for index in indexes[:count]:
+            item = pending[index]
+            marked = inventory.hold(item['fitness_class'], item['client_email'])
+            if marked is False:
+                held.append(index)
+            elif marked:
+                self.holders.append((class_id, item['client_email']))
+        if not held:
+            return indexes, count
+        if atomic:
+            raise BatchRejected(class_id, "A booking for this client was created concurrently")
+
+        for index in held:
+            results[index] = (None, ["You've already booked this class. Multiple bookings not allowed."])
+        inventory.get_store().give_back(class_id, len(held))
+        self.taken[-1] = (class_id, count - len(held))
+        return [index for index in indexes if index not in held], count - len(held)
+
+    def return_inventory(self, class_id):
+        store = inventory.get_store()
+        for position, (taken_class, count) in enumerate(self.taken):
+            if taken_class == class_id:
+                store.give_back(class_id, count)
+                del self.taken[position]
+                break
+        for holder in [holder for holder in self.holders if holder[0] == class_id]:
+            store.remove_holder(*holder)
+            self.holders.remove(holder)
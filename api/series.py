@@ -0,0 +1,179 @@
+"""
+Recurring class series in the schedule.
+
+A ClassSeries stores its rule, not its occurrences. Occurrences before its
+materialized_until watermark are FitnessClass rows (created by the rolling
+`materialize_series` job); later ones are expanded on the fly for the page
+of the listing being viewed and merged with the stored classes in keyset
+order, so neither storage nor the listing grows with the series horizon.
+Unmaterialized occurrences are listed with "id": null and their series_id,
+booking one (series_id + scheduled_datetime) materializes it.
+
+In the keyset they sort by -series_id, before stored classes starting at
+the same time.
+"""
+import heapq
+from datetime import timedelta
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .filters import FALSE_VALUES, parse_boundary
+from .models import ClassSeries, FitnessClass
+from .pagination import query_params
+
+
+def filter_series(queryset, params):
+    """The series-level listing filters: class_type and instructor"""
+    class_type = params.get('class_type')
+    if class_type:
+        queryset = queryset.filter(class_type=class_type)
+
+    instructor = params.get('instructor')
+    if instructor:
+        queryset = queryset.filter(instructor_name__iexact=instructor)
+
+    return queryset
+
+
+def listing_window(params, position):
+    """[start, end) of the occurrences a listing request can show"""
+    start = timezone.now()
+    if params.get('date_from'):
+        start = max(start, parse_boundary(params['date_from'], 'date_from'))
+    if position is not None:
+        start = max(start, position[0])
+
+    if params.get('date_to'):
+        end = parse_boundary(params['date_to'], 'date_to', end_of_day=True) + timedelta(microseconds=1)
+    else:
+        end = timezone.now() + timedelta(days=settings.SERIES_LISTING_HORIZON_DAYS)
+    return start, end
+
+
+def series_occurrences(params, position, limit):
+    """
+    Up to `limit` unmaterialized occurrences after the cursor position, as
+    unsaved FitnessClass instances in keyset order
+    """
+    has_slots = params.get('has_slots')
+    if has_slots and has_slots.lower() in FALSE_VALUES:
+        # Nobody has booked them yet
+        return []
+
+    start, end = listing_window(params, position)
+    if start >= end:
+        return []
+    series_list = filter_series(ClassSeries.objects.filter(
+        Q(ends_on__isnull=True) | Q(ends_on__gte=(start - timedelta(days=1)).date()),
+        is_active=True,
+        starts_on__lte=end.date()
+    ), params)
+
+    def expand(series):
+        begin = max(start, series.materialized_until or start)
+        for moment in series.occurrences(begin, end):
+            if position is None or (moment, -series.pk) > position:
+                yield moment, -series.pk, series
+
+    merged = heapq.merge(*(expand(series) for series in series_list))
+
+    found = []
+    while len(found) < limit:
+        chunk = list(islice(merged, limit - len(found)))
+        if not chunk:
+            break
+        # Occurrences materialized ahead of the watermark by a booking
+        stored = set(FitnessClass.objects.filter(
+            series_id__in={series.pk for _, _, series in chunk},
+            scheduled_datetime__range=(chunk[0][0], chunk[-1][0])
+        ).values_list('series_id', 'scheduled_datetime'))
+        found.extend(
+            series.as_class(moment) for moment, _, series in chunk
+            if (series.pk, moment) not in stored
+        )
+    return found
+
+
+def merge_page(paginator, rows, occurrences, fields=None):
+    """Merge a page of stored rows with occurrences, as rows of `fields` when given"""
+    if fields is not None:
+        occurrences = [
+            {field: getattr(occurrence, field) for field in fields} for occurrence in occurrences
+        ]
+    merged = heapq.merge(rows, occurrences, key=paginator.row_key)
+    return paginator.finish_page(list(islice(merged, paginator.requested_page_size + 1)))
+
+
+def paginate_classes(paginator, queryset, request, fields=None):
+    """paginator.paginate_queryset for the listing, series occurrences included"""
+    rows = list(paginator.page_queryset(queryset, request))
+    occurrences = series_occurrences(
+        query_params(request), paginator.decode_cursor(request), paginator.requested_page_size + 1
+    )
+    return merge_page(paginator, rows, occurrences, fields)
+
+
+async def apaginate_classes(paginator, queryset, request, fields=None):
+    rows = [row async for row in paginator.page_queryset(queryset, request).aiterator()]
+    occurrences = await sync_to_async(series_occurrences)(
+        query_params(request), paginator.decode_cursor(request), paginator.requested_page_size + 1
+    )
+    return merge_page(paginator, rows, occurrences, fields)
+
+
+def find_occurrence(series_id, scheduled_datetime):
+    """
+    Return the FitnessClass of a series occurrence; unsaved if it was never
+    materialized, so that validating a booking writes nothing
+    """
+    try:
+        series = ClassSeries.objects.get(pk=series_id, is_active=True)
+    except ClassSeries.DoesNotExist:
+        raise ValidationError({'series_id': ["Invalid series ID or series not available"]})
+    if not series.occurs_at(scheduled_datetime):
+        raise ValidationError({'scheduled_datetime': ["The series has no class at this time"]})
+    if scheduled_datetime <= timezone.now():
+        raise ValidationError({'scheduled_datetime': ["Cannot book past classes"]})
+
+    fitness_class = FitnessClass.objects.filter(
+        series=series, scheduled_datetime=scheduled_datetime
+    ).first()
+    if fitness_class is not None:
+        return fitness_class
+    if series.materialized_until and scheduled_datetime < series.materialized_until:
+        # Materialized and since deleted: the occurrence was called off
+        raise ValidationError({'scheduled_datetime': ["This class is not available"]})
+    return series.as_class(scheduled_datetime)
+
+
+def materialize_occurrence(fitness_class):
+    """
+    Store an occurrence found by find_occurrence(), in the caller's booking
+    transaction; returns the stored class
+    """
+    if fitness_class.pk is not None:
+        return fitness_class
+    # A fresh instance: the caller's stays unsaved if its transaction rolls back
+    occurrence = fitness_class.series.as_class(fitness_class.scheduled_datetime)
+    try:
+        with transaction.atomic():
+            occurrence.save()
+    except IntegrityError:
+        # A concurrent booking materialized it first
+        occurrence = FitnessClass.objects.get(
+            series=occurrence.series, scheduled_datetime=occurrence.scheduled_datetime
+        )
+    return occurrence
+
+
+def materialize_window(days=None):
+    """Materialize every active series' occurrences for the next `days` days"""
+    until = timezone.now() + timedelta(days=days or settings.SERIES_MATERIALIZE_DAYS)
+    return {
+        series.pk: series.materialize(until)
+        for series in ClassSeries.objects.filter(is_active=True)
+    }
@@ -1,10 +1,55 @@
-from django.test import TestCase
-from django.urls import reverse 
+import asyncio
+import csv
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from datetime import time, timedelta
+from io import StringIO
+from unittest import skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError as ModelValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
-from rest_framework.test import APITestCase
+from django.utils.dateparse import parse_datetime
 from rest_framework import status
-from datetime import timedelta
-from .models import FitnessClass, Booking
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APITestCase
+from booking_app import settings_api
+from . import async_views, inventory, references
+from .analytics import refresh_rollups
+from .events import LocalBroker, set_broker
+from .idempotency import IdempotentRequest
+from .instrumentation import registry
+from .log import QueuedJSONHandler
+from .models import (
+    ClassDailyStats, ClassSeries, FitnessClass, Booking, RollupDirtyDay, UserBooking, WaitlistEntry,
+    is_duplicate_booking, is_reference_collision
+)
+from .references import NodeLease, ReferenceGenerator, is_valid_reference
+from .serializers import BookingCreateSerializer, BookingSerializer, BulkBookingSerializer
+from .timezones import resolve_timezone
+
+def create_class(name="Test Yoga", **fields):
+    """A FitnessClass tomorrow with 5 free slots, unless fields say otherwise"""
+    fields.setdefault('class_type', "yoga")
+    fields.setdefault('instructor_name', "Test Instructor")
+    fields.setdefault('scheduled_datetime', timezone.now() + timedelta(days=1))
+    fields.setdefault('total_slots', 5)
+    fields.setdefault('available_slots', fields['total_slots'])
+    return FitnessClass.objects.create(name=name, **fields)
 
 class FitnessClassModelTest(TestCase):
     def setUp(self):
@@ -110,3 +155,1803 @@ class BookingAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data['success'])
         self.assertEqual(len(response.data['data']), 1)
+
+class ClassListingPaginationTest(APITestCase):
+    def setUp(self):
+        base_time = timezone.now() + timedelta(days=1)
+        for i in range(5):
+            create_class(
+                f"Class {i}",
+                class_type="yoga" if i % 2 == 0 else "zumba",
+                instructor_name="Sarah Johnson" if i < 3 else "Mike Chen",
+                # two classes share a start time to exercise the id tiebreak
+                scheduled_datetime=base_time + timedelta(hours=i // 2),
+                available_slots=0 if i == 4 else 5
+            )
+        self.url = reverse('get_classes')
+
+    def test_cursor_walks_all_pages_in_order(self):
+        """Test that following next_cursor returns every class exactly once"""
+        seen = []
+        params = {'page_size': 2}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(item['name'] for item in response.data['data'])
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+
+        self.assertEqual(seen, [f"Class {i}" for i in range(5)])
+
+    def test_filters(self):
+        """Test class_type, instructor and has_slots filters"""
+        response = self.client.get(self.url, {'class_type': 'yoga', 'has_slots': 'true'})
+        self.assertEqual(
+            [item['name'] for item in response.data['data']], ['Class 0', 'Class 2']
+        )
+
+        response = self.client.get(self.url, {'instructor': 'mike chen'})
+        self.assertEqual(response.data['count'], 2)
+
+    def test_date_range_filter(self):
+        """Test that date_to excludes later classes"""
+        cutoff = FitnessClass.objects.get(name="Class 1").scheduled_datetime
+        response = self.client.get(self.url, {'date_to': cutoff.isoformat()})
+        self.assertEqual(response.data['count'], 2)
+
+    def test_invalid_params_rejected(self):
+        """Test that a bad cursor or filter returns 400"""
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.url, {'class_type': 'boxing'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ClassListingCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.fitness_class = create_class("Cached Pilates", class_type="pilates")
+        self.url = reverse('get_classes')
+
+    def test_repeat_request_served_from_cache(self):
+        """Test that a repeated listing runs no queries"""
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 1)
+
+    def test_booking_invalidates_listing(self):
+        """Test that a booking bumps the schedule version"""
+        self.client.get(self.url)
+        self.client.post(reverse('create_booking'), {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }, format='json')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['data'][0]['available_slots'], 4)
+
+    def test_conditional_request_returns_304(self):
+        """Test that a matching If-None-Match gets 304 without a query"""
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.fitness_class.name = "Renamed Pilates"
+        self.fitness_class.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+class SlotDecrementTest(TestCase):
+    def setUp(self):
+        self.fitness_class = create_class(
+            "Last Spot Zumba",
+            class_type="zumba",
+            total_slots=3,
+            available_slots=1
+        )
+
+    def test_last_slot_cannot_be_taken_twice(self):
+        """Test that two bookings validated against the last slot don't overbook"""
+        serializers = [
+            BookingCreateSerializer(data={
+                'class_id': self.fitness_class.id,
+                'client_name': name,
+                'client_email': f"{name}@example.com"
+            })
+            for name in ('first', 'second')
+        ]
+        for serializer in serializers:
+            self.assertTrue(serializer.is_valid())
+
+        serializers[0].save()
+        with self.assertRaises(ValidationError):
+            serializers[1].save()
+
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_check_constraint_rejects_invalid_slots(self):
+        """Test that the database refuses slots outside 0..total_slots"""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FitnessClass.objects.filter(pk=self.fitness_class.pk).update(
+                available_slots=F('total_slots') + 1
+            )
+
+class BookingQueryBudgetTest(APITestCase):
+    def setUp(self):
+        self.fitness_class = create_class("Budget HIIT", class_type="hiit")
+        self.url = reverse('create_booking')
+        self.data = {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }
+
+    def test_booking_query_budget(self):
+        """
+        Test the query budget of POST /api/book/: class fetch, overlap check,
+        slot update, booking and read model inserts, plus the savepoint pair
+        around them
+        """
+        with self.assertNumQueries(7):
+            response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['class_name'], "Budget HIIT")
+
+    def test_duplicate_caught_by_constraint(self):
+        """Test that a duplicate booking returns 400 and keeps the slot"""
+        self.client.post(self.url, self.data, format='json')
+        response = self.client.post(self.url, self.data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('already booked', str(response.data['errors']))
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 4)
+
+class BookingReferenceTest(TestCase):
+    def test_references_unique_and_time_ordered(self):
+        """Test that a burst of references never repeats and sorts by creation"""
+        generator = ReferenceGenerator(node_id=7)
+        references = [generator.generate() for _ in range(50000)]
+
+        self.assertEqual(len(set(references)), len(references))
+        self.assertEqual(references, sorted(references))
+        self.assertTrue(all(is_valid_reference(ref) for ref in references[:100]))
+
+    def test_check_character_catches_typos(self):
+        """Test that a single changed character fails validation"""
+        reference = ReferenceGenerator(node_id=1).generate()
+        typo = reference[:4] + ('1' if reference[4] != '1' else '2') + reference[5:]
+        self.assertFalse(is_valid_reference(typo))
+
+    def test_booking_gets_reference(self):
+        """Test that saving a booking assigns a valid reference"""
+        fitness_class = create_class("Reference Yoga")
+        booking = Booking.objects.create(
+            fitness_class=fitness_class,
+            client_name='Test User',
+            client_email='test@example.com'
+        )
+        self.assertTrue(is_valid_reference(booking.booking_reference))
+
+    def test_leases_distinct_node_ids(self):
+        """Test that processes sharing a cache never hold the same node id"""
+        store = caches['inventory']
+        store.clear()
+        first = NodeLease(store, start=5, timeout=60)
+        second = NodeLease(store, start=5, timeout=60)
+        self.assertEqual(first.node_id(), 5)
+        self.assertEqual(second.node_id(), 6)
+
+        # A lost lease is claimed again before the next reference
+        store.delete(first.key(5))
+        first.renew_at = 0
+        self.assertEqual(first.node_id(), 5)
+        store.set(first.key(5), 'someone else')
+        first.renew_at = 0
+        self.assertEqual(first.node_id(), 7)
+
+    def test_reference_collision_retried(self):
+        """Test that a booking whose reference is taken gets a new one"""
+        fitness_class = create_class("Collision Yoga")
+        taken = Booking.objects.create(
+            fitness_class=fitness_class,
+            client_name='First User',
+            client_email='first@example.com'
+        ).booking_reference
+
+        class Repeating:
+            """Issues a reference another process already used, then fresh ones"""
+            def __init__(self):
+                self.issued = [taken]
+
+            def generate(self):
+                return self.issued.pop() if self.issued else ReferenceGenerator(node_id=3).generate()
+
+        previous = references._generator, references._generator_pid
+        references._generator, references._generator_pid = Repeating(), os.getpid()
+        self.addCleanup(setattr, references, '_generator', previous[0])
+        self.addCleanup(setattr, references, '_generator_pid', previous[1])
+
+        response = self.client.post(reverse('create_booking'), {
+            'class_id': fitness_class.id,
+            'client_name': 'Second User',
+            'client_email': 'second@example.com'
+        }, content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(response.json()['data']['booking_reference'], taken)
+        fitness_class.refresh_from_db()
+        self.assertEqual(fitness_class.available_slots, 4)
+
+    def test_integrity_errors_told_apart(self):
+        """Test that duplicates and collisions are recognised by constraint name or by lookup"""
+        booking = Booking.objects.create(
+            fitness_class=create_class("Constraint Yoga"),
+            client_name='First User',
+            client_email='first@example.com'
+        )
+        # SQLite only says which kind of constraint failed
+        error = IntegrityError('UNIQUE constraint failed')
+        self.assertTrue(is_duplicate_booking(error, [(booking.fitness_class_id, 'first@example.com')]))
+        self.assertFalse(is_duplicate_booking(error, [(booking.fitness_class_id, 'other@example.com')]))
+        self.assertTrue(is_reference_collision(error, [booking.booking_reference]))
+        self.assertFalse(is_reference_collision(error, ['UNUSEDREFERENCE']))
+
+        # PostgreSQL names it
+        class Diag:
+            constraint_name = 'unique_active_booking'
+
+        class DriverError(Exception):
+            diag = Diag()
+
+        error.__cause__ = DriverError()
+        self.assertTrue(is_duplicate_booking(error, []))
+        self.assertFalse(is_reference_collision(error, [booking.booking_reference]))
+
+class BulkBookingAPITest(APITestCase):
+    def setUp(self):
+        self.yoga = create_class("Group Yoga", total_slots=10, available_slots=3)
+        self.hiit = create_class(
+            "Group HIIT",
+            class_type="hiit",
+            scheduled_datetime=timezone.now() + timedelta(days=2),
+            total_slots=10
+        )
+        self.url = reverse('create_bulk_booking')
+
+    def items(self, fitness_class, count, start=0):
+        return [
+            {
+                'class_id': fitness_class.id,
+                'client_name': f"Member {i}",
+                'client_email': f"member{i}@corp.example.com"
+            }
+            for i in range(start, start + count)
+        ]
+
+    def test_bulk_booking_creates_all(self):
+        """Test that a valid batch books everyone and takes slots per class"""
+        data = {'bookings': self.items(self.yoga, 2) + self.items(self.hiit, 4)}
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 6)
+        self.yoga.refresh_from_db()
+        self.hiit.refresh_from_db()
+        self.assertEqual(self.yoga.available_slots, 1)
+        self.assertEqual(self.hiit.available_slots, 6)
+        self.assertEqual(Booking.objects.count(), 6)
+
+    def test_atomic_mode_rejects_whole_batch(self):
+        """Test that one failing item books nobody in atomic mode"""
+        data = {'bookings': self.items(self.hiit, 2) + self.items(self.yoga, 4)}
+        response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(Booking.objects.count(), 0)
+        self.hiit.refresh_from_db()
+        self.assertEqual(self.hiit.available_slots, 10)
+
+    def test_best_effort_books_while_slots_last(self):
+        """Test per-item results in best-effort mode"""
+        items = self.items(self.yoga, 4) + [{'class_id': self.hiit.id, 'client_name': 'No Email'}]
+        response = self.client.post(self.url, {'mode': 'best_effort', 'bookings': items}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [result['success'] for result in response.data['results']],
+            [True, True, True, False, False]
+        )
+        self.assertIn('client_email', response.data['results'][4]['errors'])
+        self.yoga.refresh_from_db()
+        self.assertEqual(self.yoga.available_slots, 0)
+
+    def test_duplicates_rejected(self):
+        """Test that existing and in-batch duplicates fail"""
+        Booking.objects.create(
+            fitness_class=self.hiit,
+            client_name='Member 0',
+            client_email='member0@corp.example.com'
+        )
+        items = self.items(self.hiit, 2) + self.items(self.hiit, 1, start=1)
+        response = self.client.post(self.url, {'mode': 'best_effort', 'bookings': items}, format='json')
+
+        self.assertEqual(
+            [result['success'] for result in response.data['results']],
+            [False, True, False]
+        )
+
+class TimezoneConversionTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        resolve_timezone.cache_clear()
+        for i in range(3):
+            create_class(
+                f"Timezone Class {i}",
+                class_type="cardio",
+                scheduled_datetime=timezone.now() + timedelta(days=1, hours=i)
+            )
+        self.url = reverse('get_classes')
+
+    def test_header_converts_listing(self):
+        """Test that X-Timezone sets the offset of scheduled_datetime_local"""
+        response = self.client.get(self.url, HTTP_X_TIMEZONE='America/New_York')
+        local = response.data['data'][0]['scheduled_datetime_local']
+        self.assertRegex(local, r'-0[45]:00$')
+
+        response = self.client.get(self.url)
+        self.assertTrue(response.data['data'][0]['scheduled_datetime_local'].endswith('+05:30'))
+
+    def test_unknown_timezone_logged_once(self):
+        """Test that a bad header is resolved and logged once, not per row"""
+        with self.assertLogs('api.timezones', level='WARNING') as logs:
+            response = self.client.get(self.url, HTTP_X_TIMEZONE='Mars/Olympus_Mons')
+            self.client.get(self.url, {'page_size': 2}, HTTP_X_TIMEZONE='Mars/Olympus_Mons')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(logs.output), 1)
+
+class ListingContractTest(APITestCase):
+    """The API_FAST_SERIALIZATION path must render the same bytes as DRF"""
+
+    def setUp(self):
+        base_time = timezone.now() + timedelta(days=1)
+        for i, name in enumerate(["Café Flow", "Line\u2028Break \"Yoga\"", "Plain HIIT"]):
+            fitness_class = create_class(
+                name,
+                instructor_name="Zoë Ünal",
+                scheduled_datetime=base_time + timedelta(hours=i, microseconds=i)
+            )
+            Booking.objects.create(
+                fitness_class=fitness_class,
+                client_name='Test User',
+                client_email='test@example.com'
+            )
+
+    def fetch_both(self, url, params=None, **headers):
+        contents = []
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(API_FAST_SERIALIZATION=fast):
+                response = self.client.get(url, params, **headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            contents.append(response.content)
+        return contents
+
+    def test_classes_identical(self):
+        """Test that both paths render the class listing identically"""
+        slow, fast = self.fetch_both(reverse('get_classes'), {'page_size': 2})
+        self.assertEqual(slow, fast)
+
+        slow, fast = self.fetch_both(
+            reverse('get_classes'), HTTP_X_TIMEZONE='America/Los_Angeles'
+        )
+        self.assertEqual(slow, fast)
+
+    def test_bookings_identical(self):
+        """Test that both paths render the user bookings identically"""
+        slow, fast = self.fetch_both(reverse('get_user_bookings'), {'email': 'test@example.com'})
+        self.assertEqual(slow, fast)
+
+class ExportTest(APITestCase):
+    def setUp(self):
+        self.fitness_class = create_class("Export Pilates", class_type="pilates")
+        for i in range(3):
+            Booking.objects.create(
+                fitness_class=self.fitness_class,
+                client_name=f"User {i}",
+                client_email=f"user{i}@example.com",
+                is_cancelled=(i == 2)
+            )
+        self.admin = User.objects.create_user('ops', password='secret', is_staff=True)
+
+    def test_export_requires_staff(self):
+        """Test that anonymous users cannot export"""
+        response = self.client.get(reverse('export_data', args=['bookings']))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_ndjson_export_streams_filtered_rows(self):
+        """Test NDJSON export with the is_cancelled filter"""
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(
+            reverse('export_data', args=['bookings']), {'is_cancelled': 'false'}
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['client_name'] for row in rows], ['User 0', 'User 1'])
+        self.assertEqual(rows[0]['class_name'], "Export Pilates")
+
+    def test_csv_export(self):
+        """Test CSV export of classes"""
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('export_data', args=['classes']), {'output': 'csv'})
+
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(rows[0]['name'], "Export Pilates")
+
+    def test_export_command(self):
+        """Test the export_data management command"""
+        out = StringIO()
+        call_command('export_data', 'bookings', '--is-cancelled', 'true', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['client_name'] for row in rows], ['User 2'])
+
+class PopulateDBCommandTest(TestCase):
+    def populate(self, **options):
+        call_command('populate_db', stdout=StringIO(), **options)
+        return list(FitnessClass.objects.order_by('scheduled_datetime', 'name').values_list(
+            'name', 'scheduled_datetime', 'total_slots', 'available_slots'
+        ))
+
+    def test_seed_is_deterministic(self):
+        """Test that the same seed generates the same schedule"""
+        first = self.populate(classes=30, bookings=100, seed=42)
+        second = self.populate(classes=30, bookings=100, seed=42)
+        self.assertEqual(first, second)
+
+    def test_slots_match_bookings(self):
+        """Test that available_slots agrees with the active bookings created"""
+        self.populate(classes=40, bookings=300, seed=1, cancel_rate=0.1, popular_ratio=0.25)
+
+        self.assertEqual(Booking.objects.count(), 300)
+        self.assertEqual(Booking.objects.filter(is_cancelled=True).count(), 30)
+        for fitness_class in FitnessClass.objects.all():
+            active = fitness_class.bookings.filter(is_cancelled=False).count()
+            self.assertEqual(fitness_class.available_slots, fitness_class.total_slots - active)
+        # the popular quarter of the classes is filled up
+        self.assertGreaterEqual(FitnessClass.objects.filter(available_slots=0).count(), 10)
+
+class CancellationWaitlistTest(APITestCase):
+    def setUp(self):
+        self.fitness_class = create_class("Full Spin", class_type="cardio", total_slots=1)
+        response = self.client.post(reverse('create_booking'), {
+            'class_id': self.fitness_class.id,
+            'client_name': 'First User',
+            'client_email': 'first@example.com'
+        }, format='json')
+        self.reference = response.data['data']['booking_reference']
+        self.cancel_url = reverse('cancel_booking', args=[self.reference])
+
+    def join(self, name):
+        return self.client.post(reverse('join_waitlist'), {
+            'class_id': self.fitness_class.id,
+            'client_name': name,
+            'client_email': f"{name}@example.com"
+        }, format='json')
+
+    def test_cancel_restores_slot(self):
+        """Test that cancelling with nobody waiting gives the slot back"""
+        response = self.client.post(self.cancel_url, {'client_email': 'first@example.com'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['data']['slot_passed_to_waitlist'])
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 1)
+
+        response = self.client.post(self.cancel_url, {'client_email': 'first@example.com'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cancel_requires_matching_email(self):
+        """Test that the reference alone cannot cancel someone else's booking"""
+        response = self.client.post(self.cancel_url, {'client_email': 'other@example.com'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_waitlist_promoted_in_fifo_order(self):
+        """Test that a cancellation books the longest-waiting client"""
+        self.assertEqual(self.join('second').data['data']['position'], 1)
+        self.assertEqual(self.join('third').data['data']['position'], 2)
+
+        response = self.client.post(self.cancel_url, {'client_email': 'first@example.com'}, format='json')
+        self.assertTrue(response.data['data']['slot_passed_to_waitlist'])
+
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+        self.assertTrue(Booking.objects.filter(
+            client_email='second@example.com', is_cancelled=False
+        ).exists())
+        self.assertEqual(
+            list(WaitlistEntry.objects.values_list('client_email', flat=True)),
+            ['third@example.com']
+        )
+
+    def test_waitlist_only_for_full_classes(self):
+        """Test that classes with free slots cannot be waitlisted"""
+        self.client.post(self.cancel_url, {'client_email': 'first@example.com'}, format='json')
+        response = self.join('second')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class AsyncReadViewsTest(APITestCase):
+    """The async read views must answer exactly like the sync ones"""
+
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        base_time = timezone.now() + timedelta(days=1)
+        for i in range(3):
+            fitness_class = create_class(
+                f"Async Class {i}",
+                class_type="hiit",
+                scheduled_datetime=base_time + timedelta(hours=i)
+            )
+            Booking.objects.create(
+                fitness_class=fitness_class,
+                client_name='Test User',
+                client_email='test@example.com'
+            )
+
+    async def test_classes_match_sync_view(self):
+        """Test the async listing against the sync one, page by page"""
+        params = {'page_size': 2}
+        for _ in range(2):
+            await cache.aclear()
+            expected = await self.async_client.get(reverse('get_classes'), params)
+            await cache.aclear()
+            response = await async_views.get_classes(
+                self.factory.get(reverse('get_classes'), params)
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.content, expected.content)
+            params['cursor'] = json.loads(response.content)['next_cursor']
+
+    async def test_bookings_match_sync_view(self):
+        """Test the async user bookings against the sync one"""
+        for email in ('test@example.com', 'nobody@example.com'):
+            expected = await self.async_client.get(reverse('get_user_bookings'), {'email': email})
+            response = await async_views.get_user_bookings(
+                self.factory.get(reverse('get_user_bookings'), {'email': email})
+            )
+            self.assertEqual(response.content, expected.content)
+
+    async def test_listing_cache_shared_with_sync_view(self):
+        """Test that async-cached pages are served to the sync view, with the same validators"""
+        await cache.aclear()
+        response = await async_views.get_classes(self.factory.get(reverse('get_classes')))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Bypasses save(), so the schedule version stays: only a cache hit shows the old names
+        await FitnessClass.objects.aupdate(name='Renamed')
+        expected = await self.async_client.get(reverse('get_classes'))
+        self.assertEqual(expected['ETag'], response['ETag'])
+        self.assertEqual(expected.content, response.content)
+
+    async def test_invalid_filter_returns_400(self):
+        """Test that filter errors use the same envelope"""
+        response = await async_views.get_classes(
+            self.factory.get(reverse('get_classes'), {'has_slots': 'maybe'})
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('has_slots', json.loads(response.content)['errors'])
+
+class InstrumentationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        self.fitness_class = create_class("Timed Yoga")
+
+    def test_server_timing_counts_queries(self):
+        """Test that the Server-Timing header reports the view's queries"""
+        response = self.client.post(reverse('create_booking'), {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }, format='json')
+
+        timing = response['Server-Timing']
+        self.assertIn('desc="7 queries"', timing)
+        for metric in ('app;dur=', 'db;dur=', 'ser;dur='):
+            self.assertIn(metric, timing)
+
+    def test_metrics_endpoint(self):
+        """Test the Prometheus histograms after one listing request"""
+        self.client.get(reverse('get_classes'))
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('booking_requests_total{view="get_classes",status="200"} 1', body)
+        self.assertIn('booking_request_duration_seconds_count{view="get_classes"} 1', body)
+        self.assertIn('booking_db_queries_bucket{view="get_classes",le="+Inf"} 1', body)
+        self.assertIn('booking_response_bytes_sum{view="get_classes"}', body)
+
+    def test_metrics_local_only(self):
+        """Test that remote addresses can't scrape the metrics"""
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_untouched(self):
+        """Test that sampling can switch the instrumentation off"""
+        response = self.client.get(reverse('get_classes'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(registry.requests, {})
+
+class IdempotencyAndThrottleTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.classes = [
+            create_class(
+                f"Retry Zumba {i}",
+                class_type="zumba",
+                scheduled_datetime=timezone.now() + timedelta(days=1, hours=i)
+            )
+            for i in range(3)
+        ]
+        self.url = reverse('create_booking')
+
+    def book(self, fitness_class, key=None, email='test@example.com'):
+        headers = {'Idempotency-Key': key} if key else {}
+        return self.client.post(self.url, {
+            'class_id': fitness_class.id,
+            'client_name': 'Test User',
+            'client_email': email
+        }, format='json', headers=headers)
+
+    def test_retry_replays_first_response(self):
+        """Test that a retry with the same key is answered from the cache"""
+        first = self.book(self.classes[0], key='retry-1')
+        with self.assertNumQueries(0):
+            retry = self.book(self.classes[0], key='retry-1')
+
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.classes[0].refresh_from_db()
+        self.assertEqual(self.classes[0].available_slots, 4)
+
+    def test_key_reused_for_other_request(self):
+        """Test that reusing a key with a different body returns 422"""
+        self.book(self.classes[0], key='retry-2')
+        response = self.book(self.classes[1], key='retry-2')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_key_in_progress(self):
+        """Test that a retry racing the original request gets 409"""
+        IdempotentRequest('book', 'retry-3', {
+            'class_id': self.classes[0].id,
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }).begin()
+        response = self.book(self.classes[0], key='retry-3')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Booking.objects.exists())
+
+    @override_settings(BOOKING_THROTTLE_RATES={'email': '2/min', 'ip': '100/min'})
+    def test_email_bucket_sheds_excess(self):
+        """Test that the third booking in a burst is throttled before the database"""
+        for fitness_class in self.classes[:2]:
+            self.assertEqual(self.book(fitness_class).status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(0):
+            response = self.book(self.classes[2])
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertFalse(response.data['success'])
+        self.assertEqual(response['Retry-After'], '30')
+
+        # Other clients keep their own bucket
+        response = self.book(self.classes[2], email='other@example.com')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+@override_settings(INVENTORY_ENGINE=True, INVENTORY_FLUSH_INTERVAL=0, INVENTORY_ALLOW_LOCAL_STORE=True)
+class InventoryEngineTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        caches['inventory'].clear()
+        self.fitness_class = create_class(
+            "Flash Sale HIIT",
+            class_type="hiit",
+            instructor_name="Popular Instructor",
+            total_slots=3,
+            available_slots=2
+        )
+        Booking.objects.create(
+            fitness_class=self.fitness_class,
+            client_name='Early Bird',
+            client_email='early@example.com'
+        )
+        inventory.open_class(self.fitness_class)
+        self.url = reverse('create_booking')
+
+    def tearDown(self):
+        # Don't leave queued reservations to the next test
+        inventory.get_writer().flush()
+
+    def book(self, email):
+        return self.client.post(self.url, {
+            'class_id': self.fitness_class.id,
+            'client_name': 'Flash Client',
+            'client_email': email
+        }, format='json')
+
+    def test_sale_answered_from_store(self):
+        """Test that sold-out and duplicate requests make no queries, bookings one overlap check"""
+        with self.assertNumQueries(2):
+            responses = [self.book(f"flash{i}@example.com") for i in range(3)]
+            duplicate = self.book('early@example.com')
+
+        self.assertEqual(
+            [response.status_code for response in responses],
+            [status.HTTP_201_CREATED, status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST]
+        )
+        self.assertIn('fully booked', str(responses[2].data['errors']))
+        self.assertEqual(responses[0].data['data']['class_name'], "Flash Sale HIIT")
+        self.assertIn('already booked', str(duplicate.data['errors']))
+
+        self.assertEqual(inventory.get_writer().flush(), 2)
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+        self.assertEqual(
+            Booking.objects.filter(fitness_class=self.fitness_class, is_cancelled=False).count(), 3
+        )
+        self.assertTrue(Booking.objects.filter(
+            booking_reference=responses[0].data['data']['booking_reference']
+        ).exists())
+
+    def test_reservation_checks_overlaps(self):
+        """Test that a seat is not reserved over the client's other classes, written or not"""
+        other = create_class("Same Time Spin", scheduled_datetime=self.fitness_class.scheduled_datetime)
+        self.client.post(self.url, {
+            'class_id': other.id, 'client_name': 'Busy', 'client_email': 'busy@example.com'
+        }, format='json')
+
+        response = self.book('busy@example.com')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors']['conflicts'][0]['class_name'], "Same Time Spin")
+        self.assertEqual(inventory.get_store().available(self.fitness_class.id), 2)
+
+        # The other way round, while the reservation is still unwritten
+        self.assertEqual(self.book('flash1@example.com').status_code, status.HTTP_201_CREATED)
+        response = self.client.post(self.url, {
+            'class_id': other.id, 'client_name': 'Flash', 'client_email': 'flash1@example.com'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['errors']['conflicts'][0]['class_name'], "Flash Sale HIIT")
+
+    def test_deactivated_class_goes_off_sale(self):
+        """Test that saving a class as inactive stops its sale"""
+        self.fitness_class.is_active = False
+        self.fitness_class.save()
+
+        self.assertIsNone(inventory.get_store().snapshot(self.fitness_class.id))
+        response = self.book('flash1@example.com')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('not available', str(response.data['errors']))
+        self.assertFalse(inventory.open_class(self.fitness_class))
+
+    def test_cancellation_frees_store_seat(self):
+        """Test that a cancelled seat can be sold again from the store"""
+        self.book('flash1@example.com')
+        self.book('flash2@example.com')
+        inventory.get_writer().flush()
+
+        booking = Booking.objects.get(client_email='flash1@example.com')
+        self.client.post(
+            reverse('cancel_booking', args=[booking.booking_reference]),
+            {'client_email': 'flash1@example.com'}, format='json'
+        )
+        self.assertEqual(inventory.get_store().available(self.fitness_class.id), 1)
+        self.assertEqual(self.book('flash1@example.com').status_code, status.HTTP_201_CREATED)
+
+    def test_waitlist_skips_clients_holding_seats(self):
+        """Test that a promotion doesn't book a client whose reservation is still in flight"""
+        self.book('flash1@example.com')
+        self.book('flash2@example.com')
+        inventory.get_writer().flush()
+        store = inventory.get_store()
+        store.add_holder(self.fitness_class.id, 'waiting@example.com', self.fitness_class.scheduled_datetime)
+        WaitlistEntry.objects.create(
+            fitness_class=self.fitness_class, client_name='Waiting', client_email='waiting@example.com'
+        )
+
+        booking = Booking.objects.get(client_email='flash1@example.com')
+        self.client.post(
+            reverse('cancel_booking', args=[booking.booking_reference]),
+            {'client_email': 'flash1@example.com'}, format='json'
+        )
+        self.assertFalse(Booking.objects.filter(client_email='waiting@example.com').exists())
+        self.assertEqual(store.available(self.fitness_class.id), 1)
+
+    def test_bulk_booking_takes_store_seats(self):
+        """Test that group bookings draw from the store of a class on sale"""
+        response = self.client.post(reverse('create_bulk_booking'), {
+            'mode': 'atomic',
+            'bookings': [
+                {'class_id': self.fitness_class.id, 'client_name': 'A', 'client_email': 'a@example.com'},
+                {'class_id': self.fitness_class.id, 'client_name': 'B', 'client_email': 'b@example.com'},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(inventory.get_store().available(self.fitness_class.id), 0)
+        self.assertEqual(self.book('c@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.book('a@example.com').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_booking_holds_clients_first(self):
+        """Test that group bookings don't book a client whose reservation is still in flight"""
+        store = inventory.get_store()
+        store.add_holder(self.fitness_class.id, 'a@example.com', self.fitness_class.scheduled_datetime)
+        items = [
+            {'class_id': self.fitness_class.id, 'client_name': 'A', 'client_email': 'a@example.com'},
+            {'class_id': self.fitness_class.id, 'client_name': 'B', 'client_email': 'b@example.com'},
+        ]
+
+        response = self.client.post(reverse('create_bulk_booking'), {
+            'mode': 'atomic', 'bookings': items
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(store.available(self.fitness_class.id), 2)
+        # The rolled back batch left no marker behind for B
+        self.assertTrue(store.add_holder(self.fitness_class.id, 'b@example.com',
+                                         self.fitness_class.scheduled_datetime))
+        store.remove_holder(self.fitness_class.id, 'b@example.com')
+
+        response = self.client.post(reverse('create_bulk_booking'), {
+            'mode': 'best_effort', 'bookings': items
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertFalse(Booking.objects.filter(client_email='a@example.com').exists())
+        self.assertEqual(store.available(self.fitness_class.id), 1)
+
+    def test_pending_reservations_replayed(self):
+        """Test that reservations a dead worker never wrote are persisted from the store"""
+        reference = self.book('flash1@example.com').data['data']['booking_reference']
+        # The worker dies with its queue
+        writer = inventory.get_writer()
+        while not writer.queue.empty():
+            writer.queue.get_nowait()
+
+        self.assertEqual(inventory.replay([self.fitness_class.id]), 1)
+        self.assertTrue(Booking.objects.filter(booking_reference=reference).exists())
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 1)
+        self.assertEqual(inventory.replay([self.fitness_class.id]), 0)
+
+    def test_written_reservations_not_replayed(self):
+        """Test that a reservation replayed elsewhere is not written twice by its own writer"""
+        self.book('flash1@example.com')
+        store = inventory.get_store()
+        pending = store.pending(self.fitness_class.id)
+        with inventory.get_writer().lock:
+            inventory.get_writer().persist(self.fitness_class.id, [
+                {key: value for key, value in booking.items() if key != 'pending_key'}
+                for booking in pending
+            ])
+        self.assertEqual(inventory.get_writer().flush(), 0)
+        self.assertEqual(Booking.objects.filter(client_email='flash1@example.com').count(), 1)
+
+    @override_settings(INVENTORY_ALLOW_LOCAL_STORE=False)
+    def test_local_store_refused(self):
+        """Test that classes don't go on sale in a store that dies with the process"""
+        with self.assertRaises(CommandError):
+            call_command('inventory', 'open', str(self.fitness_class.id), stdout=StringIO())
+
+    def test_reconcile_fixes_drift(self):
+        """Test that reconcile matches available_slots to the confirmed bookings"""
+        FitnessClass.objects.filter(pk=self.fitness_class.pk).update(available_slots=3)
+        with self.assertLogs('api.inventory', 'WARNING'):
+            corrected = inventory.reconcile([self.fitness_class.id])
+        self.assertEqual(corrected, {self.fitness_class.id: (3, 2)})
+        self.assertEqual(inventory.reconcile([self.fitness_class.id]), {})
+
+class UserBookingReadModelTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        base_time = timezone.now() + timedelta(days=1)
+        self.classes = []
+        for i in range(3):
+            fitness_class = create_class(
+                f"Listing Yoga {i}",
+                scheduled_datetime=base_time + timedelta(hours=i)
+            )
+            self.classes.append(fitness_class)
+            self.client.post(reverse('create_booking'), {
+                'class_id': fitness_class.id,
+                'client_name': 'Test User',
+                'client_email': 'test@example.com'
+            }, format='json')
+        self.url = reverse('get_user_bookings')
+
+    def test_listing_is_one_query(self):
+        """Test that a page of bookings is a single read model query"""
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'email': 'test@example.com'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['data'][0]['class_name'], "Listing Yoga 2")
+
+    def test_cursor_pages(self):
+        """Test that next_cursor walks the bookings newest first"""
+        response = self.client.get(self.url, {'email': 'test@example.com', 'page_size': 2})
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get(self.url, {
+            'email': 'test@example.com', 'page_size': 2, 'cursor': response.data['next_cursor']
+        })
+        self.assertEqual([item['class_name'] for item in response.data['data']], ["Listing Yoga 0"])
+        self.assertIsNone(response.data['next_cursor'])
+
+    def test_cancel_and_reschedule_update_rows(self):
+        """Test that cancellations drop rows and class edits are copied"""
+        booking = Booking.objects.get(fitness_class=self.classes[0])
+        self.client.post(
+            reverse('cancel_booking', args=[booking.booking_reference]),
+            {'client_email': 'test@example.com'}, format='json'
+        )
+        fitness_class = self.classes[1]
+        fitness_class.name = "Renamed Yoga"
+        fitness_class.scheduled_datetime += timedelta(days=1)
+        fitness_class.save()
+
+        data = self.client.get(self.url, {'email': 'test@example.com'}).data['data']
+        self.assertEqual([item['class_name'] for item in data], ["Listing Yoga 2", "Renamed Yoga"])
+        self.assertEqual(
+            data[1]['class_datetime'],
+            BookingSerializer(Booking.objects.get(fitness_class=fitness_class)).data['class_datetime']
+        )
+
+    def test_rebuild_command(self):
+        """Test that the read model can be recreated from the bookings"""
+        UserBooking.objects.all().delete()
+        call_command('rebuild_user_bookings', stdout=StringIO())
+        self.assertEqual(UserBooking.objects.count(), 3)
+
+class AnalyticsTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        studio = resolve_timezone('Asia/Kolkata')
+        # A Monday 07:00 and 18:00 in the studio
+        day = (timezone.now() + timedelta(days=7)).astimezone(studio).replace(
+            hour=7, minute=0, second=0, microsecond=0
+        )
+        self.day = day - timedelta(days=day.weekday())
+        self.yoga = self.create_class("yoga", "Sarah Johnson", self.day)
+        self.hiit = self.create_class("hiit", "Mike Chen", self.day.replace(hour=18))
+        for i in range(3):
+            Booking.objects.create(
+                fitness_class=self.yoga,
+                client_name=f"User {i}",
+                client_email=f"user{i}@example.com",
+                is_cancelled=(i == 2)
+            )
+        FitnessClass.objects.filter(pk=self.yoga.pk).update(available_slots=F('available_slots') - 2)
+        # Booked two days ahead
+        Booking.objects.filter(fitness_class=self.yoga).update(
+            booking_datetime=self.day - timedelta(days=2)
+        )
+        self.admin = User.objects.create_user('ops', password='secret', is_staff=True)
+        self.url = reverse('analytics')
+
+    def create_class(self, class_type, instructor, scheduled):
+        return create_class(
+            f"Analytics {class_type}",
+            class_type=class_type,
+            instructor_name=instructor,
+            scheduled_datetime=scheduled,
+            total_slots=4
+        )
+
+    def test_requires_staff(self):
+        """Test that anonymous users cannot read analytics"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_report_by_class_type(self):
+        """Test fill rate, cancellation rate and lead time per class type"""
+        refresh_rollups()
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(response.data['refreshed_at'])
+        hiit, yoga = response.data['data']
+        self.assertEqual(yoga['class_type'], 'yoga')
+        self.assertEqual(yoga['booked_slots'], 2)
+        self.assertEqual(yoga['fill_rate'], 0.5)
+        self.assertEqual(yoga['cancellation_rate'], round(1 / 3, 4))
+        self.assertEqual(yoga['avg_lead_time_hours'], 48)
+        self.assertEqual(hiit['fill_rate'], 0)
+        self.assertIsNone(hiit['cancellation_rate'])
+
+    def test_studio_local_dimensions(self):
+        """Test that weekday and hour are in studio time"""
+        refresh_rollups()
+        self.client.force_authenticate(self.admin)
+        data = self.client.get(self.url, {'group_by': 'weekday,hour'}).data['data']
+        self.assertEqual([(row['weekday'], row['hour']) for row in data], [(1, 7), (1, 18)])
+
+        response = self.client.get(self.url, {
+            'group_by': 'instructor', 'date_from': (self.day + timedelta(days=1)).date().isoformat()
+        })
+        self.assertEqual(response.data['count'], 0)
+
+    def test_invalid_params(self):
+        """Test that unknown dimensions and bad dates are rejected"""
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(self.url, {'group_by': 'colour'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'date_to': 'soon'})
+        self.assertIn('date_to', response.data['errors'])
+
+    def test_incremental_refresh(self):
+        """Test that only days with changed classes are recomputed"""
+        self.assertEqual(refresh_rollups(), 1)
+        # Changes from before the watermark's safety margin are not looked at again
+        FitnessClass.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(refresh_rollups(), 0)
+
+        booking = Booking.objects.filter(fitness_class=self.yoga, is_cancelled=False).first()
+        self.client.post(
+            reverse('cancel_booking', args=[booking.booking_reference]),
+            {'client_email': booking.client_email}, format='json'
+        )
+        self.assertEqual(refresh_rollups(), 1)
+        stats = ClassDailyStats.objects.get(class_type='yoga')
+        self.assertEqual((stats.booked_slots, stats.cancellations), (1, 2))
+
+    def test_rescheduled_and_deleted_classes_leave_their_day(self):
+        """Test that an incremental refresh drops a class from the day it left"""
+        refresh_rollups()
+        self.yoga.scheduled_datetime += timedelta(days=1)
+        self.yoga.save()
+        refresh_rollups()
+        self.assertEqual(
+            list(ClassDailyStats.objects.filter(class_type='yoga').values_list('date', flat=True)),
+            [self.day.date() + timedelta(days=1)]
+        )
+
+        FitnessClass.objects.filter(pk=self.hiit.pk).delete()
+        refresh_rollups()
+        self.assertFalse(ClassDailyStats.objects.filter(class_type='hiit').exists())
+        self.assertFalse(RollupDirtyDay.objects.exists())
+
+    def test_command_prints_report(self):
+        """Test the analytics management command"""
+        out = StringIO()
+        call_command('analytics', '--group-by', 'date', stdout=out, stderr=StringIO())
+        report = json.loads(out.getvalue())
+        self.assertEqual(report[0]['date'], self.day.date().isoformat())
+        self.assertEqual(report[0]['classes'], 2)
+
+class ClassSeriesTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        today = timezone.now().astimezone(resolve_timezone('Asia/Kolkata')).date()
+        self.series = ClassSeries.objects.create(
+            name="Morning Flow",
+            class_type="yoga",
+            instructor_name="Sarah Johnson",
+            total_slots=10,
+            weekdays="1,3,5",
+            start_time=time(7, 0),
+            starts_on=today + timedelta(days=1)
+        )
+        self.one_off = create_class(
+            "Single HIIT",
+            class_type="hiit",
+            instructor_name="Mike Chen",
+            scheduled_datetime=timezone.now() + timedelta(days=2)
+        )
+        self.url = reverse('get_classes')
+        self.date_to = (today + timedelta(days=14)).isoformat()
+
+    def walk(self, page_size, **params):
+        items, cursor = [], None
+        while True:
+            query = {'page_size': page_size, 'date_to': self.date_to, **params}
+            if cursor:
+                query['cursor'] = cursor
+            data = self.client.get(self.url, query).data
+            items.extend(data['data'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                return items
+
+    def test_invalid_weekdays_and_timezone_rejected(self):
+        """Test that a series the listing could not expand is never stored"""
+        for field, value in (('weekdays', 'mon,wed'), ('weekdays', '0,8'), ('timezone', 'Mars/Olympus')):
+            original = getattr(self.series, field)
+            setattr(self.series, field, value)
+            with self.assertRaises(ModelValidationError) as raised:
+                self.series.full_clean()
+            self.assertIn(field, raised.exception.message_dict)
+            setattr(self.series, field, original)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ClassSeries.objects.filter(pk=self.series.pk).update(weekdays='mon,wed')
+        self.assertEqual(self.client.get(reverse('get_classes')).status_code, status.HTTP_200_OK)
+
+    def test_listing_expands_occurrences_without_storing(self):
+        """Test that occurrences are listed without creating rows"""
+        items = self.walk(100)
+        occurrences = [item for item in items if item['series_id'] == self.series.id]
+        self.assertEqual(len(occurrences), 6)
+        self.assertTrue(all(item['id'] is None for item in occurrences))
+        self.assertTrue(all(item['scheduled_datetime_local'].endswith('T07:00:00+05:30') for item in occurrences))
+        self.assertEqual(FitnessClass.objects.count(), 1)
+
+    def test_cursor_walks_merged_listing(self):
+        """Test that small pages return every class once, in order"""
+        items = self.walk(2)
+        self.assertEqual(items, self.walk(100))
+        self.assertEqual(len(items), 7)
+        times = [item['scheduled_datetime'] for item in items]
+        self.assertEqual(times, sorted(times))
+
+    def test_filters_apply_to_occurrences(self):
+        """Test that class_type and has_slots filter series occurrences"""
+        self.assertEqual(self.walk(100, class_type='hiit'), self.walk(100, instructor='mike chen'))
+        self.assertEqual(len(self.walk(100, class_type='hiit')), 1)
+        self.assertEqual(self.walk(100, has_slots='false'), [])
+
+    def test_booking_materializes_occurrence(self):
+        """Test that the first booking of an occurrence creates its class"""
+        occurrence = next(item for item in self.walk(100) if item['series_id'])
+        response = self.client.post(reverse('create_booking'), {
+            'series_id': self.series.id,
+            'scheduled_datetime': occurrence['scheduled_datetime'],
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['data']['class_name'], "Morning Flow")
+        fitness_class = FitnessClass.objects.get(series=self.series)
+        self.assertEqual(fitness_class.available_slots, 9)
+
+        listed = [item for item in self.walk(100) if item['scheduled_datetime'] == occurrence['scheduled_datetime']]
+        self.assertEqual([(item['id'], item['available_slots']) for item in listed], [(fitness_class.id, 9)])
+
+        # The next booking goes to the same row
+        self.client.post(reverse('create_booking'), {
+            'series_id': self.series.id,
+            'scheduled_datetime': occurrence['scheduled_datetime'],
+            'client_name': 'Other User',
+            'client_email': 'other@example.com'
+        }, format='json')
+        self.assertEqual(FitnessClass.objects.get(series=self.series).available_slots, 8)
+
+    def test_rejected_booking_materializes_nothing(self):
+        """Test that validating or rejecting an occurrence booking leaves no class behind"""
+        occurrence = next(item for item in self.walk(100) if item['series_id'])
+        data = {
+            'series_id': self.series.id,
+            'scheduled_datetime': occurrence['scheduled_datetime'],
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }
+        self.assertTrue(BookingCreateSerializer(data=data).is_valid())
+        self.assertFalse(FitnessClass.objects.filter(series=self.series).exists())
+
+        busy = create_class("Same Time Spin", scheduled_datetime=parse_datetime(occurrence['scheduled_datetime']))
+        self.client.post(reverse('create_booking'), {
+            'class_id': busy.id, 'client_name': 'Test User', 'client_email': 'test@example.com'
+        }, format='json')
+        response = self.client.post(reverse('create_booking'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(FitnessClass.objects.filter(series=self.series).exists())
+
+    def test_booking_rejects_times_off_the_rule(self):
+        """Test that only times of the series can be booked"""
+        response = self.client.post(reverse('create_booking'), {
+            'series_id': self.series.id,
+            'scheduled_datetime': (timezone.now() + timedelta(days=3)).isoformat(),
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('scheduled_datetime', response.data['errors'])
+
+        response = self.client.post(reverse('create_booking'), {
+            'client_name': 'Test User', 'client_email': 'test@example.com'
+        }, format='json')
+        self.assertIn('class_id', response.data['errors'])
+
+    def test_materialize_command(self):
+        """Test the rolling window job stores occurrences once"""
+        listed = self.walk(100)
+        call_command('materialize_series', '--days', '7', stdout=StringIO())
+        call_command('materialize_series', '--days', '7', stdout=StringIO())
+
+        self.series.refresh_from_db()
+        self.assertIsNotNone(self.series.materialized_until)
+        stored = FitnessClass.objects.filter(series=self.series).count()
+        self.assertEqual(stored, 3)
+
+        after = self.walk(100)
+        self.assertEqual(
+            [item['scheduled_datetime'] for item in after],
+            [item['scheduled_datetime'] for item in listed]
+        )
+        self.assertEqual(sum(1 for item in after if item['series_id'] and item['id']), stored)
+
+    def test_fast_path_identical(self):
+        """Test that occurrences render the same on both serialization paths"""
+        contents = []
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(API_FAST_SERIALIZATION=fast):
+                contents.append(self.client.get(self.url, {'page_size': 3}).content)
+        self.assertEqual(*contents)
+
+    async def test_async_listing_identical(self):
+        """Test that the async listing merges occurrences the same way"""
+        await cache.aclear()
+        expected = await self.async_client.get(self.url, {'page_size': 3})
+        await cache.aclear()
+        response = await async_views.get_classes(
+            AsyncRequestFactory().get(self.url, {'page_size': 3})
+        )
+        self.assertEqual(json.loads(response.content), expected.json())
+
+class SlotStreamTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.broker = LocalBroker()
+        self.addCleanup(set_broker, set_broker(self.broker))
+        self.fitness_class = create_class("Stream Yoga")
+        self.url = reverse('stream_slots')
+
+    def book(self, email):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('create_booking'), {
+                'class_id': self.fitness_class.id,
+                'client_name': 'Test User',
+                'client_email': email
+            }, format='json')
+
+    def cancel(self, booking_reference, email):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('cancel_booking', args=[booking_reference]),
+                {'client_email': email}, format='json'
+            )
+
+    def capture_events(self):
+        """Collect the published events instead of delivering them, as if the class were streamed"""
+        published = []
+        self.broker.publish = published.append
+        self.broker.has_subscribers = lambda class_id: True
+        return published
+
+    async def open_stream(self, ids):
+        response = await async_views.stream_slots(AsyncRequestFactory().get(self.url, {'ids': ids}))
+        chunks = asyncio.Queue()
+
+        async def consume():
+            async for chunk in response:
+                await chunks.put(chunk.decode())
+
+        return response, chunks, asyncio.create_task(consume())
+
+    async def close_stream(self, task):
+        # A disconnecting client cancels the stream
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    def test_unwatched_class_not_read(self):
+        """Test that a booking nobody streams adds no query after the commit"""
+        published = []
+        self.broker.publish = published.append
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('create_booking'), {
+                'class_id': self.fitness_class.id,
+                'client_name': 'Test User',
+                'client_email': 'test@example.com'
+            }, format='json')
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(published, [])
+
+    async def test_stream_pushes_slot_counts(self):
+        """Test a snapshot followed by the counts after a booking and a cancellation"""
+        response, chunks, task = await self.open_stream(f"{self.fitness_class.id},999")
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        snapshot = await asyncio.wait_for(chunks.get(), 5)
+        self.assertEqual(snapshot, (
+            'event: snapshot\n'
+            f'data: {{"class_id": {self.fitness_class.id}, "available_slots": 5, "version": 0}}\n\n'
+        ))
+
+        booked = await sync_to_async(self.book)('test@example.com')
+        event = await asyncio.wait_for(chunks.get(), 5)
+        self.assertEqual(event, (
+            'event: slots\n'
+            f'data: {{"class_id": {self.fitness_class.id}, "available_slots": 4, "version": 1}}\n\n'
+        ))
+
+        await sync_to_async(self.cancel)(booked.data['data']['booking_reference'], 'test@example.com')
+        event = await asyncio.wait_for(chunks.get(), 5)
+        self.assertIn('"available_slots": 5, "version": 2', event)
+
+        # Closing the stream unsubscribes it
+        await self.close_stream(task)
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    async def test_stream_drops_events_in_snapshot(self):
+        """Test that a change queued before the snapshot was read is not sent again"""
+        published = self.capture_events()
+        await sync_to_async(self.book)('first@example.com')
+        del self.broker.publish, self.broker.has_subscribers
+
+        _, chunks, task = await self.open_stream(str(self.fitness_class.id))
+        try:
+            snapshot = await asyncio.wait_for(chunks.get(), 5)
+            self.assertIn('"available_slots": 4, "version": 1', snapshot)
+
+            # Delivered after the snapshot, as if committed between subscribe and read
+            self.broker.publish(published[0])
+            await sync_to_async(self.book)('second@example.com')
+            event = await asyncio.wait_for(chunks.get(), 5)
+            self.assertIn('"available_slots": 3, "version": 2', event)
+        finally:
+            await self.close_stream(task)
+
+    def test_rolled_back_booking_publishes_nothing(self):
+        """Test that only committed changes are published"""
+        published = self.capture_events()
+        self.book('test@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('create_booking'), {
+                'class_id': self.fitness_class.id,
+                'client_name': 'Test User',
+                'client_email': 'test@example.com'
+            }, format='json')
+        self.assertEqual(published, [
+            {'class_id': self.fitness_class.id, 'available_slots': 4, 'version': 1}
+        ])
+
+    def test_requires_asgi_and_ids(self):
+        """Test the errors for WSGI requests and bad ids"""
+        response = self.client.get(self.url, {'ids': self.fitness_class.id})
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+        for ids in ('', 'yoga'):
+            response = async_to_sync(async_views.stream_slots)(
+                AsyncRequestFactory().get(self.url, {'ids': ids})
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class StructuredLoggingTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'api.log')
+
+    def handler(self, **options):
+        handler = QueuedJSONHandler(self.path, **options)
+        self.addCleanup(handler.close)
+        return handler
+
+    def read(self, handler):
+        handler.stop()
+        with open(self.path) as log:
+            return [json.loads(line) for line in log]
+
+    def test_booking_log_carries_request_id(self):
+        """Test JSON records with the request ID and extra fields"""
+        handler = self.handler()
+        api_logger = logging.getLogger('api')
+        api_logger.addHandler(handler)
+        self.addCleanup(api_logger.removeHandler, handler)
+        fitness_class = create_class("Logged Yoga")
+
+        response = self.client.post(reverse('create_booking'), {
+            'class_id': fitness_class.id,
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }, format='json', HTTP_X_REQUEST_ID='trace-123')
+
+        self.assertEqual(response['X-Request-ID'], 'trace-123')
+        record = next(entry for entry in self.read(handler) if entry['logger'] == 'api.serializers')
+        self.assertEqual(record['request_id'], 'trace-123')
+        self.assertEqual(record['level'], 'INFO')
+        self.assertEqual(record['booking_reference'], response.data['data']['booking_reference'])
+        self.assertEqual(record['message'], f"New booking created: {record['booking_reference']}")
+
+    def test_django_request_records_carry_request_id(self):
+        """Test that error responses logged by Django keep the request ID"""
+        handler = self.handler()
+        request_logger = logging.getLogger('django.request')
+        request_logger.addHandler(handler)
+        self.addCleanup(request_logger.removeHandler, handler)
+
+        self.client.post(reverse('create_booking'), {}, format='json', HTTP_X_REQUEST_ID='trace-400')
+        record = next(entry for entry in self.read(handler) if entry['logger'] == 'django.request')
+        self.assertEqual((record['request_id'], record['status_code']), ('trace-400', 400))
+
+    def test_request_id_generated_when_missing_or_invalid(self):
+        """Test that unusable X-Request-ID headers are replaced"""
+        response = self.client.get(reverse('get_classes'), HTTP_X_REQUEST_ID='bad id\n')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_exception_and_lazy_arguments(self):
+        """Test that arguments and tracebacks are rendered before queueing"""
+        handler = self.handler()
+        record = logging.LogRecord('api.test', logging.ERROR, __file__, 1, "Failed %s", ('once',), None)
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record.exc_info = sys.exc_info()
+        handler.handle(record)
+
+        entry, = self.read(handler)
+        self.assertEqual(entry['message'], 'Failed once')
+        self.assertIn('ValueError: boom', entry['exception'])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test that a stalled writer never blocks the logging thread"""
+        handler = self.handler(queue_size=1)
+        handler.stop()
+        for i in range(3):
+            handler.handle(logging.LogRecord('api.test', logging.INFO, __file__, 1, f"record {i}", None, None))
+        self.assertEqual(handler.dropped, 2)
+
+    @skipUnless(hasattr(os, 'fork'), "needs fork()")
+    def test_forked_process_starts_own_listener(self):
+        """Test that a worker forked after logging was set up still writes its records"""
+        handler = self.handler()
+        handler.handle(logging.LogRecord('api.test', logging.INFO, __file__, 1, "parent", None, None))
+        pid = os.fork()
+        if pid == 0:
+            try:
+                handler.handle(logging.LogRecord('api.test', logging.INFO, __file__, 1, "child", None, None))
+                handler.stop()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertCountEqual([entry['message'] for entry in self.read(handler)], ['parent', 'child'])
+
+    def test_rotation(self):
+        """Test that the file is rotated by size"""
+        handler = self.handler(max_bytes=500, backup_count=2)
+        for i in range(20):
+            handler.handle(logging.LogRecord('api.test', logging.INFO, __file__, 1, f"record {i}", None, None))
+        handler.stop()
+        self.assertTrue(os.path.exists(self.path + '.1'))
+
+class OverlapDetectionTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.start = timezone.now() + timedelta(days=1)
+        self.yoga = self.create_class("Overlap Yoga", self.start, 60)
+        self.url = reverse('create_booking')
+        self.booking = self.book(self.yoga).data['data']
+
+    def create_class(self, name, scheduled, duration):
+        return create_class(name, scheduled_datetime=scheduled, duration_minutes=duration)
+
+    def book(self, fitness_class, email='test@example.com'):
+        return self.client.post(self.url, {
+            'class_id': fitness_class.id,
+            'client_name': 'Test User',
+            'client_email': email
+        }, format='json')
+
+    def test_overlap_reported_with_conflicts(self):
+        """Test that an overlapping booking is rejected and the conflict named"""
+        hiit = self.create_class("Overlap HIIT", self.start + timedelta(minutes=30), 45)
+        response = self.book(hiit)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['errors']
+        self.assertIn('overlaps', str(errors['non_field_errors']))
+        conflict, = errors['conflicts']
+        self.assertEqual(conflict['booking_reference'], self.booking['booking_reference'])
+        self.assertEqual(conflict['class_datetime'], self.booking['class_datetime'])
+        hiit.refresh_from_db()
+        self.assertEqual(hiit.available_slots, 5)
+
+    def test_long_class_starting_earlier_conflicts(self):
+        """Test a new class inside a longer class booked earlier"""
+        retreat = self.create_class("Overlap Retreat", self.start + timedelta(hours=2), 600)
+        self.book(retreat)
+        nap = self.create_class("Overlap Nidra", self.start + timedelta(hours=8), 30)
+        conflicts = self.book(nap).data['errors']['conflicts']
+        self.assertEqual([conflict['class_name'] for conflict in conflicts], ["Overlap Retreat"])
+
+    def test_back_to_back_and_other_clients_allowed(self):
+        """Test that adjacent classes and other clients' bookings don't conflict"""
+        next_class = self.create_class("Overlap Next", self.start + timedelta(minutes=60), 60)
+        self.assertEqual(self.book(next_class).status_code, status.HTTP_201_CREATED)
+        same_time = self.create_class("Overlap Same", self.start, 60)
+        self.assertEqual(self.book(same_time, 'other@example.com').status_code, status.HTTP_201_CREATED)
+
+    def test_cancelled_and_rescheduled_bookings(self):
+        """Test that the check follows cancellations and reschedules"""
+        hiit = self.create_class("Overlap HIIT", self.start + timedelta(minutes=30), 45)
+        self.yoga.scheduled_datetime = self.start + timedelta(hours=3)
+        self.yoga.save()
+        self.assertEqual(self.book(hiit).status_code, status.HTTP_201_CREATED)
+
+        clash = self.create_class("Overlap Clash", self.start + timedelta(hours=3, minutes=15), 30)
+        self.assertEqual(self.book(clash).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.post(
+            reverse('cancel_booking', args=[self.booking['booking_reference']]),
+            {'client_email': 'test@example.com'}, format='json'
+        )
+        self.assertEqual(self.book(clash).status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_rejects_overlaps(self):
+        """Test overlaps with existing bookings and within the batch"""
+        early = self.create_class("Overlap Early", self.start + timedelta(minutes=30), 60)
+        late = self.create_class("Overlap Late", self.start + timedelta(hours=2), 60)
+        later = self.create_class("Overlap Later", self.start + timedelta(hours=2, minutes=30), 60)
+        response = self.client.post(reverse('create_bulk_booking'), {
+            'mode': 'best_effort',
+            'bookings': [
+                {'class_id': early.id, 'client_name': 'Test User', 'client_email': 'test@example.com'},
+                {'class_id': late.id, 'client_name': 'Test User', 'client_email': 'test@example.com'},
+                {'class_id': later.id, 'client_name': 'Test User', 'client_email': 'test@example.com'},
+            ]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.data['results']
+        self.assertEqual([result['success'] for result in results], [False, True, False])
+        self.assertEqual(
+            results[0]['errors']['conflicts'][0]['booking_reference'], self.booking['booking_reference']
+        )
+        self.assertIsNone(results[2]['errors']['conflicts'][0]['booking_reference'])
+
+    def test_interleaved_requests_checked_in_transaction(self):
+        """Test that two overlapping requests validated before either is saved cannot both book"""
+        pilates = self.create_class("Overlap Pilates", self.start + timedelta(hours=3), 60)
+        zumba = self.create_class("Overlap Zumba", self.start + timedelta(hours=3, minutes=30), 60)
+        first, second = (
+            BookingCreateSerializer(data={
+                'class_id': fitness_class.id,
+                'client_name': 'Test User',
+                'client_email': 'test@example.com'
+            })
+            for fitness_class in (pilates, zumba)
+        )
+        self.assertTrue(first.is_valid())
+        self.assertTrue(second.is_valid())
+
+        first.save()
+        with self.assertRaises(ValidationError) as raised:
+            second.save()
+        self.assertEqual(raised.exception.detail['conflicts'][0]['class_name'], "Overlap Pilates")
+        zumba.refresh_from_db()
+        self.assertEqual(zumba.available_slots, 5)
+
+    def test_interleaved_bulk_requests_checked_in_transaction(self):
+        """Test that a group booking validated before an overlapping booking is saved cannot book"""
+        pilates = self.create_class("Overlap Pilates", self.start + timedelta(hours=3), 60)
+        zumba = self.create_class("Overlap Zumba", self.start + timedelta(hours=3, minutes=30), 60)
+        test_case = self
+
+        class InterleavedBulkBooking(BulkBookingSerializer):
+            def book(self, pending, results, atomic):
+                # The other booking commits after the items were validated
+                test_case.book(pilates, 'test@example.com')
+                return super().book(pending, results, atomic)
+
+        bulk = InterleavedBulkBooking(data={'mode': 'atomic', 'bookings': [
+            {'class_id': zumba.id, 'client_name': 'Test User', 'client_email': 'test@example.com'},
+            {'class_id': zumba.id, 'client_name': 'Friend', 'client_email': 'friend@example.com'},
+        ]})
+        self.assertTrue(bulk.is_valid())
+
+        results = bulk.save()
+        self.assertEqual(results[0][1]['conflicts'][0]['class_name'], "Overlap Pilates")
+        self.assertEqual(results[1][1], ["Not booked: another item in the batch failed"])
+        zumba.refresh_from_db()
+        self.assertEqual(zumba.available_slots, 5)
+
+    def test_waitlist_skips_overlapping_clients(self):
+        """Test that a freed slot skips waitlisted clients now booked at the same time"""
+        hiit = self.create_class("Overlap HIIT", self.start + timedelta(minutes=30), 45)
+        holder = self.book(hiit, 'holder@example.com').data['data']
+        for email in ('test@example.com', 'next@example.com'):
+            WaitlistEntry.objects.create(fitness_class=hiit, client_name='Test User', client_email=email)
+
+        response = self.client.post(
+            reverse('cancel_booking', args=[holder['booking_reference']]),
+            {'client_email': 'holder@example.com'}, format='json'
+        )
+        self.assertTrue(response.data['data']['slot_passed_to_waitlist'])
+        self.assertEqual(
+            list(hiit.bookings.filter(is_cancelled=False).values_list('client_email', flat=True)),
+            ['next@example.com']
+        )
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+class APISettingsProfileTest(APITestCase):
+    def test_setup_skips_unused_apps(self):
+        """Test that the API-only profile loads neither the admin nor the sessions stack"""
+        code = (
+            "import sys, django\n"
+            "django.setup()\n"
+            "print(' '.join(sys.modules))\n"
+            "from django.urls import get_resolver\n"
+            "print(' '.join(str(pattern.pattern) for pattern in get_resolver().url_patterns))\n"
+            "print(' '.join(sys.modules))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env={
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': 'booking_app.settings_api',
+                'LOG_FILE': settings.LOG_FILE,
+                'API_ASYNC_VIEWS': 'False',
+            },
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        after_setup, urls, after_urls = (line.split() for line in result.stdout.splitlines())
+
+        for module in ('django.contrib.admin', 'django.contrib.sessions',
+                       'django.contrib.messages', 'django.contrib.staticfiles'):
+            self.assertNotIn(module, after_setup)
+        self.assertEqual(urls, ['api/'])
+        # Staff-only modules wait for their endpoints
+        self.assertIn('api.views', after_urls)
+        self.assertNotIn('api.analytics', after_urls)
+        self.assertNotIn('api.exports', after_urls)
+        # So do the async views, unless API_ASYNC_VIEWS selects them
+        self.assertNotIn('api.async_views', after_urls)
+
+    @override_settings(
+        MIDDLEWARE=settings_api.MIDDLEWARE,
+        REST_FRAMEWORK=settings_api.REST_FRAMEWORK,
+        TEMPLATES=settings_api.TEMPLATES
+    )
+    def test_api_without_sessions(self):
+        """Test bookings and Basic auth staff endpoints on the slim middleware"""
+        fitness_class = create_class("Slim Yoga", instructor_name="Sarah Johnson")
+        response = self.client.post(reverse('create_booking'), {
+            'class_id': fitness_class.id,
+            'client_name': 'Test User',
+            'client_email': 'test@example.com'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('X-Request-ID', response)
+
+        User.objects.create_user('ops', password='secret', is_staff=True)
+        credentials = b64encode(b'ops:secret').decode()
+        response = self.client.get(reverse('analytics'), HTTP_AUTHORIZATION=f"Basic {credentials}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ConcurrentBookingTest(TransactionTestCase):
+    """Parallel writers on the real (WAL) test database"""
+
+    def setUp(self):
+        cache.clear()
+        self.fitness_class = create_class("Race Yoga")
+
+    def book(self, i):
+        try:
+            response = APIClient().post(reverse('create_booking'), {
+                'class_id': self.fitness_class.id,
+                'client_name': f"Racer {i}",
+                'client_email': f"racer{i}@example.com"
+            }, format='json')
+            return response.status_code
+        finally:
+            connection.close()
+
+    def test_parallel_bookings_never_overbook(self):
+        """Test that 20 concurrent clients get exactly the 5 slots"""
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            codes = list(pool.map(self.book, range(20)))
+
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), 5)
+        self.assertEqual(codes.count(status.HTTP_400_BAD_REQUEST), 15)
+        self.fitness_class.refresh_from_db()
+        self.assertEqual(self.fitness_class.available_slots, 0)
+        self.assertEqual(Booking.objects.count(), 5)
+
+    def test_sqlite_profile(self):
+        """Test that connections run in WAL mode with synchronous=NORMAL"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite profile only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+class QueryPlanTest(TestCase):
+    """The hot queries must be answered from an index, not a table scan"""
+
+    def setUp(self):
+        self.fitness_class = create_class("Plan Yoga")
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Tiny test tables would otherwise always be scanned
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        for line in plan.splitlines():
+            self.assertNotRegex(line, r'\bSCAN api_|Seq Scan')
+
+    def test_listing_uses_partial_index(self):
+        """Test the get_classes query shape"""
+        queryset = FitnessClass.objects.filter(
+            scheduled_datetime__gt=timezone.now(),
+            is_active=True
+        ).order_by('scheduled_datetime', 'id')[:21]
+        self.assertUsesIndex(queryset, 'class_active_schedule_idx')
+
+    def test_user_bookings_listing_index(self):
+        """Test the get_user_bookings read model query shape"""
+        queryset = UserBooking.objects.filter(
+            client_email='test@example.com'
+        ).order_by('-booking_datetime', '-booking_id')[:21]
+        self.assertUsesIndex(queryset, 'user_booking_listing_idx')
+
+    def test_overlap_check_uses_schedule_index(self):
+        """Test the overlap range query shape"""
+        start = self.fitness_class.scheduled_datetime
+        queryset = UserBooking.overlapping(['test@example.com'], start, start + timedelta(hours=1))
+        self.assertUsesIndex(queryset, 'user_booking_schedule_idx')
+
+    def test_duplicate_check_uses_unique_index(self):
+        """Test the duplicate booking lookup shape"""
+        queryset = Booking.objects.filter(
+            fitness_class=self.fitness_class,
+            client_email='test@example.com',
+            is_cancelled=False
+        )
+        self.assertUsesIndex(queryset, 'unique_active_booking')
+
+    def test_rebooking_after_cancellation(self):
+        """Test that only active bookings are unique per class and email"""
+        Booking.objects.create(
+            fitness_class=self.fitness_class,
+            client_name='Test User',
+            client_email='test@example.com',
+            is_cancelled=True
+        )
+        Booking.objects.create(
+            fitness_class=self.fitness_class,
+            client_name='Test User',
+            client_email='test@example.com'
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Booking.objects.create(
+                fitness_class=self.fitness_class,
+                client_name='Test User',
+                client_email='test@example.com'
+            )
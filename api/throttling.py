@@ -0,0 +1,71 @@
+"""
+Token-bucket rate limiting for the booking endpoint.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    '10/min' -> (10, 10 / 60): bucket capacity and tokens refilled per second.
+    Same format as DRF throttle rates; None or '' disables the bucket.
+    """
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / DURATIONS[period[0]]
+
+
+class BookingRateThrottle(BaseThrottle):
+    """
+    One token bucket per client email and one per IP (BOOKING_THROTTLE_RATES).
+    A request needs a token from each bucket; a burst up to the capacity goes
+    through, after that requests are admitted at the refill rate.
+
+    Buckets live in the default cache. The read-modify-write is not atomic, so
+    under heavy concurrency a few extra requests may slip through; the point
+    is to shed retry storms, not to enforce an exact quota.
+    """
+    cache = default_cache
+    scope = 'book'
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_buckets(self, request):
+        rates = settings.BOOKING_THROTTLE_RATES
+        buckets = []
+        if parse_rate(rates.get('ip')):
+            buckets.append((f"throttle:{self.scope}:ip:{self.get_ident(request)}", rates['ip']))
+
+        email = request.data.get('client_email') if hasattr(request.data, 'get') else None
+        if isinstance(email, str) and email.strip() and parse_rate(rates.get('email')):
+            buckets.append((f"throttle:{self.scope}:email:{email.strip().lower()}", rates['email']))
+        return buckets
+
+    def allow_request(self, request, view):
+        now = time.time()
+        states = []
+        for key, rate in self.get_buckets(request):
+            capacity, refill = parse_rate(rate)
+            tokens, updated = self.cache.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            states.append((key, tokens, capacity, refill))
+
+        short = [(1 - tokens) / refill for _, tokens, _, refill in states if tokens < 1]
+        if short:
+            self.retry_after = max(short)
+            return False
+
+        for key, tokens, capacity, refill in states:
+            # Kept until the bucket would be full again anyway
+            self.cache.set(key, (tokens - 1, now), timeout=int(capacity / refill) + 1)
+        return True
+
+    def wait(self):
+        return self.retry_after
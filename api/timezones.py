@@ -0,0 +1,45 @@
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from django.core.exceptions import ValidationError
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEZONE = 'Asia/Kolkata'
+TIMEZONE_HEADER = 'HTTP_X_TIMEZONE'
+
+
+@lru_cache(maxsize=256)
+def resolve_timezone(name):
+    """
+    Return the tzinfo for an IANA zone name, or None if it is unknown.
+    Results are cached, so an unknown zone is only logged once per process.
+    """
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError, OSError):
+        logger.warning("Unknown timezone: %s, returning class time unchanged", name)
+        return None
+
+
+def validate_timezone(value):
+    """Model field validator: an IANA zone name known to this server"""
+    if resolve_timezone(value) is None:
+        raise ValidationError(f"Unknown timezone: {value}")
+
+
+def get_request_timezone(context):
+    """
+    Resolve the X-Timezone header of the request in a serializer context.
+    The result is stored on the context, which list serializers share with
+    their child, so a page is converted with a single lookup.
+    """
+    if '_tzinfo' not in context:
+        request = context.get('request')
+        if request is not None and hasattr(request, 'META'):
+            context['_tzinfo'] = resolve_timezone(
+                request.META.get(TIMEZONE_HEADER, DEFAULT_TIMEZONE)
+            )
+        else:
+            context['_tzinfo'] = None
+    return context['_tzinfo']
@@ -1,8 +1,24 @@
-from django.urls import path
-from . import views
+from django.conf import settings
+from django.urls import path, re_path
+from . import instrumentation, views
+
+# Imported only when selected, so WSGI processes never load the async views
+if settings.API_ASYNC_VIEWS:
+    from . import async_views as read_views
+    stream_slots = read_views.stream_slots
+else:
+    read_views = views
+    stream_slots = views.stream_unavailable
 
 urlpatterns = [
-    path('classes/', views.get_classes, name='get_classes'),
+    path('classes/', read_views.get_classes, name='get_classes'),
+    path('classes/stream/', stream_slots, name='stream_slots'),
     path('book/', views.create_booking, name='create_booking'),
-    path('bookings/', views.get_user_bookings, name='get_user_bookings'),
+    path('book/bulk/', views.create_bulk_booking, name='create_bulk_booking'),
+    path('bookings/', read_views.get_user_bookings, name='get_user_bookings'),
+    path('bookings/<str:booking_reference>/cancel/', views.cancel_user_booking, name='cancel_booking'),
+    path('waitlist/', views.join_waitlist, name='join_waitlist'),
+    path('analytics/', views.analytics, name='analytics'),
+    path('metrics/', instrumentation.metrics, name='metrics'),
+    re_path(r'^export/(?P<kind>bookings|classes)/$', views.export_data, name='export_data'),
 ]
\ No newline at end of file
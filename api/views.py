@@ -1,15 +1,38 @@
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db import transaction
-from .models import FitnessClass, Booking
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from .models import FitnessClass, UserBooking, WaitlistEntry
+from . import inventory
+from .cache import cache_listing, get_cached_listing, listing_cache_key
+from .fastpath import (
+    CLASS_FIELDS, USER_BOOKING_FIELDS, FastJSONResponse,
+    booking_rows, class_rows, user_booking_rows
+)
+from .filters import filter_classes
+from .idempotency import IdempotentRequest, KeyReused, RequestInProgress
+from .instrumentation import timed_serialization
+from .pagination import KeysetPagination, UserBookingPagination
+from .throttling import BookingRateThrottle
+from .timezones import get_request_timezone
+from .series import paginate_classes
 from .serializers import (
     FitnessClassSerializer, 
     BookingCreateSerializer, 
-    BookingSerializer
+    BookingSerializer,
+    BulkBookingItemSerializer,
+    BulkBookingSerializer,
+    WaitlistJoinSerializer
 )
+from .waitlist import cancel_booking
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
@@ -17,29 +40,67 @@ logger = logging.getLogger(__name__)
 def get_classes(request):
     """
     GET /api/classes
-    Returns list of upcoming fitness classes with available slots
+    Returns a page of upcoming fitness classes, ordered by start time.
+
+    Query params: date_from, date_to, class_type, instructor, has_slots,
+    page_size and cursor (the next_cursor of the previous page)
     """
     try:
-        # Only show upcoming classes that are active
-        classes = FitnessClass.objects.filter(
-            scheduled_datetime__gt=timezone.now(),
-            is_active=True
-        ).order_by('scheduled_datetime')
-        
-        serializer = FitnessClassSerializer(
-            classes, 
-            many=True, 
-            context={'request': request}
+        cache_key = listing_cache_key(request)
+        entry = get_cached_listing(cache_key)
+
+        if entry is None:
+            # Only show upcoming classes that are active
+            classes = FitnessClass.objects.filter(
+                scheduled_datetime__gt=timezone.now(),
+                is_active=True
+            )
+            classes = filter_classes(classes, request.query_params)
+
+            paginator = KeysetPagination()
+            if settings.API_FAST_SERIALIZATION:
+                page = paginate_classes(
+                    paginator, classes.values(*CLASS_FIELDS), request, fields=CLASS_FIELDS
+                )
+                with timed_serialization():
+                    data = class_rows(page, get_request_timezone({'request': request}))
+            else:
+                page = paginate_classes(paginator, classes, request)
+                with timed_serialization():
+                    data = FitnessClassSerializer(
+                        page, 
+                        many=True, 
+                        context={'request': request}
+                    ).data
+
+            entry = cache_listing(cache_key, {
+                'success': True,
+                'data': data,
+                'count': len(data),
+                'next_cursor': paginator.next_cursor
+            })
+
+        response_class = FastJSONResponse if settings.API_FAST_SERIALIZATION else Response
+        response = response_class(entry['body'], headers={
+            'ETag': entry['etag'],
+            'Last-Modified': http_date(entry['last_modified']),
+        })
+        patch_vary_headers(response, ['X-Timezone'])
+        return get_conditional_response(
+            request,
+            etag=entry['etag'],
+            last_modified=entry['last_modified'],
+            response=response
         )
-        
+
+    except ValidationError as e:
         return Response({
-            'success': True,
-            'data': serializer.data,
-            'count': len(serializer.data)
-        })
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
         
     except Exception as e:
-        logger.error(f"Error fetching classes: {str(e)}")
+        logger.exception("Error fetching classes: %s", e)
         return Response({
             'success': False,
             'error': 'Something went wrong while fetching classes'
@@ -49,9 +110,54 @@ def get_classes(request):
 def create_booking(request):
     """
     POST /api/book
-    Creates a new booking for a fitness class
+    Creates a new booking for a fitness class. A retry with the same
+    Idempotency-Key header gets the first response replayed.
     """
+    idempotent = None
+    key = request.headers.get('Idempotency-Key')
+    if key:
+        try:
+            idempotent = IdempotentRequest('book', key, request.data)
+            replay = idempotent.begin()
+        except ValidationError as e:
+            return Response({
+                'success': False,
+                'errors': e.detail
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except (RequestInProgress, KeyReused) as e:
+            return Response({
+                'success': False,
+                'error': e.detail
+            }, status=e.status_code)
+
+        if replay is not None:
+            status_code, body = replay
+            return Response(body, status=status_code, headers={'Idempotent-Replayed': 'true'})
+
+    # Shed retry storms before they reach the database
+    throttle = BookingRateThrottle()
+    if not throttle.allow_request(request, None):
+        if idempotent is not None:
+            idempotent.finish(status.HTTP_429_TOO_MANY_REQUESTS, None)
+        return Response({
+            'success': False,
+            'error': 'Too many booking attempts. Please retry later.'
+        }, status=status.HTTP_429_TOO_MANY_REQUESTS, headers={
+            'Retry-After': str(math.ceil(throttle.wait()))
+        })
+
+    response = _book(request)
+    if idempotent is not None:
+        idempotent.finish(response.status_code, response.data)
+    return response
+
+def _book(request):
     try:
+        if settings.INVENTORY_ENGINE:
+            response = _book_from_inventory(request)
+            if response is not None:
+                return response
+
         serializer = BookingCreateSerializer(data=request.data)
         
         if not serializer.is_valid():
@@ -60,31 +166,207 @@ def create_booking(request):
                 'errors': serializer.errors
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Use transaction to prevent race conditions
-        with transaction.atomic():
-            booking = serializer.save()
+        # create() runs the slot update and insert in its own transaction
+        booking = serializer.save()
         
         # Return booking details
-        booking_data = BookingSerializer(booking).data
+        with timed_serialization():
+            booking_data = BookingSerializer(booking).data
         
         return Response({
             'success': True,
             'message': 'Booking created successfully!',
             'data': booking_data
         }, status=status.HTTP_201_CREATED)
+
+    except ValidationError as e:
+        # Raised from create() when the class filled up after validation
+        # or the client already holds a booking for it
+        return Response({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
         
     except Exception as e:
-        logger.error(f"Booking creation error: {str(e)}")
+        logger.exception("Booking creation error: %s", e)
         return Response({
             'success': False,
             'error': 'Failed to create booking. Please try again.'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _book_from_inventory(request):
+    """
+    Book a class that is on sale in the inventory store, without queries.
+    Returns None for other classes (and invalid input, which the regular
+    serializer reports).
+    """
+    item = BulkBookingItemSerializer(data=request.data)
+    if not item.is_valid():
+        return None
+
+    booking = inventory.reserve(
+        item.validated_data['class_id'],
+        item.validated_data['client_name'],
+        item.validated_data['client_email']
+    )
+    if booking is None:
+        return None
+
+    with timed_serialization():
+        booking_data = booking_rows([booking])[0]
+    return Response({
+        'success': True,
+        'message': 'Booking created successfully!',
+        'data': booking_data
+    }, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+def create_bulk_booking(request):
+    """
+    POST /api/book/bulk
+    Books a group of clients in one request.
+
+    Body: {"mode": "atomic" | "best_effort", "bookings": [{class_id, client_name, client_email}, ...]}
+    Returns one result per item in request order
+    """
+    try:
+        serializer = BulkBookingSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        results = []
+        for index, (booking, errors) in enumerate(serializer.save()):
+            if booking is not None:
+                results.append({
+                    'index': index,
+                    'success': True,
+                    'data': BookingSerializer(booking).data
+                })
+            else:
+                results.append({'index': index, 'success': False, 'errors': errors})
+
+        created = sum(1 for result in results if result['success'])
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+
+        return Response({
+            'success': created == len(results),
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }, status=response_status)
+
+    except Exception as e:
+        logger.exception("Bulk booking error: %s", e)
+        return Response({
+            'success': False,
+            'error': 'Failed to create bookings. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+def cancel_user_booking(request, booking_reference):
+    """
+    POST /api/bookings/<booking_reference>/cancel
+    Cancels a booking; the slot goes to the first client on the waitlist,
+    or back to the class if nobody is waiting.
+
+    Body: {"client_email": "..."} matching the booking
+    """
+    try:
+        client_email = request.data.get('client_email')
+        if not client_email:
+            return Response({
+                'success': False,
+                'error': 'client_email is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        booking, promoted = cancel_booking(booking_reference, client_email)
+
+        return Response({
+            'success': True,
+            'message': 'Booking cancelled successfully!',
+            'data': {
+                **BookingSerializer(booking).data,
+                'slot_passed_to_waitlist': promoted is not None
+            }
+        })
+
+    except NotFound as e:
+        return Response({
+            'success': False,
+            'error': str(e.detail)
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        logger.exception("Booking cancellation error: %s", e)
+        return Response({
+            'success': False,
+            'error': 'Failed to cancel booking. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['POST'])
+def join_waitlist(request):
+    """
+    POST /api/waitlist
+    Puts a client in the FIFO waitlist of a fully booked class
+    """
+    try:
+        serializer = WaitlistJoinSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        entry = serializer.save()
+
+        return Response({
+            'success': True,
+            'message': "You're on the waitlist. We'll book you in as soon as a slot frees up.",
+            'data': {
+                'class_id': entry.fitness_class_id,
+                'client_name': entry.client_name,
+                'position': WaitlistEntry.objects.filter(
+                    fitness_class_id=entry.fitness_class_id,
+                    id__lte=entry.id
+                ).count()
+            }
+        }, status=status.HTTP_201_CREATED)
+
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        logger.exception("Waitlist error: %s", e)
+        return Response({
+            'success': False,
+            'error': 'Failed to join the waitlist. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET'])
 def get_user_bookings(request):
     """
     GET /api/bookings?email=user@example.com
-    Returns all bookings for a specific email address
+    Returns a page of the client's active bookings, newest first, from the
+    UserBooking read model (page_size and cursor like /api/classes/)
     """
     try:
         email = request.query_params.get('email')
@@ -95,29 +377,126 @@ def get_user_bookings(request):
                 'error': 'Email parameter is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        bookings = Booking.objects.filter(
-            client_email=email.lower(),
-            is_cancelled=False
-        ).select_related('fitness_class').order_by('-booking_datetime')
+        paginator = UserBookingPagination()
+        rows = paginator.paginate_queryset(
+            UserBooking.objects.filter(client_email=email.lower()).values(*USER_BOOKING_FIELDS),
+            request
+        )
         
-        if not bookings.exists():
+        if not rows and not request.query_params.get('cursor'):
             return Response({
                 'success': True,
                 'message': 'No bookings found for this email',
                 'data': []
             })
         
-        serializer = BookingSerializer(bookings, many=True)
-        
-        return Response({
+        with timed_serialization():
+            data = user_booking_rows(rows)
+
+        response_class = FastJSONResponse if settings.API_FAST_SERIALIZATION else Response
+        return response_class({
             'success': True,
-            'data': serializer.data,
-            'count': len(serializer.data)
+            'data': data,
+            'count': len(data),
+            'next_cursor': paginator.next_cursor
         })
+
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
         
     except Exception as e:
-        logger.error(f"Error fetching user bookings: {str(e)}")
+        logger.exception("Error fetching user bookings: %s", e)
         return Response({
             'success': False,
             'error': 'Failed to fetch bookings'
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+def stream_unavailable(request):
+    """
+    GET /api/classes/stream when API_ASYNC_VIEWS is off: the stream is
+    served by async_views.stream_slots under ASGI
+    """
+    return Response({
+        'success': False,
+        'error': 'Live updates need the ASGI server with API_ASYNC_VIEWS'
+    }, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_data(request, kind):
+    """
+    GET /api/export/<bookings|classes>?output=ndjson|csv
+    Streams every matching row; staff only.
+
+    Query params: date_from, date_to, is_cancelled (bookings) and output
+    """
+    # Staff-only and rare, so not loaded with every worker
+    from .exports import CONTENT_TYPES, EXPORT_FORMATS, export_queryset, iter_export
+
+    try:
+        output_format = request.query_params.get('output', 'ndjson')
+        if output_format not in EXPORT_FORMATS:
+            raise ValidationError({'output': f"Choose one of: {', '.join(EXPORT_FORMATS)}"})
+
+        queryset = export_queryset(kind, request.query_params)
+        response = StreamingHttpResponse(
+            iter_export(kind, queryset, output_format),
+            content_type=CONTENT_TYPES[output_format]
+        )
+        filename = f"{kind}-{timezone.now():%Y%m%d-%H%M%S}.{output_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        logger.exception("Export error: %s", e)
+        return Response({
+            'success': False,
+            'error': 'Failed to export data'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analytics(request):
+    """
+    GET /api/analytics/
+    Occupancy, cancellation rate and booking lead time from the daily
+    rollup (refreshed by `manage.py analytics`); staff only.
+
+    Query params: group_by (date, class_type, instructor, weekday, hour;
+    comma separated), date_from and date_to (studio-local dates)
+    """
+    from .analytics import last_refreshed, occupancy_report
+
+    try:
+        report = occupancy_report(request.query_params)
+        return Response({
+            'success': True,
+            'data': report,
+            'count': len(report),
+            'refreshed_at': last_refreshed()
+        })
+
+    except ValidationError as e:
+        return Response({
+            'success': False,
+            'errors': e.detail
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    except Exception as e:
+        logger.exception("Analytics error: %s", e)
+        return Response({
+            'success': False,
+            'error': 'Failed to build analytics report'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
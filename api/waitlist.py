@@ -0,0 +1,143 @@
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import NotFound, ValidationError
+from . import inventory
+from .cache import bump_schedule_version
+from .events import publish_slots
+from .models import (
+    REFERENCE_ATTEMPTS, FitnessClass, Booking, UserBooking, WaitlistEntry,
+    is_duplicate_booking, is_reference_collision
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def pop_waitlist(fitness_class, locks):
+    """
+    Turn the head of the class's waitlist into a booking, in the caller's
+    transaction. Clients now booked into an overlapping class are skipped.
+    The promoted client's inventory.client_lock() goes on the caller's
+    ExitStack, to be released after the commit.
+    Returns the new booking, or None if nobody is waiting.
+    """
+    while True:
+        entry = WaitlistEntry.objects.filter(
+            fitness_class=fitness_class
+        ).order_by('id').first()
+        if entry is None:
+            return None
+
+        # Claim the entry; if a concurrent cancellation got it first, try the next one
+        claimed, _ = WaitlistEntry.objects.filter(pk=entry.pk).delete()
+        if not claimed:
+            continue
+
+        locks.enter_context(inventory.client_lock(entry.client_email))
+        UserBooking.lock_client(entry.client_email)
+        start, end = fitness_class.scheduled_datetime, fitness_class.end_datetime
+        if UserBooking.overlapping([entry.client_email], start, end).exclude(
+            fitness_class_id=fitness_class.pk
+        ).exists() or (settings.INVENTORY_ENGINE and inventory.held_overlaps(
+            entry.client_email, start, end, exclude=fitness_class.pk
+        )):
+            logger.info("Skipped waitlisted %s for class %s: overlaps another booking",
+                        entry.client_email, fitness_class.pk)
+            continue
+
+        # Classes on sale: hold the client's seat in the store before the
+        # insert commits, so a concurrent reservation cannot book them too
+        held = inventory.hold(fitness_class, entry.client_email) if settings.INVENTORY_ENGINE else None
+        if held is False:
+            logger.info("Skipped waitlisted %s for class %s: already holds a seat",
+                        entry.client_email, fitness_class.pk)
+            continue
+
+        for attempt in range(REFERENCE_ATTEMPTS):
+            booking = Booking(
+                fitness_class=fitness_class,
+                client_name=entry.client_name,
+                client_email=entry.client_email
+            )
+            try:
+                with transaction.atomic():
+                    booking.save(force_insert=True)
+                return booking
+            except IntegrityError as e:
+                # The client already holds an active booking for this class
+                if is_duplicate_booking(e, [(fitness_class.pk, entry.client_email)]):
+                    break
+                # Reference collision: try again with a new one
+                if (not is_reference_collision(e, [booking.booking_reference])
+                        or attempt == REFERENCE_ATTEMPTS - 1):
+                    if held:
+                        inventory.unhold(fitness_class.pk, entry.client_email)
+                    raise
+
+
+def cancel_booking(booking_reference, client_email):
+    """
+    Cancel a booking and hand its slot to the first client on the waitlist,
+    or give it back to the class if nobody is waiting.
+    Returns (booking, promoted booking or None).
+    """
+    try:
+        booking = Booking.objects.select_related('fitness_class').get(
+            booking_reference=booking_reference.upper(),
+            client_email=client_email.lower()
+        )
+    except Booking.DoesNotExist:
+        raise NotFound("Booking not found")
+
+    fitness_class = booking.fitness_class
+    if not fitness_class.is_upcoming:
+        raise ValidationError("Cannot cancel past classes")
+
+    promoted = None
+    try:
+        with ExitStack() as locks, transaction.atomic():
+            cancelled = Booking.objects.filter(
+                pk=booking.pk,
+                is_cancelled=False
+            ).update(is_cancelled=True)
+            if not cancelled:
+                raise ValidationError("This booking is already cancelled")
+            booking.is_cancelled = True
+            UserBooking.objects.filter(booking_id=booking.pk).delete()
+
+            promoted = pop_waitlist(fitness_class, locks)
+            if promoted is None:
+                if FitnessClass.objects.filter(
+                    pk=fitness_class.pk,
+                    available_slots__lt=F('total_slots')
+                ).update(
+                    available_slots=F('available_slots') + 1,
+                    slots_version=F('slots_version') + 1,
+                    updated_at=timezone.now()
+                ):
+                    publish_slots(fitness_class.pk)
+                bump_schedule_version()
+            else:
+                # Slots unchanged, but the class's bookings did (analytics rollup)
+                FitnessClass.objects.filter(pk=fitness_class.pk).update(updated_at=timezone.now())
+    except Exception:
+        # The promotion was rolled back: so is its holder marker
+        if promoted is not None and settings.INVENTORY_ENGINE:
+            inventory.unhold(fitness_class.id, promoted.client_email)
+        raise
+
+    if settings.INVENTORY_ENGINE:
+        if promoted is not None:
+            inventory.transfer(fitness_class, booking.client_email, promoted.client_email)
+        else:
+            inventory.release(fitness_class.id, booking.client_email)
+
+    if promoted is not None:
+        logger.info("Booking %s cancelled, slot passed to waitlisted %s",
+                    booking.booking_reference, promoted.booking_reference)
+    else:
+        logger.info("Booking %s cancelled", booking.booking_reference)
+    return booking, promoted
@@ -0,0 +1,52 @@
+"""
+Standalone benchmarks for the booking API.
+
+Run them from the project root, e.g. ``python -m benchmarks.booking_refs``.
+Each benchmark works on its own throwaway SQLite database and prints a JSON
+report so runs can be compared across commits.
+"""
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(database=None, create_tables=True):
+    """
+    Configure Django with benchmarks.settings against a scratch database and
+    create the tables. Returns the database path.
+    """
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    if database is None:
+        handle, database = tempfile.mkstemp(prefix='booking-bench-', suffix='.sqlite3')
+        os.close(handle)
+    os.environ['BENCH_DATABASE'] = database
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+    import django
+    django.setup()
+
+    if create_tables:
+        from django.core.management import call_command
+        call_command('migrate', run_syncdb=True, verbosity=0)
+    return database
+
+
+def remove_database(database):
+    """Delete a scratch database with its WAL and shared-memory files"""
+    for path in (database, f"{database}-wal", f"{database}-shm", f"{database}-journal"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def report(name, results, output=None):
+    text = json.dumps({'benchmark': name, **results}, indent=2)
+    print(text)
+    if output:
+        Path(output).write_text(text + '\n')
@@ -0,0 +1,79 @@
+"""
+Read endpoint throughput under uvicorn (ASGI, async views) vs gunicorn (WSGI).
+
+    python -m benchmarks.asgi_vs_wsgi --concurrency 500 --duration 20
+
+Needs uvicorn and gunicorn installed (they are not project requirements).
+Seeds a scratch database with populate_db, starts each server in turn on
+that database and drives /api/classes/ and /api/bookings/ with the asyncio
+load generator, reporting requests per second and latency percentiles.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from . import remove_database, report, setup_django
+from .loadgen import HTTPConnection, run_load
+from .server import SERVERS, is_available, running_server
+
+
+def read_requests(emails):
+    def make_request(client, n):
+        if n % 2:
+            email = emails[(client + n) % len(emails)]
+            return 'GET', f"/api/bookings/?email={email}", None, None
+        return 'GET', '/api/classes/?page_size=20', None, None
+    return make_request
+
+
+def bench_server(name, args, database, emails):
+    if not is_available(name):
+        return {'skipped': f"{SERVERS[name]['command'][0]} is not installed"}
+
+    env = {'SCHEDULE_CACHE_TIMEOUT': str(args.cache_timeout)}
+    with running_server(name, database, args.workers, args.threads, env) as port:
+        def connect():
+            return HTTPConnection('127.0.0.1', port)
+
+        # Warm up workers and caches before measuring
+        asyncio.run(run_load(connect, read_requests(emails), 20, requests_per_client=10))
+        return asyncio.run(run_load(
+            connect, read_requests(emails), args.concurrency, duration=args.duration
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--classes', type=int, default=2000)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--cache-timeout', type=int, default=60,
+                        help='SCHEDULE_CACHE_TIMEOUT for the servers, 0 disables the listing cache')
+    parser.add_argument('--servers', nargs='+', choices=list(SERVERS),
+                        default=[name for name in SERVERS if name != 'runserver'])
+    args = parser.parse_args()
+
+    database = setup_django()
+    try:
+        from django.core.management import call_command
+        from api.models import Booking
+        call_command('populate_db', classes=args.classes, bookings=args.bookings,
+                     seed=1, stdout=open(os.devnull, 'w'))
+        emails = list(Booking.objects.values_list('client_email', flat=True).distinct()[:500])
+
+        results = {name: bench_server(name, args, database, emails) for name in args.servers}
+        report('asgi_vs_wsgi', {
+            'python': sys.version.split()[0],
+            'concurrency': args.concurrency,
+            'workers': args.workers,
+            'servers': results,
+        })
+    finally:
+        remove_database(database)
+
+
+if __name__ == '__main__':
+    main()
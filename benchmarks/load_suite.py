@@ -0,0 +1,234 @@
+"""
+Load-test suite for the booking API.
+
+    python -m benchmarks.load_suite --concurrency 100 --duration 10 --output run.json
+
+Seeds a scratch database with populate_db, starts the API in a subprocess and
+drives each scenario with the asyncio load generator:
+
+- classes:    GET /api/classes/ over a mix of filters and page sizes
+- bookings:   GET /api/bookings/ for seeded clients
+- book:       POST /api/book/ for random upcoming classes
+- contention: --racers clients book the last --last-slots slots of one class
+              at the same moment, then the database is checked for overbooking
+
+Every scenario reports RPS, latency percentiles, status codes and queries per
+request (from the Server-Timing header), as JSON that can be diffed between
+commits.
+"""
+import argparse
+import asyncio
+import os
+import re
+import subprocess
+import sys
+from . import BASE_DIR, remove_database, report, setup_django
+from .loadgen import HTTPConnection, percentile, run_load
+from .server import SERVERS, is_available, running_server
+
+QUERIES = re.compile(r'desc="(\d+) queries"')
+
+LISTING_QUERIES = [
+    '/api/classes/',
+    '/api/classes/?page_size=50',
+    '/api/classes/?class_type=yoga',
+    '/api/classes/?has_slots=true&page_size=10',
+    '/api/classes/?instructor=Mike%20Chen',
+]
+
+
+def listing_requests(context):
+    def make_request(client, n):
+        return 'GET', LISTING_QUERIES[(client + n) % len(LISTING_QUERIES)], None, None
+    return make_request
+
+
+def user_booking_requests(context):
+    emails = context['emails']
+
+    def make_request(client, n):
+        return 'GET', f"/api/bookings/?email={emails[(client * 31 + n) % len(emails)]}", None, None
+    return make_request
+
+
+def booking_requests(context):
+    class_ids = context['class_ids']
+
+    def make_request(client, n):
+        return 'POST', '/api/book/', None, {
+            'class_id': class_ids[(client * 17 + n) % len(class_ids)],
+            'client_name': f"Load Client {client}",
+            'client_email': f"load{client}-{n}@example.com",
+        }
+    return make_request
+
+
+SCENARIOS = {
+    'classes': listing_requests,
+    'bookings': user_booking_requests,
+    'book': booking_requests,
+}
+
+
+class QueryCounter:
+    """on_response hook collecting the query count of every response"""
+
+    def __init__(self):
+        self.counts = []
+
+    def __call__(self, client, n, status, headers, body):
+        match = QUERIES.search(headers.get('server-timing', ''))
+        if match:
+            self.counts.append(int(match.group(1)))
+
+    def summary(self):
+        counts = sorted(self.counts)
+        if not counts:
+            return None
+        return {
+            'mean': round(sum(counts) / len(counts), 2),
+            'p50': percentile(counts, 0.50),
+            'max': counts[-1],
+        }
+
+
+def run_scenario(port, make_request, concurrency, duration=None, requests_per_client=None):
+    def connect():
+        return HTTPConnection('127.0.0.1', port)
+
+    queries = QueryCounter()
+    results = asyncio.run(run_load(
+        connect, make_request, concurrency,
+        duration=duration, requests_per_client=requests_per_client, on_response=queries
+    ))
+    results['queries'] = queries.summary()
+    return results
+
+
+def run_contention(port, fitness_class, racers):
+    """Every racer books the same class once, all at the same time"""
+    from api.models import Booking
+
+    def make_request(client, n):
+        return 'POST', '/api/book/', None, {
+            'class_id': fitness_class.id,
+            'client_name': f"Racer {client}",
+            'client_email': f"racer{client}@example.com",
+        }
+
+    results = run_scenario(port, make_request, racers, requests_per_client=1)
+    fitness_class.refresh_from_db()
+    booked = Booking.objects.filter(fitness_class=fitness_class, is_cancelled=False).count()
+    accepted = results['status'].get('201', 0)
+    results.update({
+        'racers': racers,
+        'slots': fitness_class.total_slots,
+        'accepted': accepted,
+        'booked_rows': booked,
+        'available_slots_after': fitness_class.available_slots,
+        # Each of these should be zero
+        'violations': {
+            'overbooked': max(0, booked - fitness_class.total_slots),
+            'slot_counter_drift': abs(
+                fitness_class.total_slots - fitness_class.available_slots - booked
+            ),
+            'unrecorded_acceptances': abs(accepted - booked),
+        },
+    })
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def default_server():
+    for name in ('gunicorn_wsgi', 'uvicorn_sync_views'):
+        if is_available(name):
+            return name
+    return 'runserver'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', choices=list(SERVERS), default=default_server())
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per scenario')
+    parser.add_argument('--classes', type=int, default=2000)
+    parser.add_argument('--bookings', type=int, default=20000)
+    parser.add_argument('--racers', type=int, default=2000)
+    parser.add_argument('--last-slots', type=int, default=10)
+    parser.add_argument('--scenarios', nargs='+', choices=[*SCENARIOS, 'contention'],
+                        default=[*SCENARIOS, 'contention'])
+    parser.add_argument('--throttle', action='store_true',
+                        help='Keep the booking rate limits on (off by default)')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    if not is_available(args.server):
+        parser.error(f"{SERVERS[args.server]['command'][0]} is not installed")
+
+    database = setup_django()
+    try:
+        from django.core.management import call_command
+        from django.utils import timezone
+        from datetime import timedelta
+        from api.models import Booking, FitnessClass
+
+        call_command('populate_db', classes=args.classes, bookings=args.bookings,
+                     seed=1, stdout=open(os.devnull, 'w'))
+        context = {
+            'emails': list(
+                Booking.objects.values_list('client_email', flat=True).distinct()[:1000]
+            ),
+            'class_ids': list(
+                FitnessClass.objects.filter(available_slots__gt=0).values_list('id', flat=True)
+            ),
+        }
+        race_class = FitnessClass.objects.create(
+            name='Contention Class',
+            class_type='hiit',
+            instructor_name='Load Test',
+            scheduled_datetime=timezone.now() + timedelta(days=1),
+            total_slots=args.last_slots,
+            available_slots=args.last_slots
+        )
+
+        results = {}
+        # Every request is measured, so Server-Timing is always present
+        env = {'PERF_SAMPLE_RATE': '1'}
+        if not args.throttle:
+            # All load comes from one IP, the buckets would shed most of it
+            env.update({'BOOKING_THROTTLE_EMAIL': '', 'BOOKING_THROTTLE_IP': ''})
+        with running_server(args.server, database, args.workers, args.threads, env) as port:
+            for name in args.scenarios:
+                if name == 'contention':
+                    results[name] = run_contention(port, race_class, args.racers)
+                else:
+                    results[name] = run_scenario(
+                        port, SCENARIOS[name](context), args.concurrency, duration=args.duration
+                    )
+
+        report('load_suite', {
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'server': args.server,
+            'workers': args.workers,
+            'concurrency': args.concurrency,
+            'dataset': {'classes': args.classes, 'bookings': args.bookings},
+            'scenarios': results,
+        }, output=args.output)
+    finally:
+        remove_database(database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Minimal asyncio HTTP/1.1 load generator.
+
+Each simulated client holds one keep-alive connection and sends requests
+back to back for the duration of the run. Only what the booking API
+responses need is implemented: Content-Length bodies, no chunked encoding.
+"""
+import asyncio
+import json
+import time
+
+
+class HTTPConnection:
+    """One keep-alive connection to a running server"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=None):
+        """Send a request, returns (status, headers, body bytes)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        payload = b'' if body is None else json.dumps(body).encode()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        if body is not None:
+            lines += ['Content-Type: application/json', f"Content-Length: {len(payload)}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + payload)
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        response_headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+        content = await self.reader.readexactly(int(response_headers.get('content-length', 0)))
+
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return int(status_line.split()[1]), response_headers, content
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        self.reader = self.writer = None
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, errors, elapsed):
+    """Turn raw samples into the JSON report fields"""
+    latencies = sorted(latencies)
+
+    def to_ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    counts = {}
+    for code in statuses:
+        counts[str(code)] = counts.get(str(code), 0) + 1
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 2),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'latency_ms': {
+            'p50': to_ms(percentile(latencies, 0.50)),
+            'p90': to_ms(percentile(latencies, 0.90)),
+            'p99': to_ms(percentile(latencies, 0.99)),
+            'max': to_ms(latencies[-1] if latencies else None),
+        },
+        'status': counts,
+    }
+
+
+async def run_load(connect, make_request, concurrency, duration=None, requests_per_client=None,
+                   on_response=None):
+    """
+    Drive `concurrency` clients. `connect()` returns a connection object with
+    an async request() method; `make_request(client, n)` returns
+    (method, path, headers, body) for the client's n-th request. Runs for
+    `duration` seconds or `requests_per_client` requests, whichever is given.
+    `on_response(client, n, status, headers, body)` sees every response.
+    """
+    latencies, statuses = [], []
+    errors = 0
+    deadline = None if duration is None else time.perf_counter() + duration
+
+    async def client(client_id):
+        nonlocal errors
+        connection = connect()
+        n = 0
+        try:
+            while True:
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                if requests_per_client is not None and n >= requests_per_client:
+                    break
+                method, path, headers, body = make_request(client_id, n)
+                started = time.perf_counter()
+                try:
+                    status, response_headers, content = await connection.request(
+                        method, path, headers, body
+                    )
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    errors += 1
+                    await connection.close()
+                    n += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                statuses.append(status)
+                if on_response is not None:
+                    on_response(client_id, n, status, response_headers, content)
+                n += 1
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return summarize(latencies, statuses, errors, time.perf_counter() - started)
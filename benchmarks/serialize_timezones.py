@@ -0,0 +1,101 @@
+"""
+Serialization cost of the class listing in several timezones.
+
+    python -m benchmarks.serialize_timezones --rows 10000
+
+Serializes in-memory FitnessClass rows with the X-Timezone header set to each
+zone. When pytz is installed, the previous per-row pytz lookup is timed too.
+"""
+import argparse
+import logging
+import time
+from datetime import timedelta
+from . import remove_database, report, setup_django
+
+ZONES = ['Asia/Kolkata', 'America/New_York', 'Europe/London', 'UTC', 'Mars/Olympus_Mons']
+
+
+def build_classes(rows):
+    from django.utils import timezone
+    from api.models import FitnessClass
+
+    start = timezone.now()
+    return [
+        FitnessClass(
+            id=i + 1,
+            name=f"Class {i}",
+            class_type='yoga',
+            instructor_name='Benchmark',
+            scheduled_datetime=start + timedelta(minutes=30 * i),
+            total_slots=20,
+            available_slots=10
+        )
+        for i in range(rows)
+    ]
+
+
+def legacy_local_datetime(obj, name):
+    """What get_scheduled_datetime_local did per row before"""
+    import pytz
+    try:
+        return obj.scheduled_datetime.astimezone(pytz.timezone(name)).isoformat()
+    except pytz.exceptions.UnknownTimeZoneError:
+        logging.getLogger('api.models').warning(f"Unknown timezone: {name}, returning IST")
+        return obj.scheduled_datetime.isoformat()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    database = setup_django(create_tables=False)
+    remove_database(database)
+    # Keep the warning path honest without flooding the terminal
+    logging.disable(logging.CRITICAL)
+
+    from rest_framework.test import APIRequestFactory
+    from api.serializers import FitnessClassSerializer
+    from api.timezones import resolve_timezone
+
+    classes = build_classes(args.rows)
+    factory = APIRequestFactory()
+    try:
+        import pytz  # noqa: F401
+        has_pytz = True
+    except ImportError:
+        has_pytz = False
+
+    results = {}
+    for zone in ZONES:
+        request = factory.get('/api/classes/', HTTP_X_TIMEZONE=zone)
+        timings = []
+        for _ in range(args.repeat):
+            resolve_timezone.cache_clear()
+            started = time.perf_counter()
+            FitnessClassSerializer(classes, many=True, context={'request': request}).data
+            timings.append(time.perf_counter() - started)
+        results[zone] = {'serializer_seconds': round(min(timings), 4)}
+
+        if has_pytz:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                for obj in classes:
+                    legacy_local_datetime(obj, zone)
+                timings.append(time.perf_counter() - started)
+            results[zone]['legacy_conversion_seconds'] = round(min(timings), 4)
+
+            started = time.perf_counter()
+            tz = resolve_timezone(zone)
+            for obj in classes:
+                local = obj.scheduled_datetime.astimezone(tz) if tz else obj.scheduled_datetime
+                local.isoformat()
+            results[zone]['conversion_seconds'] = round(time.perf_counter() - started, 4)
+
+    report('serialize_timezones', {'rows': args.rows, 'zones': results})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Start the booking API in a subprocess against a benchmark database.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from . import BASE_DIR
+
+SERVERS = {
+    'uvicorn_async_views': {
+        'command': ['uvicorn', 'booking_app.asgi:application', '--no-access-log',
+                    '--workers', '{workers}', '--port', '{port}'],
+        'env': {'API_ASYNC_VIEWS': 'True'},
+    },
+    'uvicorn_sync_views': {
+        'command': ['uvicorn', 'booking_app.asgi:application', '--no-access-log',
+                    '--workers', '{workers}', '--port', '{port}'],
+        'env': {'API_ASYNC_VIEWS': 'False'},
+    },
+    'gunicorn_wsgi': {
+        'command': ['gunicorn', 'booking_app.wsgi:application', '--workers', '{workers}',
+                    '--threads', '{threads}', '--bind', '127.0.0.1:{port}'],
+        'env': {'API_ASYNC_VIEWS': 'False'},
+    },
+    # Always available, single process, one thread per connection
+    'runserver': {
+        'command': [sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:{port}'],
+        'env': {'API_ASYNC_VIEWS': 'False'},
+    },
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def is_available(name):
+    return shutil.which(SERVERS[name]['command'][0]) is not None
+
+
+@contextmanager
+def running_server(name, database, workers=1, threads=8, env=None):
+    """Run server `name` on `database` until the block exits, yields its port"""
+    server = SERVERS[name]
+    port = free_port()
+    command = [
+        part.format(port=port, workers=workers, threads=threads)
+        for part in server['command']
+    ]
+    process = subprocess.Popen(
+        command,
+        cwd=BASE_DIR,
+        env={
+            **os.environ,
+            **server['env'],
+            **(env or {}),
+            'DJANGO_SETTINGS_MODULE': 'benchmarks.settings',
+            'BENCH_DATABASE': database,
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_port(port)
+        yield port
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
@@ -0,0 +1,24 @@
+"""
+Settings for benchmark runs: the project settings on a scratch database
+(BENCH_DATABASE) with DEBUG off, so query logging doesn't skew timings.
+The log goes to the temp directory unless LOG_FILE is set.
+"""
+import os
+import tempfile
+from decouple import config
+from booking_app.settings import *  # noqa: F401,F403
+from booking_app.settings import DATABASES, LOGGING
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+
+DATABASES = {
+    **DATABASES,
+    'default': {**DATABASES['default'], 'NAME': os.environ['BENCH_DATABASE']},
+}
+
+LOG_FILE = config('LOG_FILE', default=os.path.join(tempfile.gettempdir(), 'booking_api_bench.log'))
+LOGGING = {
+    **LOGGING,
+    'handlers': {'queue': {**LOGGING['handlers']['queue'], 'filename': LOG_FILE}},
+}
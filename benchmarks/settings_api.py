@@ -0,0 +1,5 @@
+"""
+benchmarks.settings on the API-only profile (booking_app.settings_api).
+"""
+from booking_app.settings_api import *  # noqa: F401,F403
+from benchmarks.settings import ALLOWED_HOSTS, DATABASES, DEBUG, LOG_FILE, LOGGING  # noqa: F401
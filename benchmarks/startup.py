@@ -0,0 +1,192 @@
+"""
+Cold start of a worker: import time and time to first request.
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+
+Every run is a fresh interpreter started with ``-X importtime`` that imports
+booking_app.wsgi or booking_app.asgi and serves one GET /api/classes/ in
+process, under the full settings and the API-only profile
+(booking_app.settings_api). Reports the medians of the entrypoint's import
+time, the first request (URLconf, views and the first query included) and
+the wall time from spawning the process to the first response, the modules
+loaded, and where the import time goes, per package.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from . import BASE_DIR, remove_database, report, setup_django
+
+PROFILES = {
+    'full': 'benchmarks.settings',
+    'api': 'benchmarks.settings_api',
+}
+ENTRYPOINTS = {
+    'wsgi': {'module': 'booking_app.wsgi', 'env': {'API_ASYNC_VIEWS': 'False'}},
+    'asgi': {'module': 'booking_app.asgi', 'env': {'API_ASYNC_VIEWS': 'True'}},
+}
+PATH = '/api/classes/'
+
+# Run in the child: the first line of stdout is the report, written as soon
+# as the response is complete
+CHILD = '''
+import sys, time
+started = time.perf_counter()
+import {module} as entrypoint
+imported = time.perf_counter()
+status = []
+if '{entrypoint}' == 'wsgi':
+    from wsgiref.util import setup_testing_defaults
+    environ = {{'PATH_INFO': '{path}', 'HTTP_HOST': 'localhost'}}
+    setup_testing_defaults(environ)
+    response = entrypoint.application(environ, lambda code, headers, exc_info=None: status.append(code))
+    b''.join(response)
+    response.close()
+else:
+    import asyncio
+
+    async def first_request():
+        scope = {{
+            'type': 'http', 'asgi': {{'version': '3.0'}}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': '{path}', 'raw_path': b'{path}',
+            'query_string': b'', 'root_path': '', 'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }}
+        body = [{{'type': 'http.request', 'body': b'', 'more_body': False}}]
+
+        async def receive():
+            if body:
+                return body.pop()
+            await asyncio.Future()  # never disconnects
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(str(message['status']))
+
+        await entrypoint.application(scope, receive, send)
+
+    asyncio.run(first_request())
+done = time.perf_counter()
+print(status[0].split()[0], (imported - started) * 1000, (done - imported) * 1000, len(sys.modules), flush=True)
+'''
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+\d+ \| \s*(\S+)$')
+
+
+def parse_importtime(text):
+    """(module, self time in µs) per line of -X importtime output"""
+    entries = []
+    for line in text.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, module = match.groups()
+            entries.append((module, int(own)))
+    return entries
+
+
+def package_of(module):
+    """Group key: the app for django.contrib, else the top two name components"""
+    parts = module.split('.')
+    return '.'.join(parts[:3] if parts[:2] == ['django', 'contrib'] else parts[:2])
+
+
+def run_once(entrypoint, settings_module, database):
+    spec = ENTRYPOINTS[entrypoint]
+    code = CHILD.format(module=spec['module'], entrypoint=entrypoint, path=PATH)
+    spawned = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=BASE_DIR,
+        env={
+            **os.environ,
+            **spec['env'],
+            'DJANGO_SETTINGS_MODULE': settings_module,
+            'BENCH_DATABASE': database,
+        },
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    line = process.stdout.readline()
+    first_response = time.perf_counter()
+    _, stderr = process.communicate()
+    if process.returncode or not line:
+        raise RuntimeError(f"{entrypoint} with {settings_module} failed:\n{stderr[-2000:]}")
+
+    status, import_ms, request_ms, modules = line.split()
+    imports = parse_importtime(stderr)
+    return {
+        'status': int(status),
+        'import_ms': float(import_ms),
+        'first_request_ms': float(request_ms),
+        'time_to_first_request_ms': (first_response - spawned) * 1000,
+        'modules': int(modules),
+        'imports': imports,
+    }
+
+
+def bench(entrypoint, settings_module, database, runs, top):
+    run_once(entrypoint, settings_module, database)  # warm the OS file cache
+    results = [run_once(entrypoint, settings_module, database) for _ in range(runs)]
+
+    # Median per package over the runs, a single run is noisy
+    per_run = []
+    for result in results:
+        packages = Counter()
+        for module, own in result['imports']:
+            packages[package_of(module)] += own
+        per_run.append(packages)
+    by_package = Counter({
+        package: statistics.median(packages[package] for packages in per_run)
+        for package in set().union(*per_run)
+    })
+    return {
+        'status': results[0]['status'],
+        **{
+            key: round(statistics.median(result[key] for result in results), 1)
+            for key in ('import_ms', 'first_request_ms', 'time_to_first_request_ms')
+        },
+        'modules': results[0]['modules'],
+        'import_ms_by_package': {
+            package: round(own / 1000, 1) for package, own in by_package.most_common(top)
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--classes', type=int, default=50)
+    parser.add_argument('--top', type=int, default=15, help='Packages listed in the import time breakdown')
+    parser.add_argument('--entrypoints', nargs='+', choices=list(ENTRYPOINTS), default=list(ENTRYPOINTS))
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    database = setup_django()
+    try:
+        from django.core.management import call_command
+        call_command('populate_db', classes=args.classes, bookings=args.classes,
+                     seed=1, stdout=open(os.devnull, 'w'))
+
+        results = {
+            f"{entrypoint}/{profile}": bench(entrypoint, PROFILES[profile], database, args.runs, args.top)
+            for entrypoint in args.entrypoints
+            for profile in args.profiles
+        }
+        report('startup', {
+            'python': sys.version.split()[0],
+            'runs': args.runs,
+            'path': PATH,
+            'results': results,
+        }, args.output)
+    finally:
+        remove_database(database)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,9 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
-from decouple import config
-import pytz
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +45,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so every log record of the request carries its ID
+    'api.log.RequestIDMiddleware',
+    # Early, so its timings cover the rest of the stack
+    'api.instrumentation.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,13 +81,119 @@ WSGI_APPLICATION = 'booking_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE=postgres for production, sqlite (default) for local runs and tests
+
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='booking'),
+            'USER': config('DB_USER', default='booking'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            # Persistent connections, checked before reuse
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+            },
+            # Server-side cursors (QuerySet.iterator) don't survive pgbouncer
+            # transaction pooling
+            'DISABLE_SERVER_SIDE_CURSORS': config('DB_PGBOUNCER', default=False, cast=bool),
+        }
+    }
+    if config('DB_POOL', default=False, cast=bool):
+        # psycopg 3 connection pool (pip install "psycopg[pool]"); Django
+        # requires persistent connections to be off when pooling
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=20, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # WAL lets readers run alongside the single writer and
+                # synchronous=NORMAL is safe with WAL while fsyncing less
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA cache_size=-20000'
+                ),
+                # Seconds a writer waits on the lock instead of failing with
+                # "database is locked"
+                'timeout': config('DB_BUSY_TIMEOUT', default=20, cast=int),
+                # Atomic blocks (the booking path) take the write lock at BEGIN,
+                # so they queue on busy_timeout instead of failing mid-transaction
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # A file rather than :memory: so tests run on WAL with real
+            # concurrent connections, like production
+            'TEST': {
+                'NAME': config('DB_TEST_NAME', default=str(BASE_DIR / 'test_db.sqlite3')),
+            },
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'locmem' is per process; 'file' is a local stand-in for a shared backend
+# (all workers on a host see the same entries); 'redis' needs CACHE_LOCATION
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHE_LOCATION = config(
+    'CACHE_LOCATION',
+    default=str(BASE_DIR / '.cache') if CACHE_BACKEND == 'file' else ''
+)
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': CACHE_LOCATION,
     }
 }
 
+# Flash-sale seat counters (api/inventory.py) need atomic incr/add and must
+# never be evicted: a locmem cache of their own, or the Redis server
+CACHES['inventory'] = {
+    'BACKEND': CACHE_BACKENDS['redis' if CACHE_BACKEND == 'redis' else 'locmem'],
+    'LOCATION': CACHE_LOCATION if CACHE_BACKEND == 'redis' else 'inventory',
+    'OPTIONS': {} if CACHE_BACKEND == 'redis' else {'MAX_ENTRIES': 1_000_000},
+}
+
+SCHEDULE_CACHE_ALIAS = 'default'
+# Upcoming classes drop off the listing as they start, so entries also expire
+SCHEDULE_CACHE_TIMEOUT = config('SCHEDULE_CACHE_TIMEOUT', default=60, cast=int)
+
+
+# Booking references are unique by construction per node id (0-1023). Every
+# process leases its own in BOOKING_REF_CACHE_ALIAS, trying from
+# BOOKING_REF_NODE_ID (random when unset) plus its pid; the inventory cache
+# never evicts, and with CACHE_BACKEND=redis it is shared by all hosts
+BOOKING_REF_NODE_ID = config(
+    'BOOKING_REF_NODE_ID',
+    default=None,
+    cast=lambda value: None if value is None else int(value)
+)
+BOOKING_REF_CACHE_ALIAS = 'inventory'
+BOOKING_REF_LEASE_TIMEOUT = 3600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,26 +238,87 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20
 }
 
+# Build list responses from .values() rows instead of DRF serializers
+# (installs with orjson use it as the encoder)
+API_FAST_SERIALIZATION = config('API_FAST_SERIALIZATION', default=False, cast=bool)
+
+# Serve /api/classes/ and /api/bookings/ with native async views; turn on
+# when running under ASGI (uvicorn etc.), writes stay sync either way
+API_ASYNC_VIEWS = config('API_ASYNC_VIEWS', default=False, cast=bool)
+
+# POST /api/book/ token buckets, DRF rate format ('10/min' = burst of 10,
+# refilled at 10 per minute); empty disables a bucket
+BOOKING_THROTTLE_RATES = {
+    'email': config('BOOKING_THROTTLE_EMAIL', default='10/min'),
+    'ip': config('BOOKING_THROTTLE_IP', default='300/min'),
+}
+
+# Idempotency-Key results are kept for a day; a claim by a request that
+# never finishes (worker killed) is released after the lock timeout
+IDEMPOTENCY_CACHE_ALIAS = 'default'
+IDEMPOTENCY_TTL = config('IDEMPOTENCY_TTL', default=86400, cast=int)
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+# Flash-sale inventory engine: classes put on sale with `manage.py inventory
+# open` are booked from an in-memory seat counter and persisted in batches
+# every INVENTORY_FLUSH_INTERVAL seconds (0: only on explicit flush)
+INVENTORY_ENGINE = config('INVENTORY_ENGINE', default=False, cast=bool)
+INVENTORY_CACHE_ALIAS = 'inventory'
+INVENTORY_FLUSH_INTERVAL = config('INVENTORY_FLUSH_INTERVAL', default=0.05, cast=float)
+INVENTORY_BATCH_SIZE = 500
+# Reservations are acknowledged before they are written, so the store must
+# be Redis; locmem dies with its process and is only for a single-process
+# development server
+INVENTORY_ALLOW_LOCAL_STORE = config('INVENTORY_ALLOW_LOCAL_STORE', default=False, cast=bool)
+
+# Recurring class series: `manage.py materialize_series` stores occurrences
+# this many days ahead; the listing expands later ones on the fly, at most
+# SERIES_LISTING_HORIZON_DAYS out when no date_to is given
+SERIES_MATERIALIZE_DAYS = config('SERIES_MATERIALIZE_DAYS', default=14, cast=int)
+SERIES_LISTING_HORIZON_DAYS = 365
+
+# Live slot stream (/api/classes/stream/): api.events.LocalBroker fans out
+# within one process, api.events.RedisBroker across processes
+EVENTS_BROKER = config('EVENTS_BROKER', default='api.events.LocalBroker')
+EVENTS_REDIS_URL = config('EVENTS_REDIS_URL', default='redis://127.0.0.1:6379/2')
+EVENTS_KEEPALIVE = 15
+EVENTS_QUEUE_SIZE = 100
+EVENTS_MAX_CLASSES = 100
+
+# Performance instrumentation: fraction of requests timed (Server-Timing
+# header + histograms at /api/metrics/), 0 turns it off
+PERF_SAMPLE_RATE = config('PERF_SAMPLE_RATE', default=1.0, cast=float)
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+
 # Logging config
+# JSON lines with request IDs, written by a background thread (api/log.py)
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+# Outside the checkout by default, so tests and local runs don't write into
+# it; deployments set LOG_FILE
+LOG_FILE = config('LOG_FILE', default=str(Path(tempfile.gettempdir()) / 'booking_api.log'))
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': 'booking_api.log',
-        },
-        'console': {
-            'level': 'INFO',
-            'class': 'logging.StreamHandler',
+        'queue': {
+            '()': 'api.log.QueuedJSONHandler',
+            'filename': LOG_FILE,
+            'max_bytes': config('LOG_MAX_BYTES', default=10 * 1024 * 1024, cast=int),
+            'backup_count': config('LOG_BACKUP_COUNT', default=5, cast=int),
+            'console': config('LOG_CONSOLE', default=False, cast=bool),
         },
     },
     'loggers': {
-        'booking': {
-            'handlers': ['file', 'console'],
-            'level': 'INFO',
-            'propagate': True,
+        'api': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        # Unhandled errors and 4xx/5xx responses, with the same request IDs
+        'django.request': {
+            'handlers': ['queue'],
+            'level': 'WARNING',
+            'propagate': False,
         },
     },
 }
@@ -0,0 +1,42 @@
+"""
+API-only settings: the project settings without the admin, sessions,
+messages, static files and template stacks, none of which the JSON API uses.
+
+Loads fewer apps, middleware and modules, so workers and management commands
+start faster (`python -m benchmarks.startup` compares both profiles):
+
+    DJANGO_SETTINGS_MODULE=booking_app.settings_api gunicorn booking_app.wsgi:application
+
+Staff endpoints (export, analytics) authenticate with HTTP Basic auth here,
+as there is no login session; the admin site needs booking_app.settings.
+"""
+from booking_app.settings import *  # noqa: F401,F403
+from booking_app.settings import REST_FRAMEWORK
+
+# auth and contenttypes stay for staff users and DRF's AnonymousUser
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+    'api'
+]
+
+MIDDLEWARE = [
+    'api.log.RequestIDMiddleware',
+    'api.instrumentation.PerformanceMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+# booking_app/urls.py leaves out admin/ when the admin isn't installed
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+# Responses are English only; skips loading the translation catalogs
+USE_I18N = False